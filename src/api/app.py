@@ -1,50 +1,67 @@
 import gradio as gr
-import tiktoken
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
 from langchain_community.chat_message_histories import SQLChatMessageHistory
+from sqlalchemy import create_engine
+import asyncio
+import logging
 
+from src.api.components import load_retriever
 from src.utils.chain_builder import ChainBuilder
 from src.utils.strainer import FilterRetrievedDocuments
+from src.utils.registry import get_entity_registry
+from src.utils.embedding_cache import CachedEmbeddings
+from src.utils.context_budget import ContextBudget, MAX_TOKENS, get_encoder
+from src.utils.answer_cache import AnswerCache
+from src.utils.providers import get_chat_model, get_embeddings
+from src.utils.tracing import Tracer, start_metrics_server
+from src.utils.config import CONCURRENCY_LIMIT, CHAT_HISTORY_DB, ANSWER_CACHE_DB, ANSWER_CACHE_TTL, ANSWER_CACHE_SIZE, ANSWER_CACHE_SIMILARITY, METRICS_PORT
 
 
 # --- Initialize Components ---
 
 # LLM and Vector Store
-## Langchain automatically finds the os-wide env var for OpenAI API key
-llm_obj = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-vector_store = FAISS.load_local(
-    "./vectorstore_faiss",
-    embeddings=OpenAIEmbeddings(),
-    allow_dangerous_deserialization=True
-)
+## Providers come from RAG_LLM_PROVIDER / RAG_EMBEDDING_PROVIDER (OpenAI by default, reading the os-wide API key)
+llm_obj = get_chat_model()
+embeddings = CachedEmbeddings(get_embeddings())  # repeated questions skip the embedding model
+# Serving vectorstore plus the metadata, BM25, timeline and change indexes saved with it at ingest
+vector_store, filtered_retriever = load_retriever(embeddings, "./vectorstore_faiss")
+# Load the hero/item/ability mappers once at startup (shared by every strainer)
+get_entity_registry()
 
-# Persistent Chat History
-chat_message_history = SQLChatMessageHistory(
-    session_id="single-user", connection_string="sqlite:///chat_history.db"
-)
+# Persistent Chat History (one history per Gradio session, sharing one engine)
+chat_history_engine = create_engine(CHAT_HISTORY_DB)
 
+def get_session_history(session_id):
+    return SQLChatMessageHistory(session_id=session_id, connection=chat_history_engine)
 
-# --- Context Truncator ---
 
-MAX_TOKENS = 120000  # Leave buffer under OpenAI's 128k limit
-def truncate_context(context, max_tokens=MAX_TOKENS):
-    """
-    Truncates the context to fit within the max token limit.
-    """
-    # Initialize tiktoken tokenizer for GPT-4
-    tokenizer = tiktoken.encoding_for_model("gpt-4")
+# --- Context Budget ---
+
+# Loads the tokenizer once; documents are packed by relevance using their ingest-time token counts
+context_budget = ContextBudget(max_tokens=MAX_TOKENS)
+get_encoder(context_budget.model)
 
-    # Tokenize the context
-    tokens = tokenizer.encode(context)
 
-    # Truncate older parts if limit exceeds
-    if len(tokens) > max_tokens:
-        tokens = tokens[-max_tokens:]
+# --- Answer Cache ---
 
-    # Decode back to string
-    truncated_context = tokenizer.decode(tokens)
-    return truncated_context
+# Repeated questions (same filters, same or near-identical wording) are answered without retrieval or an LLM call.
+# Entries are dropped automatically when vectorstore_faiss is rebuilt.
+answer_cache = AnswerCache(
+    db_path=ANSWER_CACHE_DB,
+    vectorstore_path="./vectorstore_faiss",
+    ttl_seconds=ANSWER_CACHE_TTL,
+    max_entries=ANSWER_CACHE_SIZE,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY
+)
+
+
+# --- Tracing ---
+
+# Per-stage latency of every request: Prometheus histograms (RAG_METRICS_PORT) and an optional JSONL file (RAG_TRACE_FILE).
+# Filters and retrieved documents are logged for a sample of requests only (RAG_DEBUG_SAMPLE_RATE), tagged with the trace ID.
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+tracer = Tracer()
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT)
 
 
 # --- RAG Chain Builder ---
@@ -55,14 +72,17 @@ def build_chain(user_query, chat_history):
     """
     # Apply filters
     strainer_obj = FilterRetrievedDocuments(user_query)
-    print(f"Filters: {strainer_obj.dynamic_filter()}")
     # Build RAG chain
     chain_builder = ChainBuilder(
         llm_obj=llm_obj,
         strainer_obj=strainer_obj,
         query=user_query,
         chat_history=chat_history,
-        vector_store=vector_store
+        vector_store=vector_store,
+        retriever=filtered_retriever,
+        context_budget=context_budget,
+        answer_cache=answer_cache,
+        tracer=tracer
     )
 
     # Build the RAG chain and invoke results
@@ -73,11 +93,17 @@ def build_chain(user_query, chat_history):
 
 # --- Chat Function ---
 
-def chat_with_rag(user_query, chat_history):
+async def chat_with_rag(user_query, chat_history, request: gr.Request = None):
     """
     Handles user query and interacts with the RAG pipeline.
+    Runs on the event loop, so concurrent chats don't block each other,
+    and streams partial answers to the chat UI.
     """
     try:
+        # Each browser session gets its own persistent history
+        session_id = request.session_hash if request and request.session_hash else "single-user"
+        chat_message_history = await asyncio.to_thread(get_session_history, session_id)
+
         # # Append user's query to the persistent chat history
         # chat_message_history.add_user_message(user_query)
 
@@ -85,7 +111,7 @@ def chat_with_rag(user_query, chat_history):
         # chat_history = chat_message_history.messages
 
         # --- CLEAR CHAT HISTORY BEFORE PROCESSING --- #
-        chat_message_history.clear()  # Clear persistent chat history
+        await asyncio.to_thread(chat_message_history.clear)  # Clear persistent chat history
 
         # Retrieve fresh history (empty now since we just cleared it)
         chat_history = []
@@ -102,28 +128,31 @@ def chat_with_rag(user_query, chat_history):
 
         # --- BUILD RAG CHAIN ---
         strainer_obj = FilterRetrievedDocuments(user_query, previous_query)
-        print(f"Filters: {strainer_obj.dynamic_filter()}")
 
         chain_builder = ChainBuilder(
             llm_obj=llm_obj,
             strainer_obj=strainer_obj,
             query=user_query,
             chat_history=chat_history,
-            vector_store=vector_store
+            vector_store=vector_store,
+            retriever=filtered_retriever,
+            context_budget=context_budget,
+            answer_cache=answer_cache,
+            tracer=tracer
         )
 
-        # --- GET RESULTS ---
-        invoked_results = chain_builder.invoke()
-        print(invoked_results)
-        answer = invoked_results["text"]
+        # --- STREAM RESULTS ---
+        # Yield the growing answer so the UI renders tokens as they arrive
+        answer = ""
+        async for token in chain_builder.astream():
+            answer += token
+            yield answer
 
         # Append AI's response to the persistent chat history
-        chat_message_history.add_ai_message(answer)
-
-        return answer
+        await asyncio.to_thread(chat_message_history.add_ai_message, answer)
 
     except Exception as e:
-        return f"Error: {str(e)}"
+        yield f"Error: {str(e)}"
 
 
 # --- Gradio Chat UI ---
@@ -132,6 +161,7 @@ chat_interface = gr.ChatInterface(
     fn=chat_with_rag,  # Function to handle the chat
     title="🌠 Dota 2 Patch Notes Assistant",
     description="🚀Ask me about the latest Dota 2 patch notes, hero updates, and changes!",
+    concurrency_limit=CONCURRENCY_LIMIT,  # Simultaneous chats served by this process
 )
 
 # Launch Gradio app
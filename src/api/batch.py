@@ -0,0 +1,208 @@
+# Batch question answering: answers a JSONL file of questions with the app's retrieval pipeline and prompt
+# Usage: python -m src.api.batch questions.jsonl answers.jsonl [--batch-size 256] [--llm-concurrency 8]
+# Input: one question per line, {"id": ..., "query": "...", "previous_query": "..."} (id and previous_query
+# optional) or a bare JSON string. Output: one result per line, in input order, with per-stage timings in ms.
+from collections import defaultdict
+import argparse
+import asyncio
+import json
+import time
+
+from src.api.components import load_retriever, VECTORSTORE_PATH
+from src.utils.answer_cache import filters_key
+from src.utils.chain_builder import ChainBuilder
+from src.utils.context_budget import ContextBudget, MAX_TOKENS
+from src.utils.embedding_cache import CachedEmbeddings
+from src.utils.providers import get_chat_model, get_embeddings
+from src.utils.registry import get_entity_registry
+from src.utils.strainer import FilterRetrievedDocuments
+from src.utils.config import BATCH_SIZE, BATCH_LLM_CONCURRENCY
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1e3, 3)
+
+def read_questions(path):
+    """
+    Reads the input JSONL; a line without an id gets its line number.
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item = {"query": item} if isinstance(item, str) else item
+            questions.append({"id": item.get("id", line_number), "query": item["query"], "previous_query": item.get("previous_query")})
+    return questions
+
+def retrieve_batch(questions, llm_obj, retriever, context_budget):
+    """
+    Filters, retrieval and context assembly for one batch. Questions answered
+    from metadata (change table, timeline, fully filtered) are served one by one;
+    the others are embedded in a single call and searched with one FAISS call
+    per distinct filter set.
+    Returns:
+        list: One dict per question (id, query, builder, filters, context, error, timings).
+    """
+    items = []
+    for question in questions:
+        builder = ChainBuilder(
+            llm_obj=llm_obj,
+            strainer_obj=FilterRetrievedDocuments(question["query"], question.get("previous_query")),
+            query=question["query"],
+            chat_history=[],
+            vector_store=retriever.vector_store,
+            retriever=retriever,
+            context_budget=context_budget
+        )
+        item = {"id": question["id"], "query": question["query"], "builder": builder, "docs": None, "error": None, "timings": {}}
+        try:
+            started = time.perf_counter()
+            item["filter_criteria"], timeline, aggregate, item["filters"] = builder.extract_filters()
+            item["timings"]["filter_extraction"] = elapsed_ms(started)
+            started = time.perf_counter()
+            item["docs"] = builder.retrieve_from_metadata(item["filter_criteria"], timeline, aggregate)
+            item["timings"]["metadata_retrieval"] = elapsed_ms(started)
+        except Exception as e:
+            item["error"] = f"Error: {str(e)}"
+        items.append(item)
+
+    # Everything else goes through vector search: one embedding call, then one FAISS call per filter set
+    pending = [item for item in items if item["docs"] is None and item["error"] is None]
+    if pending:
+        try:
+            started = time.perf_counter()
+            vectors = retriever.embed_queries([item["query"] for item in pending])
+            embedding_ms = elapsed_ms(started)
+        except Exception as e:
+            vectors = None
+            for item in pending:
+                item["error"] = f"Error: {str(e)}"
+        groups = defaultdict(list)
+        for position, item in enumerate(pending):
+            groups[filters_key(item["filter_criteria"])].append(position)
+        for positions in groups.values() if vectors is not None else []:
+            group = [pending[position] for position in positions]
+            try:
+                started = time.perf_counter()
+                results = retriever.search_batch([item["query"] for item in group], vectors[positions], group[0]["filter_criteria"])
+                search_ms = elapsed_ms(started)
+                for item, docs in zip(group, results):
+                    item["docs"] = docs
+                    # Shared by every question of the embedding batch / filter group
+                    item["timings"].update(embedding_batch=embedding_ms, vector_search_group=search_ms, group_size=len(group))
+            except Exception as e:
+                for item in group:
+                    item["error"] = f"Error: {str(e)}"
+
+    for item in items:
+        if item["error"] is None:
+            started = time.perf_counter()
+            item["context"] = context_budget.build_context(item["docs"])
+            item["timings"]["context_assembly"] = elapsed_ms(started)
+    return items
+
+async def generate(item, semaphore):
+    # One LLM call through the bounded pool; the wait for a free slot is timed separately
+    queued = time.perf_counter()
+    async with semaphore:
+        item["timings"]["llm_wait"] = elapsed_ms(queued)
+        started = time.perf_counter()
+        result = await item["builder"].build_rag_chain().ainvoke({
+            "context": item["context"],
+            "question": item["query"],
+            "chat_history": []
+        })
+        item["timings"]["llm"] = elapsed_ms(started)
+    return result["text"]
+
+async def answer(item, semaphore, batch_started):
+    answer_text = None
+    if item["error"] is None:
+        try:
+            answer_text = await generate(item, semaphore)
+        except Exception as e:
+            item["error"] = f"Error: {str(e)}"
+    item["timings"]["total"] = elapsed_ms(batch_started)
+    return {
+        "id": item["id"],
+        "query": item["query"],
+        "answer": answer_text,
+        "error": item["error"],
+        "filters": item.get("filters"),
+        "documents": len(item["docs"] or []),
+        "timings": item["timings"]
+    }
+
+async def aanswer_questions(questions, llm_obj, retriever, context_budget, batch_size=BATCH_SIZE,
+                            llm_concurrency=BATCH_LLM_CONCURRENCY, on_results=None):
+    """
+    Answers questions in batches of batch_size. Retrieval of the next batch
+    runs in a worker thread while the LLM answers the previous one, with at
+    most llm_concurrency LLM calls in flight.
+    Args:
+        questions (list): {"id", "query", "previous_query"} dicts.
+        on_results (callable, optional): Called with each batch's results, in input order, as soon as the batch is answered.
+    Returns:
+        list: One result dict per question, in input order.
+    """
+    semaphore = asyncio.Semaphore(llm_concurrency)
+    results = []
+    in_flight = None
+
+    async def collect(tasks):
+        batch_results = await asyncio.gather(*tasks)
+        if on_results is not None:
+            on_results(batch_results)
+        results.extend(batch_results)
+
+    for start in range(0, len(questions), batch_size):
+        batch_started = time.perf_counter()
+        items = await asyncio.to_thread(retrieve_batch, questions[start:start + batch_size], llm_obj, retriever, context_budget)
+        tasks = [asyncio.create_task(answer(item, semaphore, batch_started)) for item in items]
+        if in_flight is not None:
+            await collect(in_flight)
+        in_flight = tasks
+    if in_flight is not None:
+        await collect(in_flight)
+    return results
+
+def answer_questions(questions, llm_obj, retriever, context_budget, batch_size=BATCH_SIZE, llm_concurrency=BATCH_LLM_CONCURRENCY, on_results=None):
+    """
+    Blocking entry point for scripts (see aanswer_questions).
+    """
+    return asyncio.run(aanswer_questions(questions, llm_obj, retriever, context_budget, batch_size, llm_concurrency, on_results))
+
+def answer_file(input_path, output_path, batch_size=BATCH_SIZE, llm_concurrency=BATCH_LLM_CONCURRENCY, vectorstore_path=VECTORSTORE_PATH):
+    """
+    Answers a JSONL file of questions with the configured providers, writing
+    each batch's results to output_path as it completes.
+    """
+    questions = read_questions(input_path)
+    llm_obj = get_chat_model()
+    embeddings = CachedEmbeddings(get_embeddings())
+    _, retriever = load_retriever(embeddings, vectorstore_path)
+    get_entity_registry()
+    context_budget = ContextBudget(max_tokens=MAX_TOKENS)
+
+    started = time.perf_counter()
+    with open(output_path, "w", encoding="utf-8") as f:
+        def write(batch_results):
+            for result in batch_results:
+                f.write(json.dumps(result, default=str) + "\n")
+            f.flush()
+        results = answer_questions(questions, llm_obj, retriever, context_budget, batch_size, llm_concurrency, write)
+    errors = sum(result["error"] is not None for result in results)
+    print(f"Answered {len(results)} questions in {time.perf_counter() - started:.1f} s ({errors} errors) -> {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions.")
+    parser.add_argument("input_path")
+    parser.add_argument("output_path")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Overrides RAG_BATCH_SIZE.")
+    parser.add_argument("--llm-concurrency", type=int, default=BATCH_LLM_CONCURRENCY, help="Overrides RAG_BATCH_LLM_CONCURRENCY.")
+    parser.add_argument("--vectorstore", default=VECTORSTORE_PATH)
+    args = parser.parse_args()
+    answer_file(args.input_path, args.output_path, args.batch_size, args.llm_concurrency, args.vectorstore)
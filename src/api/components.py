@@ -0,0 +1,46 @@
+from src.utils.retriever import FilteredRetriever
+from src.utils.metadata_store import MetadataStore
+from src.utils.lexical_index import LexicalIndex
+from src.utils.timeline_index import TimelineIndex
+from src.utils.change_table import ChangeTable
+from src.vectorstore.disk_store import load_serving_store
+from src.vectorstore.add_to_vectorstore import load_embedding_model
+
+VECTORSTORE_PATH = "./vectorstore_faiss"
+
+def load_retriever(embeddings, vectorstore_path=VECTORSTORE_PATH):
+    """
+    Loads the serving vectorstore and the indexes saved with it at ingest.
+    Shared by the Gradio app and the batch entry point.
+    Args:
+        embeddings (CachedEmbeddings): The query embedding model; must be the one the index was built with.
+        vectorstore_path (str, optional): Folder written by src.vectorstore.add_to_vectorstore.
+    Returns:
+        tuple: (vector_store, FilteredRetriever)
+    """
+    # Queries must be embedded by the model the index was built with
+    index_embedding_model = load_embedding_model(vectorstore_path)
+    if index_embedding_model not in (None, embeddings.model_name):
+        raise ValueError(
+            f"{vectorstore_path} was built with {index_embedding_model}, "
+            f"but the configured embedding model is {embeddings.model_name}; rebuild it with src.vectorstore.add_to_vectorstore"
+        )
+    # Memory-mapped index and lazily read documents: fast startup, pages shared between workers.
+    # Index type and distance settings are read from the saved vectorstore.
+    vector_store = load_serving_store(vectorstore_path, embeddings=embeddings)
+    # Columnar metadata saved at ingest (bitmap filters, patch timestamps, token counts)
+    metadata_store = MetadataStore.load_or_build(vector_store, vectorstore_path)
+    # BM25 over the chunk texts, fused with the vector ranking (exact patch versions and numbers)
+    lexical_index = LexicalIndex.load_or_build(vector_store, vectorstore_path)
+    # Per-entity change timelines: "how has X changed since 7.30" is answered without vector search
+    timeline_index = TimelineIndex.load_or_build(metadata_store, vectorstore_path)
+    # Numeric changes parsed at ingest: "biggest nerfs in 7.38" is a vectorized query, not thousands of chunks
+    change_table = ChangeTable.load_or_build(vectorstore_path)
+    filtered_retriever = FilteredRetriever(
+        vector_store,
+        metadata_store=metadata_store,
+        lexical_index=lexical_index,
+        timeline_index=timeline_index,
+        change_table=change_table
+    )
+    return vector_store, filtered_retriever
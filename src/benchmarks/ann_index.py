@@ -0,0 +1,96 @@
+# Benchmark: recall@k, query latency and memory of the configurable ANN indexes against exact Flat search
+# Usage: python -m src.benchmarks.ann_index [--scales 1 10 100] [--types flat hnsw ivf-flat ivf-pq] [--metric l2|ip]
+# Corpus: the vectors of ./vectorstore_faiss (all shards) when it exists, otherwise the real patch-note chunks embedded
+# offline with a hashing embedder. Scales > 1 are synthetic corpora sampled around the real vectors.
+# Memory: 100x the real corpus at 1536 dimensions is ~8 GB of raw vectors; use --dim with the offline embedder on small machines.
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import argparse
+import os
+import time
+import numpy as np
+import faiss
+
+from src.utils.providers import hashing_embed
+from src.vectorstore.conversion import convert_patch_notes, patch_sort_key
+from src.vectorstore.disk_store import has_catalog, load_catalog
+from src.vectorstore.index_factory import IndexConfig, INDEX_TYPES, build_index
+
+def load_corpus(vectorstore_path, dim):
+  if os.path.exists(os.path.join(vectorstore_path, "index.faiss")):
+    index = faiss.read_index(os.path.join(vectorstore_path, "index.faiss"))
+    print(f"Corpus: {index.ntotal} vectors from {vectorstore_path}")
+    return index.reconstruct_n(0, index.ntotal)
+  if has_catalog(vectorstore_path):
+    # Sharded vectorstore: the shards' vectors in global row order
+    indexes = [faiss.read_index(os.path.join(vectorstore_path, shard["directory"], "index.faiss")) for shard in load_catalog(vectorstore_path)]
+    print(f"Corpus: {sum(index.ntotal for index in indexes)} vectors from {len(indexes)} shards of {vectorstore_path}")
+    return np.concatenate([index.reconstruct_n(0, index.ntotal) for index in indexes])
+  patch_notes = sorted((p for p in os.listdir("./patchnotes") if p.endswith(".json")), key=patch_sort_key)
+  docs = [doc for patch_docs in convert_patch_notes(patch_notes).values() for doc in patch_docs]
+  splits = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(docs)
+  print(f"Corpus: {len(splits)} patch-note chunks, hashing embedder ({dim} dims)")
+  return hashing_embed([doc.page_content for doc in splits], dim)
+
+def synthetic_corpus(base, scale, rng):
+  # Scaled corpus around the real vectors: random real vectors plus small gaussian noise
+  if scale == 1:
+    return base
+  noise = 0.1 * base.std(axis=0).mean()
+  rows = rng.integers(0, len(base), size=len(base) * scale)
+  return (base[rows] + rng.normal(0, noise, size=(len(rows), base.shape[1]))).astype(np.float32)
+
+def make_queries(corpus, n_queries, rng):
+  rows = rng.choice(len(corpus), size=n_queries, replace=False)
+  noise = 0.05 * corpus.std(axis=0).mean()
+  return (corpus[rows] + rng.normal(0, noise, size=(n_queries, corpus.shape[1]))).astype(np.float32)
+
+def measure(index, queries, k):
+  # One query at a time, like the app
+  latencies, results = [], []
+  for query in queries:
+    started = time.perf_counter()
+    _, rows = index.search(query[None, :], k)
+    latencies.append(time.perf_counter() - started)
+    results.append(rows[0])
+  return np.array(latencies) * 1e3, np.array(results)
+
+def recall_at_k(results, truth):
+  return float(np.mean([len(set(r[r >= 0]) & set(t)) / len(t) for r, t in zip(results, truth)]))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--scales", type=int, nargs="+", default=[1, 10], help="Corpus sizes as multiples of the real corpus")
+  parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+  parser.add_argument("--metric", default="l2", choices=("l2", "ip"))
+  parser.add_argument("--k", type=int, default=10)
+  parser.add_argument("--queries", type=int, default=200)
+  parser.add_argument("--dim", type=int, default=384, help="Offline embedder dimension")
+  parser.add_argument("--vectorstore", default="./vectorstore_faiss")
+  args = parser.parse_args()
+
+  rng = np.random.default_rng(0)
+  base = load_corpus(args.vectorstore, args.dim)
+  print(f"{'scale':>5} {'vectors':>9} | {'index':<8} | {'build s':>8} | {'recall@' + str(args.k):>9} | {'p50 ms':>7} | {'p99 ms':>7} | {'memory MB':>9}")
+  for scale in args.scales:
+    corpus = synthetic_corpus(base, scale, rng)
+    queries = make_queries(corpus, args.queries, rng)
+    if args.metric == "ip":
+      faiss.normalize_L2(corpus)
+      faiss.normalize_L2(queries)
+
+    truth = None
+    for index_type in ["flat"] + [t for t in args.types if t != "flat"]:
+      config = IndexConfig(index_type=index_type, metric=args.metric)
+      started = time.perf_counter()
+      index = build_index(config, corpus)
+      index.add(corpus)
+      build_seconds = time.perf_counter() - started
+      latencies, results = measure(index, queries, args.k)
+      if truth is None:
+        truth = results
+      if index_type not in args.types:
+        continue
+      memory_mb = faiss.serialize_index(index).nbytes / 1e6
+      print(f"{scale:>4}x {len(corpus):>9} | {index_type:<8} | {build_seconds:8.2f} | {recall_at_k(results, truth):9.3f} | {np.percentile(latencies, 50):7.3f} | {np.percentile(latencies, 99):7.3f} | {memory_mb:9.1f}")
+      del index
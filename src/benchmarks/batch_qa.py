@@ -0,0 +1,121 @@
+# Benchmark: answering a question set one at a time through ChainBuilder (how nightly jobs drive the UI today)
+# vs. src.api.batch (batched embeddings, one FAISS call per filter set, bounded async LLM pool).
+# Usage: python -m src.benchmarks.batch_qa [--heroes 60] [--llm-latency 0.2] [--embed-latency 0.02] [--llm-concurrency 8]
+# Offline: hashing embedder with a simulated per-call round trip, stub LLM. Also checks that both paths build the same context.
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import argparse
+import asyncio
+import os
+import time
+
+from src.api.batch import aanswer_questions, retrieve_batch
+from src.benchmarks.entity_matcher import QUERIES
+from src.benchmarks.load_test import ApproxBudget, make_chain_builder
+from src.utils.change_table import ChangeTable
+from src.utils.lexical_index import LexicalIndex
+from src.utils.metadata_store import MetadataStore
+from src.utils.providers import HashingEmbeddings, StubChatModel, hashing_embed
+from src.utils.registry import get_entity_registry
+from src.utils.retriever import FilteredRetriever
+from src.utils.timeline_index import TimelineIndex
+from src.vectorstore.conversion import convert_patch_notes, extract_changes, patch_sort_key
+from src.vectorstore.index_factory import new_vector_store
+
+class RoundTripEmbeddings(HashingEmbeddings):
+  # Hashing embedder plus a fixed delay per call, like a remote embedding API
+  def __init__(self, dim, latency):
+    super().__init__(dim)
+    self.latency = latency
+
+  def embed_documents(self, texts):
+    time.sleep(self.latency)
+    return super().embed_documents(texts)
+
+  def embed_query(self, text):
+    time.sleep(self.latency)
+    return super().embed_query(text)
+
+  async def aembed_query(self, text):
+    await asyncio.sleep(self.latency)
+    return HashingEmbeddings.embed_query(self, text)
+
+def build_retriever(dim, embed_latency):
+  patch_notes = sorted((p for p in os.listdir("./patchnotes") if p.endswith(".json")), key=patch_sort_key)
+  docs = [doc for patch_docs in convert_patch_notes(patch_notes).values() for doc in patch_docs]
+  splits = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(docs)
+  vectors = hashing_embed([doc.page_content for doc in splits], dim)
+  vector_store = new_vector_store(RoundTripEmbeddings(dim, embed_latency), vectors)
+  vector_store.add_embeddings(
+    text_embeddings=[(doc.page_content, vector) for doc, vector in zip(splits, vectors)],
+    metadatas=[doc.metadata for doc in splits],
+    ids=[str(idx) for idx in range(len(splits))]
+  )
+  metadata_store = MetadataStore.from_vector_store(vector_store)
+  changes = extract_changes(patch_notes)
+  return FilteredRetriever(
+    vector_store,
+    metadata_store=metadata_store,
+    lexical_index=LexicalIndex.from_vector_store(vector_store),
+    timeline_index=TimelineIndex.from_metadata_store(metadata_store),
+    change_table=ChangeTable.from_records([change for patch_changes in changes.values() for change in patch_changes])
+  )
+
+# Open questions (no entity, no patch): these go through the batched vector search
+TOPICS = [
+  "cooldown", "mana cost", "armor", "attack speed", "magic resistance", "movement speed", "cast range", "gold bounty",
+  "Roshan", "stun duration", "lifesteal", "health regeneration", "neutral creeps", "experience", "buyback", "evasion"
+]
+
+def make_questions(n_heroes):
+  # Per-hero summaries (the nightly job), open questions and the mixed questions of the matcher benchmark
+  heroes = sorted(get_entity_registry().id_to_name["heroes"].values())[:n_heroes]
+  queries = [f"Summarize the ability changes for {hero}" for hero in heroes]
+  queries += [f"{phrase} {topic}?" for topic in TOPICS for phrase in ("What changed about", "Which patches changed")]
+  queries += QUERIES
+  return [{"id": i, "query": query} for i, query in enumerate(queries)]
+
+async def run_sequential(questions, llm, retriever, budget):
+  for question in questions:
+    await make_chain_builder(question["query"], llm, retriever.vector_store, retriever, budget).ainvoke()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--heroes", type=int, default=60)
+  parser.add_argument("--dim", type=int, default=256)
+  parser.add_argument("--llm-latency", type=float, default=0.2)
+  parser.add_argument("--embed-latency", type=float, default=0.02)
+  parser.add_argument("--llm-concurrency", type=int, default=8)
+  parser.add_argument("--batch-size", type=int, default=256)
+  args = parser.parse_args()
+
+  retriever = build_retriever(args.dim, args.embed_latency)
+  budget = ApproxBudget()
+  llm = StubChatModel(latency=args.llm_latency)
+  questions = make_questions(args.heroes)
+
+  # Both paths should hand the LLM the same context. Batched FAISS distances go through BLAS and can differ
+  # from single-query ones in the last bit, which reorders exact ties: vector results are compared by overlap.
+  items = retrieve_batch(questions, llm, retriever, budget)
+  same, overlaps = 0, []
+  for item in items:
+    builder = make_chain_builder(item["query"], llm, retriever.vector_store, retriever, budget)
+    if "embedding_batch" in item["timings"]:
+      docs = builder.retrieve(*builder.extract_filters()[:3])
+      expected = {doc.page_content for doc in docs}
+      overlaps.append(len(expected & {doc.page_content for doc in item["docs"]}) / max(len(expected), 1))
+    else:
+      same += item["context"] == builder.prepare()[3]
+  print(f"{len(questions)} questions: identical context for {same}/{len(items) - len(overlaps)} answered from metadata, "
+        f"mean document overlap {sum(overlaps) / max(len(overlaps), 1):.3f} for the {len(overlaps)} vector-searched")
+
+  started = time.perf_counter()
+  asyncio.run(run_sequential(questions, llm, retriever, budget))
+  sequential = time.perf_counter() - started
+  started = time.perf_counter()
+  results = asyncio.run(aanswer_questions(questions, llm, retriever, budget, args.batch_size, args.llm_concurrency))
+  batched = time.perf_counter() - started
+  errors = sum(result["error"] is not None for result in results)
+  print(f"one at a time: {sequential:6.2f} s ({len(questions) / sequential:5.1f} q/s)")
+  print(f"batch:         {batched:6.2f} s ({len(questions) / batched:5.1f} q/s), {errors} errors, "
+        f"LLM concurrency {args.llm_concurrency}, batch size {args.batch_size}")
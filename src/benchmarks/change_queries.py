@@ -0,0 +1,110 @@
+# Benchmark: aggregate questions ("biggest nerfs in 7.38") answered from the change table vs. the former
+# path (metadata filters, then metadata or 1000-NN vector retrieval of whole chunks into the prompt).
+# Usage: python -m src.benchmarks.change_queries [--repeat 20] [--dim 256]
+# Reports retrieval latency and the size of the context handed to the LLM (~4 chars per token), after checking
+# the buff/nerf labels of a few hand-labelled changes.
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import argparse
+import os
+import time
+
+from src.benchmarks.load_test import ApproxBudget
+from src.utils.change_table import ChangeTable
+from src.utils.metadata_store import MetadataStore
+from src.utils.providers import hashing_embed
+from src.utils.retriever import FilteredRetriever
+from src.utils.strainer import FilterRetrievedDocuments
+from src.vectorstore.conversion import convert_patch_notes, extract_changes, patch_sort_key
+from src.vectorstore.index_factory import new_vector_store
+
+QUERIES = [
+  "What were the biggest nerfs in 7.38?",
+  "What are the biggest hero buffs in 7.37?",
+  "List all cooldown reductions for items",
+  "Top 5 Pudge buffs since 7.30",
+  "Show all item nerfs in the last 3 patches",
+  "Biggest mana cost increases in 7.36",
+]
+
+# (entity, attribute, old, new, expected impact), recipe rows judged together with the total cost row before them
+IMPACT_CASES = [
+  ("bloodseeker thirst", "bonus move speed while on cooldown", [0.0], [50.0], 1),
+  ("pudge meat hook", "cooldown", [14.0], [13.0], 1),
+  ("pudge meat hook", "mana cost", [110.0], [125.0], -1),
+  ("zeus", "level 15 talent cooldown reduction", [10.0], [15.0], 1),
+  ("lifestealer", "level 25 talent bat reduction during insatiable hunger", [0.2], [0.3], 1),
+  ("shadow demon", "level 15 talent damage taken in shadow walk", [20.0], [30.0], -1),
+  ("glimmer cape", "total cost", [1950.0], [2150.0], -1),
+  ("glimmer cape", "recipe cost", [450.0], [350.0], -1),
+  ("orchid", "total cost", [3875.0], [3475.0], 1),
+  ("orchid", "recipe cost", [775.0], [475.0], 1),
+  ("kaya", "recipe cost", [500.0], [650.0], -1),
+]
+
+def check_impacts():
+  # Labels the cases in one table and returns the mismatches as (entity, attribute, expected, got)
+  records = [
+    {"entity_kind": "item" if attribute.endswith(("recipe cost", "total cost")) else "ability", "entity": entity,
+     "hero": "N/A", "category": "items", "attribute": attribute, "verb": "changed", "old_levels": old, "new_levels": new,
+     "note": attribute, "patch_version": "7.33", "patch_timestamp": 0}
+    for entity, attribute, old, new, _ in IMPACT_CASES
+  ]
+  table = ChangeTable.from_records(records)
+  return [
+    (entity, attribute, expected, int(table.impact[row]))
+    for row, (entity, attribute, _, _, expected) in enumerate(IMPACT_CASES) if table.impact[row] != expected
+  ]
+
+def build_retriever(dim):
+  patch_notes = sorted((p for p in os.listdir("./patchnotes") if p.endswith(".json")), key=patch_sort_key)
+  docs = [doc for patch_docs in convert_patch_notes(patch_notes).values() for doc in patch_docs]
+  splits = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(docs)
+  vectors = hashing_embed([doc.page_content for doc in splits], dim)
+  vector_store = new_vector_store(DeterministicFakeEmbedding(size=dim), vectors)
+  vector_store.add_embeddings(
+    text_embeddings=[(doc.page_content, vector) for doc, vector in zip(splits, vectors)],
+    metadatas=[doc.metadata for doc in splits],
+    ids=[str(idx) for idx in range(len(splits))]
+  )
+  started = time.perf_counter()
+  changes = extract_changes(patch_notes)
+  extracted = time.perf_counter()
+  change_table = ChangeTable.from_records([change for patch_changes in changes.values() for change in patch_changes])
+  print(f"Corpus: {len(splits)} chunks; {change_table.n_rows} numeric changes extracted in {extracted - started:.2f} s, "
+        f"table built in {(time.perf_counter() - extracted) * 1e3:.1f} ms")
+  return FilteredRetriever(vector_store, metadata_store=MetadataStore.from_vector_store(vector_store), change_table=change_table)
+
+def time_per_query(fn, repeat):
+  started = time.perf_counter()
+  for _ in range(repeat):
+    result = fn()
+  return (time.perf_counter() - started) / repeat * 1e3, result
+
+def context_tokens(docs):
+  return sum(len(doc.page_content) for doc in docs) // 4
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--repeat", type=int, default=20)
+  parser.add_argument("--dim", type=int, default=256)
+  args = parser.parse_args()
+
+  mismatches = check_impacts()
+  print(f"Buff/nerf labels: {len(IMPACT_CASES) - len(mismatches)}/{len(IMPACT_CASES)} labelled cases right")
+  for entity, attribute, expected, impact in mismatches:
+    print(f"  {entity} {attribute}: expected {expected:+d}, got {impact:+d}")
+  retriever = build_retriever(args.dim)
+  budget = ApproxBudget()
+  print(f"{'query':<42} | {'changes':>7} | {'table ms':>8} | {'tokens':>6} | {'former ms':>9} | {'docs':>5} | {'tokens':>6}")
+  for query in QUERIES:
+    strainer = FilterRetrievedDocuments(query)
+    filter_criteria, aggregate = strainer.dynamic_filter(), strainer.aggregate_filter()
+    table_ms, docs = time_per_query(lambda: retriever.change_search(aggregate, budget), args.repeat)
+
+    vector = hashing_embed([query], args.dim)
+    former = lambda: retriever.structured_search(filter_criteria, budget) or budget.pack([doc for doc, _ in retriever.search_by_vector(vector, filter_criteria, k=1000)])
+    former_ms, former_docs = time_per_query(former, args.repeat)
+    print(f"{query:<42} | {len(docs or []):7d} | {table_ms:8.2f} | {context_tokens(docs or []):6d} | "
+          f"{former_ms:9.2f} | {len(former_docs):5d} | {context_tokens(former_docs):6d}")
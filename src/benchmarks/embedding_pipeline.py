@@ -0,0 +1,65 @@
+# Benchmark: EmbeddingPipeline throughput vs. allowed concurrency against the local fake embedding server
+# Usage: python -m src.benchmarks.embedding_pipeline --chunks 5000 --latency-ms 100 --server-max-in-flight 16
+from aiohttp import web
+from langchain_openai import OpenAIEmbeddings
+import argparse
+import asyncio
+import shutil
+import tempfile
+
+from src.benchmarks.fake_embedding_server import make_app
+from src.vectorstore.embedding_pipeline import EmbeddingPipeline
+
+async def run_benchmark(args):
+  app = make_app(dim=args.dim, latency_ms=args.latency_ms, max_in_flight=args.server_max_in_flight, error_rate=args.error_rate)
+  runner = web.AppRunner(app)
+  await runner.setup()
+  site = web.TCPSite(runner, "127.0.0.1", args.port)
+  await site.start()
+
+  embeddings = OpenAIEmbeddings(
+    base_url=f"http://127.0.0.1:{args.port}/v1",
+    api_key="fake",
+    check_embedding_ctx_length=False,
+    max_retries=0,  # retries are the pipeline's job
+  )
+  texts = [f"Patch-Version: 7.{i % 19 + 20}. Category: items. Item: blink {i}. Cooldown decreased from {i % 15} to {i % 13}" for i in range(args.chunks)]
+
+  print(f"{args.chunks} chunks, batch size {args.batch_size}, server latency {args.latency_ms} ms, server slots {args.server_max_in_flight}")
+  print("max_concurrency | seconds | chunks/s | final limit | 429s | retries")
+  for max_concurrency in args.concurrency:
+    app["state"].update(requests=0, rate_limited=0)
+    checkpoint_dir = tempfile.mkdtemp()
+    pipeline = EmbeddingPipeline(
+      embeddings,
+      batch_size=args.batch_size,
+      max_concurrency=max_concurrency,
+      initial_concurrency=max_concurrency,
+      base_backoff=0.05,
+      checkpoint_dir=checkpoint_dir,
+    )
+    vectors = await pipeline.arun(texts)
+    assert len(vectors) == len(texts)
+    stats = pipeline.stats
+    print(f"{max_concurrency:15d} | {stats['seconds']:7.2f} | {len(texts) / stats['seconds']:8.0f} | {stats['final_concurrency']:11d} | {stats['rate_limited']:4d} | {stats['retries']}")
+
+    # Resume check: a second run over the same checkpoint makes no requests
+    app["state"]["requests"] = 0
+    await pipeline.arun(texts)
+    assert app["state"]["requests"] == 0 and pipeline.stats["resumed_batches"] == pipeline.stats["batches"]
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+  await runner.cleanup()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--chunks", type=int, default=5000)
+  parser.add_argument("--batch-size", type=int, default=64)
+  parser.add_argument("--dim", type=int, default=256)
+  parser.add_argument("--latency-ms", type=float, default=100.0)
+  parser.add_argument("--server-max-in-flight", type=int, default=16)
+  parser.add_argument("--error-rate", type=float, default=0.0)
+  parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+  parser.add_argument("--port", type=int, default=8765)
+  asyncio.run(run_benchmark(parser.parse_args()))
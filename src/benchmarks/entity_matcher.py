@@ -0,0 +1,59 @@
+# Micro-benchmark: Aho-Corasick EntityMatcher vs. the former per-name substring scans in dynamic_filter
+# Usage: python -m src.benchmarks.entity_matcher
+import timeit
+
+from src.utils.registry import get_entity_registry
+
+QUERIES = [
+  "What are the changes for shadow shaman in 7.37e??",
+  "What changed for Pudge in 7.38?",
+  "Summarize the latest patch updates",
+  "Were there any Axe talent changes in 7.36?",
+  "How has Meat Hook changed since 7.30?",
+  "Was Blink Dagger nerfed in 7.35?",
+  "What are the base stat changes for Anti-Mage in 7.34b?",
+  "Any updates to Io's abilities?",
+  "Tell me about the ratio of nerfs to buffs in 7.33",
+  "List all item changes in the latest patch",
+  "What happened to Aghanim's Scepter in 7.32?",
+  "How about Medusa?",
+  "Did Black King Bar get a cooldown reduction in 7.31?",
+  "What skill changes did Invoker receive in 7.29?",
+  "Give me a summary of the generic gameplay updates in 7.20",
+  "Were there any changes to Phantom Assassin's blur in 7.37?",
+]
+
+def legacy_scan(query_lower, heroes_set, items_set, abilities_set):
+  # The linear scans dynamic_filter used before the matcher
+  hero = next((hero for hero in heroes_set if hero in query_lower), None)
+  item = next((item for item in items_set if item in query_lower), None)
+  ability = next((ability for ability in abilities_set if ability in query_lower), None)
+  return hero, item, ability
+
+def matcher_scan(query_lower, matcher):
+  matches = matcher.find_all(query_lower)
+  return matcher.first(matches, "heroes"), matcher.first(matches, "items"), matcher.first(matches, "abilities")
+
+if __name__ == "__main__":
+  registry = get_entity_registry()
+  queries = [query.lower() for query in QUERIES]
+
+  build_seconds = timeit.timeit(lambda: registry.__class__().matcher, number=1)
+  matcher = registry.matcher
+
+  repeats = 20
+  legacy_seconds = timeit.timeit(
+    lambda: [legacy_scan(q, registry.heroes_set, registry.items_set, registry.abilities_set) for q in queries],
+    number=repeats
+  )
+  matcher_seconds = timeit.timeit(lambda: [matcher_scan(q, matcher) for q in queries], number=repeats)
+
+  per_query = lambda seconds: seconds / (repeats * len(queries)) * 1e6
+  print(f"Entities indexed: {len(matcher.pattern_kinds)} (automaton states: {len(matcher.goto)}, build incl. CSV load: {build_seconds * 1e3:.1f} ms)")
+  print(f"Legacy substring scan: {per_query(legacy_seconds):9.1f} us/query")
+  print(f"Aho-Corasick matcher:  {per_query(matcher_seconds):9.1f} us/query ({legacy_seconds / matcher_seconds:.1f}x faster)")
+  print()
+  print("Query | legacy (hero, item, ability) | matcher (hero, item, ability)")
+  for query in queries:
+    legacy = legacy_scan(query, registry.heroes_set, registry.items_set, registry.abilities_set)
+    print(f"{query} | {legacy} | {matcher_scan(query, matcher)}")
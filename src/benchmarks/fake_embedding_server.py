@@ -0,0 +1,68 @@
+# Local OpenAI-compatible embedding server for offline pipeline and load testing
+# Usage: python -m src.benchmarks.fake_embedding_server --port 8765 --latency-ms 200 --max-in-flight 8
+# Point OpenAIEmbeddings at it with base_url="http://127.0.0.1:8765/v1", api_key="fake".
+from aiohttp import web
+import argparse
+import asyncio
+import hashlib
+import random
+import numpy as np
+
+def fake_vector(value, dim):
+  # Deterministic unit vector seeded by the input (text or token ids)
+  seed = int.from_bytes(hashlib.sha256(str(value).encode("utf-8")).digest()[:8], "little")
+  vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+  return (vector / np.linalg.norm(vector)).tolist()
+
+def make_app(dim=1536, latency_ms=50.0, max_in_flight=8, error_rate=0.0):
+  """
+  Builds the aiohttp app. Requests beyond max_in_flight concurrent ones get a
+  429, and error_rate injects random 500s, so backpressure and retries can be
+  exercised without the real API.
+  """
+  state = {"in_flight": 0, "requests": 0, "rate_limited": 0, "errors": 0, "max_in_flight_seen": 0}
+
+  async def embeddings(request):
+    state["requests"] += 1
+    if state["in_flight"] >= max_in_flight:
+      state["rate_limited"] += 1
+      return web.json_response({"error": {"message": "Rate limit reached", "type": "requests"}}, status=429)
+    if random.random() < error_rate:
+      state["errors"] += 1
+      return web.json_response({"error": {"message": "Injected failure", "type": "server_error"}}, status=500)
+
+    state["in_flight"] += 1
+    state["max_in_flight_seen"] = max(state["max_in_flight_seen"], state["in_flight"])
+    try:
+      body = await request.json()
+      inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+      await asyncio.sleep(latency_ms / 1000)
+      data = [{"object": "embedding", "index": i, "embedding": fake_vector(value, dim)} for i, value in enumerate(inputs)]
+      return web.json_response({
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "fake"),
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+      })
+    finally:
+      state["in_flight"] -= 1
+
+  async def stats(request):
+    return web.json_response(state)
+
+  app = web.Application(client_max_size=64 * 1024 * 1024)
+  app.router.add_post("/v1/embeddings", embeddings)
+  app.router.add_get("/stats", stats)
+  app["state"] = state
+  return app
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Fake OpenAI embeddings endpoint.")
+  parser.add_argument("--port", type=int, default=8765)
+  parser.add_argument("--dim", type=int, default=1536)
+  parser.add_argument("--latency-ms", type=float, default=50.0)
+  parser.add_argument("--max-in-flight", type=int, default=8)
+  parser.add_argument("--error-rate", type=float, default=0.0)
+  args = parser.parse_args()
+  web.run_app(make_app(args.dim, args.latency_ms, args.max_in_flight, args.error_rate), host="127.0.0.1", port=args.port)
@@ -0,0 +1,81 @@
+# Benchmark: BM25 + vector hybrid retrieval (reciprocal rank fusion) vs. vector-only search
+# Usage: python -m src.benchmarks.hybrid_retrieval [--queries 200] [--dim 256] [--k 1000]
+# Corpus: the real patch-note chunks embedded offline with the hashing embedder.
+# Queries quote a number or patch version taken from a random chunk ("0.45", "7.37e"); a hit means
+# a top-10 result contains that exact token. Latency is per query, excluding the query embedding.
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import argparse
+import os
+import time
+import numpy as np
+
+from src.utils.lexical_index import LexicalIndex, tokenize
+from src.utils.metadata_store import MetadataStore
+from src.utils.providers import hashing_embed
+from src.utils.retriever import FilteredRetriever
+from src.vectorstore.conversion import convert_patch_notes, patch_sort_key
+from src.vectorstore.index_factory import new_vector_store
+
+def build_retrievers(dim):
+  patch_notes = sorted((p for p in os.listdir("./patchnotes") if p.endswith(".json")), key=patch_sort_key)
+  docs = [doc for patch_docs in convert_patch_notes(patch_notes).values() for doc in patch_docs]
+  splits = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(docs)
+  vectors = hashing_embed([doc.page_content for doc in splits], dim)
+  vector_store = new_vector_store(DeterministicFakeEmbedding(size=dim), vectors)
+  vector_store.add_embeddings(
+    text_embeddings=[(doc.page_content, vector) for doc, vector in zip(splits, vectors)],
+    metadatas=[doc.metadata for doc in splits],
+    ids=[str(idx) for idx in range(len(splits))]
+  )
+  started = time.perf_counter()
+  lexical_index = LexicalIndex.from_vector_store(vector_store)
+  print(f"Corpus: {len(splits)} chunks; BM25 index built in {time.perf_counter() - started:.2f} s "
+        f"({len(lexical_index.terms)} terms, {lexical_index.rows.size} postings)")
+  metadata_store = MetadataStore.from_vector_store(vector_store)
+  return (
+    FilteredRetriever(vector_store, metadata_store=metadata_store),
+    FilteredRetriever(vector_store, metadata_store=metadata_store, lexical_index=lexical_index),
+    splits
+  )
+
+def make_queries(splits, n_queries, rng):
+  queries = []
+  while len(queries) < n_queries:
+    doc = splits[rng.integers(len(splits))]
+    numbers = [token for token in tokenize(doc.page_content) if "." in token]
+    if numbers:
+      term = numbers[rng.integers(len(numbers))]
+      queries.append((f"Which changes mention {term}?", term, doc.metadata))
+  return queries
+
+def run(search, queries, dim):
+  latencies, hits = [], 0
+  for query, term, _ in queries:
+    vector = hashing_embed([query], dim)
+    started = time.perf_counter()
+    results = search(query, vector)
+    latencies.append(time.perf_counter() - started)
+    hits += any(term in tokenize(doc.page_content) for doc, _ in results[:10])
+  return np.array(latencies) * 1e3, hits / len(queries)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--queries", type=int, default=200)
+  parser.add_argument("--dim", type=int, default=256)
+  parser.add_argument("--k", type=int, default=1000)
+  args = parser.parse_args()
+
+  vector_retriever, hybrid_retriever, splits = build_retrievers(args.dim)
+  queries = make_queries(splits, args.queries, np.random.default_rng(0))
+  modes = {
+    "vector": lambda query, vector: vector_retriever.search_by_vector(vector, {}, args.k),
+    "hybrid": lambda query, vector: hybrid_retriever.hybrid_search(query, {}, args.k, vector=vector),
+    "vector+patch": lambda query, vector: vector_retriever.search_by_vector(vector, {"patch_version": "7.37"}, args.k),
+    "hybrid+patch": lambda query, vector: hybrid_retriever.hybrid_search(query, {"patch_version": "7.37"}, args.k, vector=vector),
+  }
+  print(f"{'mode':<13} | {'p50 ms':>7} | {'p95 ms':>7} | {'exact-term hit@10':>17}")
+  for mode, search in modes.items():
+    latencies, hit_rate = run(search, queries, args.dim)
+    print(f"{mode:<13} | {np.percentile(latencies, 50):7.2f} | {np.percentile(latencies, 95):7.2f} | {hit_rate:17.2f}")
@@ -0,0 +1,124 @@
+# Load test: concurrent chats through ChainBuilder.ainvoke vs. the blocking invoke path, against a stub LLM
+# Usage: python -m src.benchmarks.load_test --users 32 --llm-latency 0.5 --concurrency-limit 16 [--stream]
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from src.benchmarks.entity_matcher import QUERIES
+from src.utils.chain_builder import ChainBuilder
+from src.utils.context_budget import ContextBudget
+from src.utils.providers import StubChatModel
+from src.utils.retriever import FilteredRetriever
+from src.utils.strainer import FilterRetrievedDocuments
+from src.vectorstore.conversion import convert_patch_notes, patch_sort_key
+
+class ApproxBudget(ContextBudget):
+  # Offline token estimate (~4 chars per token) so the test needs no tiktoken download
+  def count_tokens(self, doc):
+    return len(doc.page_content) // 4 + 1
+
+  def pack(self, docs):
+    packed, used = [], 0
+    for doc in docs:
+      used += self.count_tokens(doc) + 1
+      if used > self.max_tokens:
+        break
+      packed.append(doc)
+    return packed
+
+def build_components(n_patches):
+  patch_notes = sorted(os.listdir("./patchnotes"), key=patch_sort_key)[-n_patches:]
+  docs = [doc for patch_docs in convert_patch_notes(patch_notes).values() for doc in patch_docs]
+  splits = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(docs)
+  vector_store = FAISS.from_documents(splits, DeterministicFakeEmbedding(size=256))
+  return vector_store, FilteredRetriever(vector_store), ApproxBudget()
+
+def make_chain_builder(query, llm, vector_store, retriever, budget):
+  return ChainBuilder(
+    llm_obj=llm,
+    strainer_obj=FilterRetrievedDocuments(query),
+    query=query,
+    chat_history=[],
+    vector_store=vector_store,
+    retriever=retriever,
+    context_budget=budget
+  )
+
+def percentiles(values):
+  values = sorted(values)
+  return statistics.median(values), values[int(0.95 * (len(values) - 1))]
+
+def summarize(label, latencies, wall_seconds):
+  p50, p95 = percentiles(latencies)
+  print(f"{label:<28} wall {wall_seconds:6.2f} s | {len(latencies) / wall_seconds:6.1f} req/s | p50 {p50:5.2f} s | p95 {p95:5.2f} s")
+
+async def run_async(queries, llm, components, concurrency_limit):
+  # Mirrors the Gradio app: async handler behind a concurrency limit
+  limiter = asyncio.Semaphore(concurrency_limit)
+  latencies = []
+
+  async def chat(query):
+    started = time.perf_counter()
+    async with limiter:
+      await make_chain_builder(query, llm, *components).ainvoke()
+    latencies.append(time.perf_counter() - started)
+
+  started = time.perf_counter()
+  await asyncio.gather(*(chat(query) for query in queries))
+  return latencies, time.perf_counter() - started
+
+async def run_streaming(queries, llm, components, concurrency_limit):
+  # Same as run_async through ChainBuilder.astream, also collecting each chat's time-to-first-token
+  limiter = asyncio.Semaphore(concurrency_limit)
+  latencies, ttfts = [], []
+
+  async def chat(query):
+    started = time.perf_counter()
+    first_token = None
+    async with limiter:
+      async for _ in make_chain_builder(query, llm, *components).astream():
+        if first_token is None:
+          first_token = time.perf_counter() - started
+    ttfts.append(first_token)
+    latencies.append(time.perf_counter() - started)
+
+  started = time.perf_counter()
+  await asyncio.gather(*(chat(query) for query in queries))
+  return latencies, ttfts, time.perf_counter() - started
+
+def run_blocking(queries, llm, components):
+  latencies = []
+  started = time.perf_counter()
+  for query in queries:
+    make_chain_builder(query, llm, *components).invoke()
+    # Queued requests wait for every earlier one (head-of-line blocking)
+    latencies.append(time.perf_counter() - started)
+  return latencies, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--users", type=int, default=32, help="Simultaneous chat requests")
+  parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM seconds per answer")
+  parser.add_argument("--concurrency-limit", type=int, default=16)
+  parser.add_argument("--patches", type=int, default=10, help="Latest N patches to index")
+  parser.add_argument("--stream", action="store_true", help="Also stream answers and report time-to-first-token")
+  args = parser.parse_args()
+
+  components = build_components(args.patches)
+  llm = StubChatModel(latency=args.llm_latency)
+  queries = [QUERIES[i % len(QUERIES)] for i in range(args.users)]
+  print(f"{args.users} simultaneous chats, stub LLM latency {args.llm_latency} s, {components[0].index.ntotal} chunks indexed")
+
+  summarize("blocking invoke (1 worker)", *run_blocking(queries, llm, components))
+  summarize(f"async ainvoke (limit {args.concurrency_limit})", *asyncio.run(run_async(queries, llm, components, args.concurrency_limit)))
+  if args.stream:
+    latencies, ttfts, wall_seconds = asyncio.run(run_streaming(queries, llm, components, args.concurrency_limit))
+    summarize(f"async astream (limit {args.concurrency_limit})", latencies, wall_seconds)
+    ttft_p50, ttft_p95 = percentiles(ttfts)
+    print(f"{'time to first token':<28} p50 {ttft_p50:5.2f} s | p95 {ttft_p95:5.2f} s")
@@ -0,0 +1,95 @@
+# Benchmark: single-pass native parser in ConvertPatchNotesToDocuments vs. the former five-JSONLoader conversion
+# Usage: python -m src.benchmarks.patch_parsing
+# The legacy path needs the jq package and the patchnotes_modified dump (python -m src.init_setup.modify_patch_notes).
+from langchain_community.document_loaders import JSONLoader
+import json
+import os
+import time
+
+from src.utils.registry import get_entity_registry
+from src.utils.storer import ConvertPatchNotesToDocuments
+
+LEGACY_LOADERS = [
+  # (jq schema, content key, category)
+  (".heroes[]", "abilities", "heroes-abilities"),
+  (".heroes[]", "talent_notes", "heroes-talents"),
+  (".heroes[]", "hero_notes", "heroes-base"),
+  (".items[]", "ability_notes", "items"),
+  (".generic[]", "note", "generic-updates"),
+]
+
+def legacy_convert(converter):
+  """
+  The pre-native conversion: one json.load for the patch metadata plus one
+  JSONLoader (full re-parse through jq) per document category, reading the
+  pre-normalized copy from patchnotes_modified.
+  """
+  file_path = os.path.join("./patchnotes_modified", converter.patch_note)
+  with open(file_path, "r") as f:
+    patch_data = json.load(f)
+  patch_timestamp = patch_data.get("patch_timestamp", "N/A")
+  patch_number = patch_data.get("patch_number", "N/A")
+
+  def metadata_func(category):
+    def extract(record, metadata):
+      if category.startswith("heroes"):
+        metadata["hero_id"] = record.get("hero_id")
+      if category == "heroes-abilities":
+        abilities = record.get("abilities", [])
+        metadata["ability_id"] = abilities[0].get("ability_id") if abilities else "N/A"
+      if category == "items":
+        metadata["item_id"] = record.get("ability_id")
+      return {**metadata, "category": category, "patch_timestamp": patch_timestamp, "patch_version": patch_number}
+    return extract
+
+  docs_all = []
+  for jq_schema, content_key, category in LEGACY_LOADERS:
+    try:
+      docs = JSONLoader(
+        file_path=file_path,
+        jq_schema=jq_schema,
+        content_key=content_key,
+        text_content=False,
+        metadata_func=metadata_func(category)
+      ).load()
+    except Exception:
+      continue
+    if category.startswith("heroes"):
+      converter.replace_id_with_name(docs, converter.dict_heroes_mapper, "Hero", "hero_id")
+    if category == "heroes-abilities":
+      converter.replace_id_with_name(docs, converter.dict_heroes_abilities_mapper, "Ability", "ability_id")
+    if category == "items":
+      converter.replace_id_with_name(docs, converter.dict_items_mapper, "Item", "item_id")
+    docs_all.extend(docs)
+  return docs_all
+
+def time_conversion(convert, converters):
+  started = time.perf_counter()
+  docs = [convert(converter) for converter in converters]
+  return time.perf_counter() - started, docs
+
+if __name__ == "__main__":
+  registry = get_entity_registry()
+  patch_notes = sorted(p for p in os.listdir("./patchnotes") if p.endswith(".json"))
+  converters = [
+    ConvertPatchNotesToDocuments(
+      patch_note=patch_note,
+      dict_heroes_abilities_mapper=registry.dict_heroes_abilities_mapper,
+      dict_heroes_mapper=registry.dict_heroes_mapper,
+      dict_items_mapper=registry.dict_items_mapper
+    )
+    for patch_note in patch_notes
+  ]
+
+  legacy_seconds, legacy_docs = time_conversion(legacy_convert, converters)
+  native_seconds, native_docs = time_conversion(lambda converter: converter.convert(), converters)
+
+  # The native parser must reproduce the legacy documents exactly (only the source path differs)
+  without_source = lambda metadata: {k: v for k, v in metadata.items() if k != "source"}
+  as_tuples = lambda docs: [[(d.page_content, without_source(d.metadata)) for d in patch_docs] for patch_docs in docs]
+  identical = as_tuples(legacy_docs) == as_tuples(native_docs)
+
+  print(f"Patch files: {len(patch_notes)}, documents: {sum(len(d) for d in native_docs)}, identical output: {identical}")
+  print(f"Legacy (JSONLoader x5 + json.load):   {legacy_seconds:6.2f} s ({legacy_seconds / len(patch_notes) * 1e3:6.1f} ms/patch)")
+  print(f"Native parser + in-memory transforms: {native_seconds:6.2f} s ({native_seconds / len(patch_notes) * 1e3:6.1f} ms/patch)")
+  print(f"Speed-up: {legacy_seconds / native_seconds:.1f}x")
@@ -0,0 +1,333 @@
+# Benchmark: retrieval quality and per-stage latency/memory of one index build on the golden query set
+# (src/benchmarks/golden_queries.json: hero, item, ability, patch, "latest", summary and open questions).
+# Usage: python -m src.benchmarks.retrieval_eval [--chunk-size 1000] [--chunk-overlap 200] [--index-type flat] [--metric l2]
+#          [--dim 256] [--repeat 5] [--output results.json] [--compare baseline.json]
+#        python -m src.benchmarks.retrieval_eval --vectorstore ./vectorstore_faiss   (a saved build; set RAG_EMBEDDING_PROVIDER to its model)
+# Offline and deterministic by default: the real patch-note chunks embedded with the hashing embedder, ~4 chars per token.
+# Relevance is given as metadata/text criteria and resolved to chunk IDs against the evaluated build, so the golden set
+# survives re-chunking. recall@k = relevant chunks in the top k / min(k, relevant chunks); context recall = share of the
+# relevant chunks that fit in the LLM context. Results (with the git commit) are saved as JSON; --compare prints the deltas.
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from collections import defaultdict
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import resource
+import subprocess
+import time
+import numpy as np
+import faiss
+
+from src.api.components import load_retriever
+from src.benchmarks.load_test import ApproxBudget
+from src.benchmarks.startup import memory_mb
+from src.utils.chain_builder import ChainBuilder
+from src.utils.change_table import ChangeTable
+from src.utils.context_budget import MAX_TOKENS
+from src.utils.embedding_cache import CachedEmbeddings
+from src.utils.lexical_index import LexicalIndex
+from src.utils.metadata_store import MetadataStore, row_chunk_ids
+from src.utils.providers import HashingEmbeddings, get_embeddings, hashing_embed
+from src.utils.retriever import FilteredRetriever
+from src.utils.strainer import FilterRetrievedDocuments
+from src.utils.timeline_index import TimelineIndex
+from src.utils.tracing import STAGES, Tracer, span
+from src.vectorstore.conversion import convert_patch_notes, extract_changes, patch_sort_key, version_sort_key
+from src.vectorstore.index_factory import IndexConfig, INDEX_TYPES, ShardedIndex, new_vector_store
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "golden_queries.json")
+KS = (1, 5, 10, 20)
+PERCENTILES = (50, 95, 99)
+# Summary metrics compared by --compare (higher is better for all of them)
+QUALITY_METRICS = ["filter_accuracy", "mrr", "context_recall"] + [f"recall@{k}" for k in KS]
+
+def git_commit():
+  # (commit, uncommitted changes?) of the evaluated tree; (None, None) outside a git checkout
+  try:
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout
+    return commit, bool(status.strip())
+  except (OSError, subprocess.CalledProcessError):
+    return None, None
+
+def build_retriever(chunk_size, chunk_overlap, dim, config):
+  # The app's retriever (hybrid search, timeline index, change table) over an in-memory build
+  patch_notes = sorted((p for p in os.listdir("./patchnotes") if p.endswith(".json")), key=patch_sort_key)
+  docs = [doc for patch_docs in convert_patch_notes(patch_notes).values() for doc in patch_docs]
+  splits = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_documents(docs)
+  vectors = hashing_embed([doc.page_content for doc in splits], dim)
+  vector_store = new_vector_store(HashingEmbeddings(dim), vectors, config)
+  vector_store.add_embeddings(
+    text_embeddings=[(doc.page_content, vector) for doc, vector in zip(splits, vectors)],
+    metadatas=[doc.metadata for doc in splits],
+    ids=[str(idx) for idx in range(len(splits))]
+  )
+  metadata_store = MetadataStore.from_vector_store(vector_store)
+  changes = extract_changes(patch_notes)
+  return FilteredRetriever(
+    vector_store,
+    metadata_store=metadata_store,
+    lexical_index=LexicalIndex.from_vector_store(vector_store),
+    timeline_index=TimelineIndex.from_metadata_store(metadata_store),
+    change_table=ChangeTable.from_records([change for patch_changes in changes.values() for change in patch_changes])
+  )
+
+def corpus_documents(vector_store):
+  # Every chunk in FAISS row order; the columnar docstore decodes them column by column
+  docstore = vector_store.docstore
+  if hasattr(docstore, "documents"):
+    return docstore.documents()
+  return [docstore.search(vector_store.index_to_docstore_id[row]) for row in range(len(vector_store.index_to_docstore_id))]
+
+def latest_version(documents):
+  return max({doc.metadata.get("patch_version") for doc in documents} - {None}, key=version_sort_key)
+
+def resolve_latest(criteria, latest):
+  return {key: latest if value == "latest" else value for key, value in criteria.items()}
+
+def normalize(criteria):
+  # Filter dict with lower-cased values, each as a sorted list, so "items" == ["items"]
+  return {key: sorted(str(value).lower() for value in (values if isinstance(values, list) else [values])) for key, values in criteria.items()}
+
+def is_relevant(doc, criteria):
+  """
+  Whether a chunk matches the golden criteria: every metadata key matches one
+  of its values (case-insensitive) and the text contains every "text" term.
+  """
+  for key, values in criteria.items():
+    if key == "text":
+      if not all(term in doc.page_content.lower() for term in values):
+        return False
+    elif str(doc.metadata.get(key)).lower() not in values:
+      return False
+  return True
+
+def array_bytes(obj, depth=2):
+  # Memory held by an index object: its numpy arrays, also inside dicts/lists (MetadataStore bitmaps, CSR postings)
+  if isinstance(obj, np.ndarray):
+    return 0 if isinstance(obj, np.memmap) else obj.nbytes
+  if depth == 0:
+    return 0
+  if isinstance(obj, dict):
+    return sum(array_bytes(value, depth - 1) for value in obj.values())
+  if isinstance(obj, (list, tuple)):
+    return sum(array_bytes(value, depth - 1) for value in obj[:64]) if obj and isinstance(obj[0], np.ndarray) else 0
+  if hasattr(obj, "__dict__"):
+    return sum(array_bytes(value, depth - 1) for value in vars(obj).values())
+  return 0
+
+def index_memory(retriever, documents):
+  """
+  MB held by the structure each retrieval stage reads (memory-mapped arrays count as 0).
+  """
+  index = retriever.vector_store.index
+  shards = index.shards if isinstance(index, ShardedIndex) else [index]
+  index_bytes = sum(faiss.serialize_index(shard).nbytes for shard in shards)
+  mapped_docstore = hasattr(retriever.vector_store.docstore, "documents")
+  return {
+    "faiss_search": round(index_bytes / 1e6, 3),
+    "straining": round(array_bytes(retriever.metadata_store) / 1e6, 3),
+    "lexical_search": round(array_bytes(retriever.lexical_index) / 1e6, 3),
+    "timeline_lookup": round(array_bytes(retriever.timeline_index) / 1e6, 3),
+    "change_lookup": round(array_bytes(retriever.change_table) / 1e6, 3),
+    "docstore_fetch": 0.0 if mapped_docstore else round(sum(len(doc.page_content.encode("utf-8")) for doc in documents) / 1e6, 3)
+  }
+
+def run_query(query, retriever, budget, tracer):
+  """
+  One question through the app's retrieval path (filters, metadata routes or
+  hybrid search, context assembly), traced per stage without the LLM.
+  Returns:
+      tuple: (dynamic_filter() output, ranked documents, documents packed into the context, stage -> ms)
+  """
+  builder = ChainBuilder(
+    llm_obj=None,
+    strainer_obj=FilterRetrievedDocuments(query),
+    query=query,
+    chat_history=[],
+    vector_store=retriever.vector_store,
+    retriever=retriever,
+    context_budget=budget,
+    tracer=tracer
+  )
+  builder.start_trace()
+  with builder.activate_trace():
+    with span("filter_extraction"):
+      filter_criteria, timeline, aggregate, _ = builder.extract_filters()
+    docs = builder.retrieve(filter_criteria, timeline, aggregate)
+    with span("context_assembly"):
+      budget.build_context(docs)
+  builder.trace.finish()
+  stages = defaultdict(float)
+  for stage, _, seconds in builder.trace.spans:
+    stages[stage] += seconds * 1e3
+  return filter_criteria, docs, budget.pack(docs), dict(stages)
+
+def score(entry, relevant_ids, filter_criteria, docs, packed):
+  n_relevant = len(relevant_ids)
+  hits = [is_relevant(doc, entry["relevant"]) for doc in docs]
+  first = hits.index(True) + 1 if True in hits else None
+  result = {
+    "id": entry["id"],
+    "type": entry["type"],
+    "query": entry["query"],
+    "filters": filter_criteria,
+    "filters_ok": normalize(filter_criteria) == normalize(entry["filters"]),
+    "n_relevant": n_relevant,
+    "n_retrieved": len(docs),
+    "first_relevant_rank": first,
+    "reciprocal_rank": 1 / first if first else 0.0,
+    "context_recall": sum(is_relevant(doc, entry["relevant"]) for doc in packed) / n_relevant if n_relevant else None
+  }
+  for k in KS:
+    result[f"recall@{k}"] = sum(hits[:k]) / min(k, n_relevant) if n_relevant else None
+  result["relevant_chunk_ids"] = relevant_ids
+  return result
+
+def mean(values):
+  values = [value for value in values if value is not None]
+  return round(float(np.mean(values)), 4) if values else None
+
+def summarize_quality(results):
+  return {
+    "queries": len(results),
+    "filter_accuracy": mean([result["filters_ok"] for result in results]),
+    "mrr": mean([result["reciprocal_rank"] for result in results]),
+    "context_recall": mean([result["context_recall"] for result in results]),
+    **{f"recall@{k}": mean([result[f"recall@{k}"] for result in results]) for k in KS}
+  }
+
+def field_accuracy(golden, results):
+  # Per filter key: share of the queries mentioning it (expected or extracted) where the extracted value is right
+  matches = defaultdict(list)
+  for entry, result in zip(golden, results):
+    expected, extracted = normalize(entry["filters"]), normalize(result["filters"])
+    for key in expected.keys() | extracted.keys():
+      matches[key].append(expected.get(key) == extracted.get(key))
+  return {key: mean(values) for key, values in sorted(matches.items())}
+
+def latency_summary(stage_samples):
+  return {
+    stage: {"count": len(stage_samples[stage]), **{f"p{p}": round(float(np.percentile(stage_samples[stage], p)), 3) for p in PERCENTILES}}
+    for stage in STAGES if stage_samples.get(stage)
+  }
+
+def print_report(report):
+  summary = report["quality"]
+  print(f"{'type':<8} | {'n':>3} | {'filters':>7} | {'MRR':>5} | " + " | ".join(f"{'R@' + str(k):>5}" for k in KS) + f" | {'context':>7}")
+  for label, values in [("all", summary), *report["quality_by_type"].items()]:
+    print(f"{label:<8} | {values['queries']:3d} | {values['filter_accuracy']:7.2f} | {values['mrr']:5.2f} | "
+          + " | ".join(f"{values[f'recall@{k}']:5.2f}" for k in KS) + f" | {values['context_recall']:7.2f}")
+  misses = [result["id"] for result in report["queries"] if not result["filters_ok"]]
+  print(f"Filter misses: {', '.join(misses) or 'none'}")
+  print(f"\n{'stage':<18} | {'count':>5} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | {'index MB':>8}")
+  for stage in STAGES:
+    values, memory = report["latency_ms"].get(stage), report["memory_mb"]["stages"].get(stage)
+    if values is None and memory is None:
+      continue
+    latency = f"{values['count']:5d} | {values['p50']:8.3f} | {values['p95']:8.3f} | {values['p99']:8.3f}" if values else f"{0:5d} | {'-':>8} | {'-':>8} | {'-':>8}"
+    print(f"{stage:<18} | {latency} | " + (f"{memory:8.2f}" if memory is not None else f"{'':>8}"))
+  memory = report["memory_mb"]
+  print(f"RSS {memory['rss_before']:.0f} MB before the build, {memory['rss_loaded']:.0f} MB loaded, {memory['rss_after']:.0f} MB after the queries (peak {memory['peak_rss']:.0f} MB)")
+
+def print_comparison(report, baseline):
+  print(f"\nvs. {(baseline['commit'] or 'baseline')[:10]} ({baseline['build']}):")
+  for metric in QUALITY_METRICS:
+    before, after = baseline["quality"].get(metric), report["quality"].get(metric)
+    if before is not None and after is not None:
+      print(f"  {metric:<16} {before:7.3f} -> {after:7.3f} ({after - before:+.3f})")
+  for stage, values in report["latency_ms"].items():
+    before = baseline["latency_ms"].get(stage)
+    if before:
+      print(f"  {stage:<16} p50 {before['p50']:8.3f} -> {values['p50']:8.3f} ms | p95 {before['p95']:8.3f} -> {values['p95']:8.3f} ms")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--golden", default=GOLDEN_PATH)
+  parser.add_argument("--vectorstore", help="Evaluate a saved build instead of building one in memory")
+  parser.add_argument("--chunk-size", type=int, default=1000)
+  parser.add_argument("--chunk-overlap", type=int, default=200)
+  parser.add_argument("--index-type", default="flat", choices=INDEX_TYPES)
+  parser.add_argument("--metric", default="l2", choices=("l2", "ip"))
+  parser.add_argument("--dim", type=int, default=256)
+  parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the golden set (after one untimed pass)")
+  parser.add_argument("--output", help="Results JSON (default: retrieval_eval_<commit>.json)")
+  parser.add_argument("--compare", help="Results JSON of an earlier run to compare against")
+  args = parser.parse_args()
+
+  with open(args.golden, "r", encoding="utf-8") as f:
+    golden = json.load(f)
+  commit, dirty = git_commit()
+  rss_before = memory_mb()[0]
+  started = time.perf_counter()
+  if args.vectorstore:
+    _, retriever = load_retriever(CachedEmbeddings(get_embeddings()), args.vectorstore)
+    build = {"vectorstore": args.vectorstore}
+  else:
+    config = IndexConfig(index_type=args.index_type, metric=args.metric)
+    retriever = build_retriever(args.chunk_size, args.chunk_overlap, args.dim, config)
+    build = {"chunk_size": args.chunk_size, "chunk_overlap": args.chunk_overlap, "index_type": args.index_type, "metric": args.metric, "embedding": f"hashing-{args.dim}"}
+  build_seconds = time.perf_counter() - started
+  rss_loaded = memory_mb()[0]
+  documents = corpus_documents(retriever.vector_store)
+  chunk_ids = list(row_chunk_ids(retriever.vector_store))
+  print(f"Build: {build}, {len(documents)} chunks, ready in {build_seconds:.1f} s")
+
+  # Relevance criteria resolved to chunk IDs of this build; "latest" is the newest indexed patch
+  latest = latest_version(documents)
+  for entry in golden:
+    entry["filters"] = resolve_latest(entry["filters"], latest)
+    entry["relevant"] = normalize(resolve_latest(entry["relevant"], latest))
+  relevant_ids = [
+    [chunk_id for chunk_id, doc in zip(chunk_ids, documents) if is_relevant(doc, entry["relevant"])] for entry in golden
+  ]
+  for entry, ids in zip(golden, relevant_ids):
+    if not ids:
+      print(f"Warning: no chunk of this build is relevant to {entry['id']} ({entry['query']})")
+
+  budget = ApproxBudget(max_tokens=MAX_TOKENS)
+  tracer = Tracer(trace_file=None)
+  results = []
+  for entry, ids in zip(golden, relevant_ids):
+    filter_criteria, docs, packed, _ = run_query(entry["query"], retriever, budget, tracer)
+    results.append(score(entry, ids, filter_criteria, docs, packed))
+  stage_samples = defaultdict(list)
+  for _ in range(args.repeat):
+    for entry in golden:
+      for stage, ms in run_query(entry["query"], retriever, budget, tracer)[3].items():
+        stage_samples[stage].append(ms)
+
+  by_type = defaultdict(list)
+  for result in results:
+    by_type[result["type"]].append(result)
+  report = {
+    "commit": commit,
+    "dirty": dirty,
+    "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    "golden": os.path.relpath(args.golden),
+    "build": build,
+    "corpus": {"chunks": len(documents), "latest_patch": latest, "build_seconds": round(build_seconds, 2)},
+    "quality": summarize_quality(results),
+    "quality_by_type": {kind: summarize_quality(kind_results) for kind, kind_results in by_type.items()},
+    "filter_field_accuracy": field_accuracy(golden, results),
+    "latency_ms": latency_summary(stage_samples),
+    "memory_mb": {
+      "rss_before": round(rss_before, 1),
+      "rss_loaded": round(rss_loaded, 1),
+      "rss_after": round(memory_mb()[0], 1),
+      "peak_rss": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+      "stages": index_memory(retriever, documents)
+    },
+    "queries": results
+  }
+  print_report(report)
+
+  output = args.output or f"retrieval_eval_{(commit or 'local')[:10]}{'-dirty' if dirty else ''}.json"
+  with open(output, "w", encoding="utf-8") as f:
+    json.dump(report, f, indent=2, default=str)
+  print(f"\nResults saved to {output}")
+  if args.compare:
+    with open(args.compare, "r", encoding="utf-8") as f:
+      print_comparison(report, json.load(f))
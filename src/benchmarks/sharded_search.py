@@ -0,0 +1,161 @@
+# Benchmark: sharded vectorstore (RAG_SHARD_BY family | patch) against one monolithic Flat index (none).
+#   search - latency of unfiltered, patch-filtered and recent-patches vector searches, the number of shards
+#            searched, and whether the sharded top-k equals the monolithic top-k exactly
+#   ingest - bytes rewritten vs hard-linked when the newest patch is added to a saved vectorstore (save_atomically)
+# Usage: python -m src.benchmarks.sharded_search [--queries 200] [--k 50] [--dim 384] [--threads 0]
+# Offline: the real patch-note chunks embedded with the hashing embedder.
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import faiss
+
+from src.utils.embedding_cache import CachedEmbeddings
+from src.utils.providers import HashingEmbeddings, hashing_embed
+from src.vectorstore.add_to_vectorstore import save_atomically, shard_of
+from src.vectorstore.conversion import convert_patch_notes, patch_sort_key
+from src.vectorstore.index_factory import IndexConfig, ShardedIndex, new_vector_store, search_index, shard_name
+
+def load_chunks():
+  # Patch note -> chunks, in patch order
+  patch_notes = sorted((p for p in os.listdir("./patchnotes") if p.endswith(".json")), key=patch_sort_key)
+  text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+  return {patch_note: text_splitter.split_documents(docs) for patch_note, docs in convert_patch_notes(patch_notes).items()}
+
+def build_sharded(vectors, row_patches, shard_by, threads):
+  # Rows are in patch order, so every shard holds a contiguous block of global rows
+  names = np.array([shard_name(patch, shard_by) for patch in row_patches])
+  starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+  indexes = []
+  for start, end in zip(starts, np.r_[starts[1:], len(names)]):
+    indexes.append(faiss.IndexFlatL2(vectors.shape[1]))
+    indexes[-1].add(vectors[start:end])
+  return ShardedIndex(names[starts].tolist(), indexes, threads)
+
+def search_cases(row_patches, rng, n_queries):
+  # (name, query row, candidate rows) triples: no filter, the query's patch, and the last 10 patches
+  versions = sorted(set(row_patches), key=patch_sort_key)
+  recent = np.flatnonzero(np.isin(row_patches, versions[-10:]))
+  cases = []
+  for row in rng.choice(len(row_patches), size=n_queries, replace=False):
+    cases.append(("unfiltered", row, None))
+    cases.append(("patch", row, np.flatnonzero(row_patches == row_patches[row])))
+    cases.append(("recent", rng.choice(recent), recent))
+  return cases
+
+def measure_search(monolithic, sharded, vectors, cases, k, rng):
+  noise = 0.05 * vectors.std(axis=0).mean()
+  stats = {}
+  for name, row, ids in cases:
+    query = (vectors[row:row + 1] + rng.normal(0, noise, size=(1, vectors.shape[1]))).astype(np.float32)
+    started = time.perf_counter()
+    expected = search_index(monolithic, query, ids, k)
+    monolithic_ms = (time.perf_counter() - started) * 1e3
+    started = time.perf_counter()
+    found = sharded.search_rows(query, ids, k)
+    sharded_ms = (time.perf_counter() - started) * 1e3
+    case = stats.setdefault(name, {"monolithic": [], "sharded": [], "shards": [], "identical": 0})
+    case["monolithic"].append(monolithic_ms)
+    case["sharded"].append(sharded_ms)
+    case["shards"].append(len(sharded.route(ids)))
+    case["identical"] += bool(np.array_equal(expected[1], found[1]))
+  return stats
+
+def shard_stores(chunks, vectors, positions, patch_notes, config, embeddings):
+  # One in-memory vector store per shard holding the given patch notes
+  stores = {}
+  for patch_note in patch_notes:
+    rows = positions[patch_note]
+    if not len(rows):
+      continue
+    name = shard_of(patch_note, config)
+    if name not in stores:
+      stores[name] = new_vector_store(embeddings, vectors[rows], config)
+    stores[name].add_embeddings(
+      text_embeddings=[(doc.page_content, vector) for doc, vector in zip(chunks[patch_note], vectors[rows])],
+      metadatas=[doc.metadata for doc in chunks[patch_note]],
+      ids=[f"{os.path.splitext(patch_note)[0]}-{idx}" for idx in range(len(rows))]
+    )
+  return stores
+
+def file_inodes(directory):
+  return {
+    os.path.relpath(os.path.join(root, name), directory): os.stat(os.path.join(root, name))
+    for root, _, files in os.walk(directory) for name in files
+  }
+
+def measure_ingest(chunks, vectors, positions, shard_by, directory, embeddings):
+  """
+  Saves every patch but the newest, then adds the newest one the way
+  update_vectorstore does: only its shard is written, the others are linked.
+  Returns:
+      dict: seconds of the incremental save and MB written / linked, shards vs global indexes.
+  """
+  config = IndexConfig(index_type="flat", shard_by=shard_by)
+  patch_notes = list(chunks)
+  manifest = {p: {"sha256": "", "chunk_ids": [f"{os.path.splitext(p)[0]}-{idx}" for idx in range(len(chunks[p]))]} for p in patch_notes}
+  older = {p: manifest[p] for p in patch_notes[:-1]}
+  save_atomically(shard_stores(chunks, vectors, positions, patch_notes[:-1], config, embeddings), older, config, embeddings, directory)
+  before = file_inodes(directory)
+
+  newest_shard = shard_of(patch_notes[-1], config)
+  affected = [p for p in patch_notes if shard_of(p, config) == newest_shard]
+  stores = shard_stores(chunks, vectors, positions, affected, config, embeddings)
+  started = time.perf_counter()
+  save_atomically(stores, manifest, config, embeddings, directory)
+  seconds = time.perf_counter() - started
+
+  result = {"seconds": seconds, "shard": newest_shard, "shards_written": 0.0, "shards_linked": 0.0, "global_written": 0.0}
+  for path, stat in file_inodes(directory).items():
+    linked = path in before and before[path].st_ino == stat.st_ino
+    kind = "global" if not path.startswith("shards") else "shards"
+    key = f"{kind}_{'linked' if linked else 'written'}"
+    result[key] = result.get(key, 0.0) + stat.st_size / 1e6
+  return result
+
+def percentile(values, q):
+  return float(np.percentile(values, q))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--queries", type=int, default=200)
+  parser.add_argument("--k", type=int, default=50)
+  parser.add_argument("--dim", type=int, default=384)
+  parser.add_argument("--threads", type=int, default=0, help="Overrides RAG_SHARD_SEARCH_THREADS.")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  chunks = load_chunks()
+  positions, start = {}, 0
+  for patch_note, docs in chunks.items():
+    positions[patch_note] = np.arange(start, start + len(docs))
+    start += len(docs)
+  row_patches = np.array([os.path.splitext(p)[0] for p, docs in chunks.items() for _ in docs])
+  vectors = hashing_embed([doc.page_content for docs in chunks.values() for doc in docs], args.dim)
+  print(f"Corpus: {len(vectors)} chunks from {len(chunks)} patch notes, hashing embedder ({args.dim} dims)")
+
+  monolithic = faiss.IndexFlatL2(args.dim)
+  monolithic.add(vectors)
+  print(f"{'shard by':<8} | {'shards':>6} | {'search':<10} | {'searched':>8} | {'mono p50 ms':>11} | {'shard p50 ms':>12} | "
+        f"{'mono p95 ms':>11} | {'shard p95 ms':>12} | {'identical':>9}")
+  for shard_by in ("family", "patch"):
+    sharded = build_sharded(vectors, row_patches, shard_by, args.threads)
+    rng = np.random.default_rng(args.seed)
+    stats = measure_search(monolithic, sharded, vectors, search_cases(row_patches, rng, args.queries), args.k, rng)
+    for name, case in stats.items():
+      print(f"{shard_by:<8} | {len(sharded.shards):>6} | {name:<10} | {np.mean(case['shards']):8.1f} | "
+            f"{percentile(case['monolithic'], 50):11.3f} | {percentile(case['sharded'], 50):12.3f} | "
+            f"{percentile(case['monolithic'], 95):11.3f} | {percentile(case['sharded'], 95):12.3f} | "
+            f"{case['identical']:>4}/{len(case['sharded']):<4}")
+
+  print(f"\nAdding {list(chunks)[-1]} to a saved vectorstore (MB)")
+  print(f"{'shard by':<8} | {'shard':>6} | {'shards written':>14} | {'shards linked':>13} | {'global written':>14} | {'save s':>6}")
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    embeddings = CachedEmbeddings(HashingEmbeddings(args.dim), cache_path=os.path.join(tmp_dir, "embedding_cache"))
+    for shard_by in ("none", "family", "patch"):
+      result = measure_ingest(chunks, vectors, positions, shard_by, os.path.join(tmp_dir, shard_by), embeddings)
+      print(f"{shard_by:<8} | {result['shard']:>6} | {result['shards_written']:14.1f} | {result['shards_linked']:13.1f} | "
+            f"{result['global_written']:14.1f} | {result['seconds']:6.2f}")
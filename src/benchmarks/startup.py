@@ -0,0 +1,120 @@
+# Benchmark: app startup time and per-worker memory for each way of loading the vectorstore:
+#   pickle   - the former FAISS.save_local/load_local format (index.pkl)
+#   columnar - load_vector_store: columnar docstore decoded into memory (what ingest uses)
+#   mmap     - load_serving_store: memory-mapped index and docstore (what the app uses)
+# Usage: python -m src.benchmarks.startup [--workers 4] [--scale 1] [--vectorstore ./vectorstore_faiss]
+# Without a saved vectorstore, one is built in a temporary directory from the real patch-note chunks
+# (hashing embedder, --dim dimensions; --scale repeats the corpus to model larger indexes).
+# RSS counts shared pages in every worker; PSS splits them between the workers that share them.
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import numpy as np
+
+from src.utils.metadata_store import MetadataStore
+from src.utils.providers import hashing_embed
+from src.utils.retriever import FilteredRetriever
+from src.vectorstore.conversion import convert_patch_notes, patch_sort_key
+from src.vectorstore.disk_store import load_serving_store, load_vector_store, save_vector_store
+from src.vectorstore.index_factory import IndexConfig, new_vector_store, save_index_config
+
+def memory_mb():
+  # (RSS, PSS) of this process
+  values = {}
+  with open("/proc/self/smaps_rollup", "r") as f:
+    for line in f:
+      parts = line.split()
+      if parts[0] in ("Rss:", "Pss:"):
+        values[parts[0]] = int(parts[1]) / 1024
+  return values.get("Rss:", 0.0), values.get("Pss:", 0.0)
+
+def build_vectorstore(directory, dim, scale):
+  patch_notes = sorted((p for p in os.listdir("./patchnotes") if p.endswith(".json")), key=patch_sort_key)
+  docs = [doc for patch_docs in convert_patch_notes(patch_notes).values() for doc in patch_docs]
+  splits = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(docs)
+  vectors = hashing_embed([doc.page_content for doc in splits], dim)
+  vector_store = new_vector_store(DeterministicFakeEmbedding(size=dim), vectors)
+  for copy in range(scale):
+    vector_store.add_embeddings(
+      text_embeddings=[(doc.page_content, vector) for doc, vector in zip(splits, vectors)],
+      metadatas=[doc.metadata for doc in splits],
+      ids=[f"{copy}-{idx}" for idx in range(len(splits))]
+    )
+  save_vector_store(vector_store, directory)
+  MetadataStore.from_vector_store(vector_store).save(directory)
+  save_index_config(IndexConfig(), directory)
+  return vector_store
+
+def worker(mode, directory, legacy_directory, dim, barrier, results):
+  started = time.perf_counter()
+  embeddings = DeterministicFakeEmbedding(size=dim)
+  if mode == "pickle":
+    vector_store = FAISS.load_local(legacy_directory, embeddings, allow_dangerous_deserialization=True)
+  elif mode == "columnar":
+    vector_store = load_vector_store(directory, embeddings)
+  else:
+    vector_store = load_serving_store(directory, embeddings)
+  # The metadata store comes from the same directory in every mode
+  retriever = FilteredRetriever(vector_store, metadata_store=MetadataStore.load_or_build(vector_store, directory))
+  load_seconds = time.perf_counter() - started
+  rss_loaded, _ = memory_mb()
+
+  # A few filtered and unfiltered searches, as the first chats would run
+  rng = np.random.default_rng(os.getpid())
+  query_started = time.perf_counter()
+  for filters in ({}, {"patch_version": "7.36"}, {"hero_id": "Axe"}, {"category": "items"}):
+    vector = rng.random((1, dim), dtype=np.float32)
+    retriever.search_by_vector(vector, filters, k=50)
+  query_seconds = time.perf_counter() - query_started
+
+  # Measure while every worker is alive so shared pages are split between them
+  barrier.wait()
+  rss, pss = memory_mb()
+  results.put((mode, load_seconds, query_seconds, rss_loaded, rss, pss))
+  barrier.wait()
+
+def run_workers(mode, directory, legacy_directory, dim, n_workers):
+  context = multiprocessing.get_context("spawn")
+  barrier = context.Barrier(n_workers)
+  results = context.Queue()
+  processes = [context.Process(target=worker, args=(mode, directory, legacy_directory, dim, barrier, results)) for _ in range(n_workers)]
+  for process in processes:
+    process.start()
+  rows = [results.get() for _ in processes]
+  for process in processes:
+    process.join()
+  return rows
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--workers", type=int, default=4)
+  parser.add_argument("--vectorstore", default="./vectorstore_faiss")
+  parser.add_argument("--dim", type=int, default=1536, help="Embedding dimension of the temporary vectorstore")
+  parser.add_argument("--scale", type=int, default=1, help="Copies of the corpus in the temporary vectorstore")
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    directory = args.vectorstore
+    if os.path.exists(os.path.join(directory, "index.faiss")):
+      vector_store = load_vector_store(directory, DeterministicFakeEmbedding(size=1))
+    else:
+      directory = os.path.join(tmp_dir, "columnar")
+      vector_store = build_vectorstore(directory, args.dim, args.scale)
+    # The former pickled format, for comparison
+    legacy_directory = os.path.join(tmp_dir, "legacy")
+    vector_store.save_local(legacy_directory)
+    dim = vector_store.index.d
+    print(f"Vectorstore {directory}: {vector_store.index.ntotal} chunks, {dim} dims, {args.workers} workers per mode")
+    del vector_store
+
+    print(f"{'mode':<8} | {'load s':>7} | {'4 queries ms':>12} | {'RSS loaded MB':>13} | {'RSS MB':>7} | {'PSS MB':>7}")
+    for mode in ("pickle", "columnar", "mmap"):
+      rows = run_workers(mode, directory, legacy_directory, dim, args.workers)
+      load_seconds, query_seconds, rss_loaded, rss, pss = np.mean([row[1:] for row in rows], axis=0)
+      print(f"{mode:<8} | {load_seconds:7.2f} | {query_seconds * 1e3:12.1f} | {rss_loaded:13.1f} | {rss:7.1f} | {pss:7.1f}")
@@ -0,0 +1,76 @@
+# Benchmark: metadata-only retrieval (bitmap intersection) vs. filtered vector search, on the in-memory
+# Flat index and on its memory-mapped copy (the one-list IVF-Flat the app serves)
+# Usage: python -m src.benchmarks.structured_retrieval [--patches 20]
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from src.benchmarks.load_test import ApproxBudget
+from src.utils.metadata_store import MetadataStore
+from src.utils.retriever import FilteredRetriever
+from src.utils.strainer import FilterRetrievedDocuments
+from src.vectorstore.conversion import convert_patch_notes, patch_sort_key
+from src.vectorstore.disk_store import load_serving_store, save_vector_store
+
+QUERIES = [
+  "All Axe talent changes in 7.36",
+  "What changed for Pudge abilities in 7.37",
+  "Was Blink Dagger changed in 7.35?",
+  "Show the base stat changes for Sniper in 7.34",
+  "What happened to Invoker?",
+  "Summarize the latest patch updates",
+  "Which items changed in 7.38?",
+]
+
+def time_per_query(fn, repeat):
+  started = time.perf_counter()
+  for _ in range(repeat):
+    fn()
+  return (time.perf_counter() - started) / repeat * 1e3
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--patches", type=int, default=20, help="Latest N patches to index")
+  parser.add_argument("--repeat", type=int, default=20)
+  args = parser.parse_args()
+
+  patch_notes = sorted(os.listdir("./patchnotes"), key=patch_sort_key)[-args.patches:]
+  docs = [doc for patch_docs in convert_patch_notes(patch_notes).values() for doc in patch_docs]
+  splits = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(docs)
+  vector_store = FAISS.from_documents(splits, DeterministicFakeEmbedding(size=256))
+
+  # Round-trip through the on-disk format written at ingest; the app searches the memory-mapped copy
+  directory = tempfile.mkdtemp()
+  save_vector_store(vector_store, directory)
+  MetadataStore.from_vector_store(vector_store).save(directory)
+  metadata_store = MetadataStore.load_or_build(vector_store, directory)
+  retriever = FilteredRetriever(vector_store, metadata_store=metadata_store)
+  serving_retriever = FilteredRetriever(load_serving_store(directory, vector_store.embedding_function), metadata_store=metadata_store)
+  budget = ApproxBudget()
+  all_docs = retriever.get_documents(range(vector_store.index.ntotal))
+  print(f"{len(splits)} chunks from {len(patch_notes)} patches")
+
+  for query in QUERIES:
+    strainer = FilterRetrievedDocuments(query)
+    filters = strainer.dynamic_filter()
+    # The bitmap selection must match the original metadata strainer
+    expected = {doc.id for doc in strainer.get_filtered_docs(all_docs)} if filters else None
+    ids = retriever.candidate_ids(filters)
+    selected = None if ids is None else {doc.id for doc in retriever.get_documents(ids)}
+    structured = retriever.structured_search(filters, budget)
+    vector_ms = time_per_query(lambda: retriever.search(query, filters, k=1000), args.repeat)
+    # FAISS alone (no docstore fetch): the candidate-subset search must scale the same on the memory-mapped index
+    vector = retriever.embed_query(query)
+    faiss_ms = time_per_query(lambda: retriever.vector_rows(vector, ids, 1000), args.repeat)
+    mmap_ms = time_per_query(lambda: serving_retriever.vector_rows(vector, ids, 1000), args.repeat)
+    path = "vector" if structured is None else "structured"
+    structured_ms = time_per_query(lambda: retriever.structured_search(filters, budget), args.repeat)
+    print(f"{query[:45]:<45} | {path:<10} | {0 if ids is None else ids.size:5d} chunks | same set: {selected == expected} | "
+          f"structured {structured_ms:7.2f} ms | vector {vector_ms:7.2f} ms | FAISS {faiss_ms:6.3f} ms, mmap {mmap_ms:6.3f} ms")
+  shutil.rmtree(directory, ignore_errors=True)
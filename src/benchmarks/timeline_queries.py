@@ -0,0 +1,143 @@
+# Benchmark: range questions about one entity ("since 7.30", "between", "last N patches")
+# served from the timeline index vs. the former path (the first version in the question as a
+# patch filter, then metadata or 1000-NN vector retrieval).
+# Usage: python -m src.benchmarks.timeline_queries [--repeat 20] [--dim 256]
+# Recall is measured against a full scan of the chunk metadata; every ability timeline is also checked
+# against the patches whose hero records in the raw JSON change that ability.
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import argparse
+import orjson
+import os
+import time
+
+from src.benchmarks.load_test import ApproxBudget
+from src.utils.metadata_store import MetadataStore
+from src.utils.providers import hashing_embed
+from src.utils.registry import get_entity_registry
+from src.utils.retriever import FilteredRetriever
+from src.utils.strainer import FilterRetrievedDocuments
+from src.utils.timeline_index import TimelineIndex, ENTITY_FIELDS
+from src.utils.transforms import apply_transforms
+from src.vectorstore.conversion import convert_patch_notes, patch_sort_key, version_sort_key
+from src.vectorstore.index_factory import new_vector_store
+
+QUERIES = [
+  "How has Pudge changed since 7.30?",
+  "Invoker changes between 7.33 and 7.35",
+  "What happened to Axe in the last 3 patches?",
+  "How did Blink Dagger change since 7.32?",
+  "How has pudge meat hook changed since 7.30?",
+  "Sniper talent changes since 7.34",
+  "Io changes from 7.25 to 7.28",
+]
+
+def build_retriever(dim):
+  patch_notes = sorted((p for p in os.listdir("./patchnotes") if p.endswith(".json")), key=patch_sort_key)
+  docs = [doc for patch_docs in convert_patch_notes(patch_notes).values() for doc in patch_docs]
+  splits = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(docs)
+  vectors = hashing_embed([doc.page_content for doc in splits], dim)
+  vector_store = new_vector_store(DeterministicFakeEmbedding(size=dim), vectors)
+  vector_store.add_embeddings(
+    text_embeddings=[(doc.page_content, vector) for doc, vector in zip(splits, vectors)],
+    metadatas=[doc.metadata for doc in splits],
+    ids=[str(idx) for idx in range(len(splits))]
+  )
+  metadata_store = MetadataStore.from_vector_store(vector_store)
+  started = time.perf_counter()
+  timeline_index = TimelineIndex.from_metadata_store(metadata_store)
+  print(f"Corpus: {len(splits)} chunks; timeline of {len(timeline_index.keys)} entities compiled in {(time.perf_counter() - started) * 1e3:.1f} ms")
+  # Docstore documents carry no row, so results are mapped back by identity
+  docstore = vector_store.docstore
+  rows = {id(docstore.search(doc_id)): row for row, doc_id in vector_store.index_to_docstore_id.items()}
+  return FilteredRetriever(vector_store, metadata_store=metadata_store, timeline_index=timeline_index), splits, rows, patch_notes
+
+def entity_values(doc, field):
+  # Lower-cased entity names of a chunk; list fields (ability_ids) hold several, older chunks only ability_id
+  value = doc.metadata.get(field, doc.metadata.get(field.removesuffix("s"), ""))
+  return {str(v).lower() for v in (value if isinstance(value, list) else [value])}
+
+def expected_ids(splits, timeline, filter_criteria, patch_versions):
+  # Full scan: chunks of the entity whose patch falls in the range (and in the category filter)
+  field = ENTITY_FIELDS[timeline["entity_kind"]]
+  versions = sorted(patch_versions, key=version_sort_key)
+  in_range = set(versions[-timeline["last_n"]:] if timeline.get("last_n") else versions)
+  if timeline.get("since"):
+    in_range = {v for v in in_range if version_sort_key(v) >= version_sort_key(timeline["since"])}
+  if timeline.get("until"):
+    in_range = {v for v in in_range if version_sort_key(v) <= version_sort_key(timeline["until"]) + ((2, ""),)}
+  categories = filter_criteria.get("category")
+  categories = None if categories is None else set(categories if isinstance(categories, list) else [categories])
+  return {
+    idx for idx, doc in enumerate(splits)
+    if timeline["entity"] in entity_values(doc, field)
+    and doc.metadata.get("patch_version") in in_range
+    and (categories is None or doc.metadata.get("category") in categories)
+  }
+
+def ability_patches(patch_notes):
+  # Raw JSON: lower-cased ability name -> patch versions whose (normalized) hero records change it
+  mapper = get_entity_registry().dict_heroes_abilities_mapper
+  patches = {}
+  for patch_note in patch_notes:
+    with open(os.path.join("./patchnotes", patch_note), "rb") as f:
+      patch_data = apply_transforms(orjson.loads(f.read()))
+    for hero in patch_data.get("heroes") or []:
+      for ability in hero.get("abilities", []):
+        name = str(mapper.get(str(ability["ability_id"]), ability["ability_id"])).lower()
+        patches.setdefault(name, set()).add(os.path.splitext(patch_note)[0])
+  return patches
+
+def check_ability_timelines(retriever, splits, patch_notes):
+  """
+  Compares the patches of every ability timeline with the patches whose JSON touches the ability.
+  Returns:
+      list: (ability, patches missing from the timeline, patches only in the timeline) of each mismatch.
+  """
+  timeline_index = retriever.timeline_index
+  mismatches = []
+  for name, expected in ability_patches(patch_notes).items():
+    rows = timeline_index.lookup("ability", name)
+    found = set() if rows is None else {splits[row].metadata["patch_version"] for row in rows.tolist()}
+    if found != expected:
+      mismatches.append((name, sorted(expected - found, key=version_sort_key), sorted(found - expected, key=version_sort_key)))
+  return mismatches
+
+def time_per_query(fn, repeat):
+  started = time.perf_counter()
+  for _ in range(repeat):
+    result = fn()
+  return (time.perf_counter() - started) / repeat * 1e3, result
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--repeat", type=int, default=20)
+  parser.add_argument("--dim", type=int, default=256)
+  args = parser.parse_args()
+
+  retriever, splits, rows, patch_notes = build_retriever(args.dim)
+  mismatches = check_ability_timelines(retriever, splits, patch_notes)
+  print(f"Ability timelines vs raw JSON: {len(mismatches)} abilities with mismatched patches")
+  for name, missing, extra in mismatches[:10]:
+    print(f"  {name}: missing {missing}, extra {extra}")
+  budget = ApproxBudget()
+  patch_versions = {doc.metadata["patch_version"] for doc in splits}
+  print(f"{'query':<45} | {'chunks':>6} | {'timeline ms':>11} | {'recall':>6} | {'former ms':>9} | {'recall':>6}")
+  for query in QUERIES:
+    strainer = FilterRetrievedDocuments(query)
+    filter_criteria, timeline = strainer.dynamic_filter(), strainer.timeline_filter()
+    expected = expected_ids(splits, timeline, filter_criteria, patch_versions)
+
+    timeline_ms, docs = time_per_query(lambda: retriever.timeline_search(timeline, filter_criteria, budget), args.repeat)
+    timeline_recall = len({rows[id(doc)] for doc in docs} & expected) / max(len(expected), 1)
+
+    # Former behaviour: the first version mentioned became a single-patch filter
+    former_filters = dict(filter_criteria)
+    if timeline.get("since"):
+      former_filters["patch_version"] = timeline["since"]
+    vector = hashing_embed([query], args.dim)
+    former = lambda: retriever.structured_search(former_filters, budget) or [doc for doc, _ in retriever.search_by_vector(vector, former_filters, k=1000)]
+    former_ms, former_docs = time_per_query(former, args.repeat)
+    former_recall = len({rows[id(doc)] for doc in former_docs} & expected) / max(len(expected), 1)
+    print(f"{query:<45} | {len(expected):6d} | {timeline_ms:11.2f} | {timeline_recall:6.2f} | {former_ms:9.2f} | {former_recall:6.2f}")
@@ -1,64 +1,28 @@
+# Optional debug dump: writes the normalized patch notes to ./patchnotes_modified.
+# Ingest no longer reads these files; ConvertPatchNotesToDocuments applies the
+# same transforms in memory (see src/utils/transforms.py).
+from concurrent.futures import ProcessPoolExecutor
 import os
 import json
-import numpy as np
+
+from src.utils.transforms import apply_transforms
 
 folder_path = './patchnotes'
 list_patch_notes = os.listdir(folder_path)
 
-def add_default_hero_values(data):
-    for hero in data.get("heroes", []):
-        # Add default talent_notes if not present
-        if "talent_notes" not in hero:
-            hero["talent_notes"] = ["Changes in talent: None"]
-        else:
-            for talent in hero["talent_notes"]:
-                if "note" in talent:
-                    talent["note"] = "The following are the changes in the hero's talent: " + talent["note"]
-
-        if "hero_notes" not in hero:
-            hero["hero_notes"] = ["Changes in base or general stats: None"]
-        else:
-            for hero_note in hero["hero_notes"]:
-                if "note" in hero_note:
-                    hero_note["note"] = "The following are the changes in the hero's base or general stats: " + hero_note["note"]
-
-        if "abilities" not in hero:
-            hero["abilities"] = []
-        else:
-            for ability in hero.get("abilities", []):
-                for ability_note in ability.get("ability_notes", []):
-                    if "note" in ability_note:
-                        ability_note["note"] = "The following are the changes in the hero's ability: " + ability_note["note"]
-
-
-
-        # Handle subsections for facets
-        if "subsections" in hero:
-            for subsection in hero["subsections"]:
-                facet_title = subsection.get("title", "")
-
-                # Handle abilities if present
-                for ability in subsection.get("abilities", []):
-                    hero["abilities"].append({
-                        "ability_id": ability.get("ability_id", np.nan),
-                        "ability_notes": [
-                            {**note, "facet": facet_title} for note in ability.get("ability_notes", [])
-                        ]
-                    })
-
-                # Handle general_notes if present
-                for note in subsection.get("general_notes", []):
-                    hero["hero_notes"].append({**note, "facet": facet_title})
-
-            # Remove subsections after processing
-            del hero["subsections"]
-
-for patch_note in list_patch_notes:
+def modify_patch_note(patch_note):
     # Load original
     with open(f"./patchnotes/{patch_note}", 'r') as file:
         json_data = json.load(file)
-    add_default_hero_values(json_data)
+    apply_transforms(json_data)
     # Save the modified
     with open(f"./patchnotes_modified/{patch_note}", 'w') as f:
         json.dump(json_data, f)
-        print(f"Modified {patch_note}")
+    return patch_note
+
+if __name__ == "__main__":
+    os.makedirs("./patchnotes_modified", exist_ok=True)
+    # Files are independent, so rewrite them across a process pool
+    with ProcessPoolExecutor() as executor:
+        for patch_note in executor.map(modify_patch_note, list_patch_notes):
+            print(f"Modified {patch_note}")
@@ -0,0 +1,203 @@
+import numpy as np
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+ANSWER_CACHE_DB = "./answer_cache.db"
+VECTORSTORE_PATH = "./vectorstore_faiss"
+INDEX_FILES = ("index.faiss", "docstore/header.json", "shards.json", "manifest.json")
+
+def normalize_query(query: str) -> str:
+  # Case, spacing and trailing punctuation don't change the question
+  return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+
+def filters_key(filter_criteria: dict) -> str:
+  return json.dumps(filter_criteria, sort_keys=True, default=str)
+
+def index_version(vectorstore_path=VECTORSTORE_PATH) -> str:
+  """
+  Hash of the saved index files' size and modification time. Every rebuild
+  (add_to_vectorstore swaps in a new directory) yields a new version.
+  """
+  signature = []
+  for name in INDEX_FILES:
+    path = os.path.join(vectorstore_path, name)
+    if os.path.exists(path):
+      stat = os.stat(path)
+      signature.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+  return hashlib.sha256("|".join(signature).encode("utf-8")).hexdigest()[:16]
+
+class AnswerCache:
+  """
+  Two-tier answer cache placed in front of the RAG chain, persisted in SQLite.
+  - Exact tier: keyed by (normalized query, dynamic_filter() output, index version).
+  - Near-duplicate tier: a cached answer with the same filters whose query
+    embedding has cosine similarity >= similarity_threshold.
+  Entries expire after ttl_seconds; beyond max_entries the least recently used
+  are evicted. All entries are dropped when the FAISS index is rebuilt.
+  """
+
+  def __init__(self, db_path=ANSWER_CACHE_DB, vectorstore_path=VECTORSTORE_PATH, ttl_seconds=86400, max_entries=10000, similarity_threshold=0.95):
+    self.vectorstore_path = vectorstore_path
+    self.ttl_seconds = ttl_seconds
+    self.max_entries = max_entries
+    self.similarity_threshold = similarity_threshold
+    self.hits = {"exact": 0, "similar": 0}
+    self.misses = 0
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(db_path, check_same_thread=False)
+    self.connection.execute("""
+      CREATE TABLE IF NOT EXISTS answers (
+        key TEXT PRIMARY KEY,
+        index_version TEXT NOT NULL,
+        filters TEXT NOT NULL,
+        query TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        embedding BLOB,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL
+      )
+    """)
+    self.connection.commit()
+    self.version = None
+    # Near-duplicate tier: normalized query embeddings grouped by filters, kept in memory
+    self.vectors = {}
+    self.check_version()
+
+  @staticmethod
+  def make_key(query, filter_criteria, version):
+    raw = json.dumps([normalize_query(query), filters_key(filter_criteria), version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+  @staticmethod
+  def unit_vector(vector):
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+  def check_version(self):
+    """
+    Drops every entry of an older index version and reloads the in-memory
+    embeddings. Cheap (a few stat calls), so it runs on every lookup.
+    """
+    version = index_version(self.vectorstore_path)
+    if version == self.version:
+      return
+    with self.lock:
+      self.connection.execute("DELETE FROM answers WHERE index_version != ?", (version,))
+      self.connection.commit()
+      self.version = version
+      self.vectors = {}
+      rows = self.connection.execute("SELECT key, filters, embedding FROM answers WHERE embedding IS NOT NULL").fetchall()
+      for key, filters, embedding in rows:
+        self.add_vector(filters, key, np.frombuffer(embedding, dtype=np.float32))
+
+  def add_vector(self, filters, key, vector):
+    keys, matrix = self.vectors.get(filters, ([], np.empty((0, vector.shape[0]), dtype=np.float32)))
+    if key in keys:
+      return
+    self.vectors[filters] = (keys + [key], np.vstack([matrix, vector]))
+
+  def remove_vectors(self, keys):
+    removed = set(keys)
+    for filters, (group_keys, matrix) in list(self.vectors.items()):
+      keep = [i for i, key in enumerate(group_keys) if key not in removed]
+      if len(keep) != len(group_keys):
+        self.vectors[filters] = ([group_keys[i] for i in keep], matrix[keep])
+
+  def fetch(self, key):
+    # Returns the live answer for key and refreshes its LRU position, or None
+    now = time.time()
+    row = self.connection.execute("SELECT answer, created_at FROM answers WHERE key = ?", (key,)).fetchone()
+    if row is None:
+      return None
+    if now - row[1] > self.ttl_seconds:
+      self.connection.execute("DELETE FROM answers WHERE key = ?", (key,))
+      self.connection.commit()
+      self.remove_vectors([key])
+      return None
+    self.connection.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+    self.connection.commit()
+    return row[0]
+
+  def get(self, query: str, filter_criteria: dict):
+    """
+    Exact tier lookup.
+    Returns:
+        str | None: The cached answer.
+    """
+    self.check_version()
+    with self.lock:
+      answer = self.fetch(self.make_key(query, filter_criteria, self.version))
+    if answer is not None:
+      self.hits["exact"] += 1
+    return answer
+
+  def get_similar(self, vector, filter_criteria: dict):
+    """
+    Near-duplicate tier lookup: the most similar cached query with the same filters.
+    Returns:
+        str | None: The cached answer.
+    """
+    self.check_version()
+    query_vector = self.unit_vector(vector)
+    with self.lock:
+      keys, matrix = self.vectors.get(filters_key(filter_criteria), ([], None))
+      if not keys or matrix.shape[1] != query_vector.shape[0]:
+        answer = None
+      else:
+        similarities = matrix @ query_vector
+        best = int(np.argmax(similarities))
+        answer = self.fetch(keys[best]) if similarities[best] >= self.similarity_threshold else None
+    if answer is not None:
+      self.hits["similar"] += 1
+    else:
+      self.misses += 1
+    return answer
+
+  def lookup(self, query: str, filter_criteria: dict, embed_query):
+    """
+    Exact tier first, then the near-duplicate tier (embed_query is only called on an exact miss).
+    Returns:
+        tuple: (answer or None, query embedding or None)
+    """
+    answer = self.get(query, filter_criteria)
+    if answer is not None:
+      return answer, None
+    vector = embed_query(query)
+    return self.get_similar(vector, filter_criteria), vector
+
+  def put(self, query: str, filter_criteria: dict, answer: str, vector=None):
+    self.check_version()
+    now = time.time()
+    key = self.make_key(query, filter_criteria, self.version)
+    filters = filters_key(filter_criteria)
+    unit = None if vector is None else self.unit_vector(vector)
+    with self.lock:
+      self.connection.execute(
+        "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (key, self.version, filters, normalize_query(query), answer, None if unit is None else unit.tobytes(), now, now)
+      )
+      if unit is not None:
+        self.add_vector(filters, key, unit)
+      self.evict(now)
+      self.connection.commit()
+
+  def evict(self, now):
+    # Expired entries first, then the least recently used beyond max_entries
+    expired = [key for (key,) in self.connection.execute("SELECT key FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))]
+    overflow = [key for (key,) in self.connection.execute(
+      "SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+    )]
+    stale = set(expired + overflow)
+    if stale:
+      self.connection.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in stale])
+      self.remove_vectors(stale)
+
+  def stats(self):
+    (entries,) = self.connection.execute("SELECT COUNT(*) FROM answers").fetchone()
+    return {"index_version": self.version, "entries": entries, "hits": dict(self.hits), "misses": self.misses}
@@ -1,16 +1,34 @@
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from contextlib import nullcontext
+import asyncio
+import time
+
+from src.utils.retriever import FilteredRetriever
+from src.utils.context_budget import ContextBudget
+from src.utils.tracing import span, sampled_log
 
 class ChainBuilder:
 
-  def __init__(self, llm_obj, strainer_obj, query, chat_history, vector_store):
+  def __init__(self, llm_obj, strainer_obj, query, chat_history, vector_store, retriever=None, context_budget=None, answer_cache=None, tracer=None):
     self.llm = llm_obj
     self.strainer = strainer_obj
     self.query = query
     self.chat_history = chat_history
     self.vector_store = vector_store
+    # Build the filtered retriever once at startup and pass it in; building it here re-indexes the docstore
+    self.retriever = retriever or FilteredRetriever(vector_store)
+    self.context_budget = context_budget or ContextBudget()
+    # Optional AnswerCache: repeated and near-duplicate questions skip retrieval and the LLM
+    self.answer_cache = answer_cache
+    # Filled in by stream()/astream(): seconds since the request started
+    self.timings = {}
+    # Optional Tracer: per-stage spans of each request, exported as Prometheus histograms / JSONL
+    self.tracer = tracer
+    self.trace = None
 
-  def build_rag_chain(self):
+  def build_prompt(self):
       template = """
       You are an assistant for DOTA2 patch notes queries.
       ONLY use the provided context below to answer the question.
@@ -26,25 +44,271 @@ class ChainBuilder:
           template=template,
           input_variables=["context", "question"]
       )
+      return prompt
+
+  def build_rag_chain(self):
       # Create the chain
       rag_chain = LLMChain(
           llm=self.llm,
-          prompt=prompt
+          prompt=self.build_prompt()
       )
       return rag_chain
-  
+
+  def build_stream_chain(self):
+      # LLMChain only returns the finished text; the runnable pipeline yields the model's tokens
+      return self.build_prompt() | self.llm | StrOutputParser()
+
+  def lookup_answer(self, filter_criteria):
+      """
+      Returns:
+          tuple: (cached answer or None, query embedding computed for the near-duplicate tier or None)
+      """
+      if self.answer_cache is None:
+          return None, None
+      return self.answer_cache.lookup(self.query, filter_criteria, self.retriever.embed_query)
+
+  async def alookup_answer(self, filter_criteria):
+      # SQLite reads and the index version check run in a worker thread, off the event loop
+      if self.answer_cache is None:
+          return None, None
+      answer = await asyncio.to_thread(self.answer_cache.get, self.query, filter_criteria)
+      if answer is not None:
+          return answer, None
+      vector = await self.retriever.aembed_query(self.query)
+      return await asyncio.to_thread(self.answer_cache.get_similar, vector, filter_criteria), vector
+
+  def store_answer(self, filter_criteria, answer, vector):
+      if self.answer_cache is not None:
+          self.answer_cache.put(self.query, filter_criteria, answer, vector)
+
+  async def astore_answer(self, filter_criteria, answer, vector):
+      if self.answer_cache is not None:
+          await asyncio.to_thread(self.answer_cache.put, self.query, filter_criteria, answer, vector)
+
+  def retrieve_from_metadata(self, filter_criteria, timeline=None, aggregate=None):
+      """
+      Retrieval that needs no query embedding: aggregates over numeric changes come
+      from the change table, range questions about one entity from the timeline index,
+      and fully filtered questions that fit the budget from metadata.
+      Returns:
+          list | None: The documents, or None when a vector search is needed.
+      """
+      if aggregate is not None:
+          docs = self.retriever.change_search(aggregate, self.context_budget)
+          if docs is not None:
+              return docs
+      if timeline is not None:
+          docs = self.retriever.timeline_search(timeline, filter_criteria, self.context_budget)
+          if docs is not None:
+              return docs
+      return self.retriever.structured_search(filter_criteria, self.context_budget)
+
+  def retrieve(self, filter_criteria, timeline=None, aggregate=None):
+      docs = self.retrieve_from_metadata(filter_criteria, timeline, aggregate)
+      if docs is not None:
+          return docs
+      # Otherwise exact top-k over the filtered subset
+      return self.retriever.search(self.query, filter_criteria, k=1000)
+
+  async def aretrieve(self, filter_criteria, timeline=None, aggregate=None):
+      docs = await asyncio.to_thread(self.retrieve_from_metadata, filter_criteria, timeline, aggregate)
+      if docs is not None:
+          return docs
+      return await self.retriever.asearch(self.query, filter_criteria, k=1000)
+
+  def start_trace(self):
+      self.trace = self.tracer.start(query_chars=len(self.query)) if self.tracer is not None else None
+
+  def activate_trace(self):
+      # span() calls made by the retriever are recorded on this request's trace
+      return self.trace.activate() if self.trace is not None else nullcontext()
+
+  def record_span(self, stage, seconds):
+      if self.trace is not None:
+          self.trace.record(stage, seconds)
+
+  def finish_trace(self, filter_criteria, cached, error=None):
+      # Runs on every exit, so failed and abandoned requests are exported with the spans they reached
+      if self.trace is not None:
+          self.trace.finish(filters=filter_criteria, cached=cached, error=error)
+
+  def extract_filters(self):
+      """
+      Returns:
+          tuple: (dynamic_filter() output, timeline_filter() output or None, aggregate_filter()
+                  output or None, the filters keying the answer cache, which include both)
+      """
+      filter_criteria = self.strainer.dynamic_filter()
+      timeline = self.strainer.timeline_filter()
+      aggregate = self.strainer.aggregate_filter()
+      cache_filters = dict(filter_criteria)
+      if timeline:
+          cache_filters["timeline"] = timeline
+      if aggregate:
+          cache_filters["aggregate"] = aggregate
+      return filter_criteria, timeline, aggregate, cache_filters
+
+  def prepare(self):
+      """
+      Everything before the LLM call: filter extraction, answer cache lookup,
+      retrieval and context assembly.
+      Returns:
+          tuple: (answer cache filters, cached answer or None, query embedding or None, context or None)
+      """
+      with self.activate_trace():
+          with span("filter_extraction"):
+              filter_criteria, timeline, aggregate, cache_filters = self.extract_filters()
+          sampled_log("Filters", cache_filters)
+          with span("cache_lookup"):
+              cached_answer, query_vector = self.lookup_answer(cache_filters)
+          if cached_answer is not None:
+              return cache_filters, cached_answer, query_vector, None
+          filtered_retrieved_docs = self.retrieve(filter_criteria, timeline, aggregate)
+          sampled_log("Filtered Retrieved Docs", filtered_retrieved_docs)
+          # Pack the most relevant documents into the token budget
+          with span("context_assembly"):
+              context = self.context_budget.build_context(filtered_retrieved_docs)
+      return cache_filters, None, query_vector, context
+
+  async def aprepare(self):
+      with self.activate_trace():
+          with span("filter_extraction"):
+              filter_criteria, timeline, aggregate, cache_filters = self.extract_filters()
+          sampled_log("Filters", cache_filters)
+          with span("cache_lookup"):
+              cached_answer, query_vector = await self.alookup_answer(cache_filters)
+          if cached_answer is not None:
+              return cache_filters, cached_answer, query_vector, None
+          filtered_retrieved_docs = await self.aretrieve(filter_criteria, timeline, aggregate)
+          sampled_log("Filtered Retrieved Docs", filtered_retrieved_docs)
+          with span("context_assembly"):
+              context = self.context_budget.build_context(filtered_retrieved_docs)
+      return cache_filters, None, query_vector, context
+
+  def record_token(self, started, llm_started):
+      if "ttft" not in self.timings:
+          self.timings["ttft"] = time.perf_counter() - started
+          self.record_span("llm_ttft", time.perf_counter() - llm_started)
+
   def invoke(self):
-      retriever = self.vector_store.as_retriever(search_kwargs={"k": 1000})
-      retrieved_docs = retriever.invoke(self.query)
-      filtered_retrieved_docs =  self.strainer.get_filtered_docs(retrieved_docs)
-      print(f"Filtered Retrieved Docs: {filtered_retrieved_docs}")
-      context = "\n\n".join(doc.page_content for doc in filtered_retrieved_docs)
-      rag_chain = self.build_rag_chain()
-      result = rag_chain.invoke({
-          "context": context,
-          "question": self.query,
-          "chat_history": []
-      })
-
-      return result
-  
+      # Search only the documents matching the metadata filters
+      self.start_trace()
+      cache_filters, cached, error = None, False, None
+      try:
+          cache_filters, cached_answer, query_vector, context = self.prepare()
+          if cached_answer is not None:
+              cached = True
+              return {"question": self.query, "text": cached_answer, "cached": True}
+          rag_chain = self.build_rag_chain()
+          llm_started = time.perf_counter()
+          result = rag_chain.invoke({
+              "context": context,
+              "question": self.query,
+              "chat_history": []
+          })
+          self.record_span("llm_total", time.perf_counter() - llm_started)
+          self.store_answer(cache_filters, result["text"], query_vector)
+          return result
+      except BaseException as e:
+          error = repr(e)
+          raise
+      finally:
+          self.finish_trace(cache_filters, cached, error)
+
+  async def ainvoke(self):
+      """
+      Async variant of invoke(): retrieval and the LLM call are awaited, so one
+      process can serve many chats without blocking on any of them.
+      """
+      self.start_trace()
+      cache_filters, cached, error = None, False, None
+      try:
+          cache_filters, cached_answer, query_vector, context = await self.aprepare()
+          if cached_answer is not None:
+              cached = True
+              return {"question": self.query, "text": cached_answer, "cached": True}
+          rag_chain = self.build_rag_chain()
+          llm_started = time.perf_counter()
+          result = await rag_chain.ainvoke({
+              "context": context,
+              "question": self.query,
+              "chat_history": []
+          })
+          self.record_span("llm_total", time.perf_counter() - llm_started)
+          await self.astore_answer(cache_filters, result["text"], query_vector)
+          return result
+      except BaseException as e:
+          error = repr(e)
+          raise
+      finally:
+          self.finish_trace(cache_filters, cached, error)
+
+  def stream(self):
+      """
+      Streaming variant of invoke(): yields the answer token by token (a cached
+      answer comes as a single chunk). self.timings records retrieval,
+      time-to-first-token (ttft) and total seconds.
+      """
+      started = time.perf_counter()
+      self.timings = {}
+      self.start_trace()
+      cache_filters, cached, error = None, False, None
+      try:
+          cache_filters, cached_answer, query_vector, context = self.prepare()
+          self.timings["retrieval"] = time.perf_counter() - started
+          if cached_answer is not None:
+              cached = True
+              self.timings["cached"] = True
+              self.timings["ttft"] = self.timings["retrieval"]
+              yield cached_answer
+              self.timings["total"] = time.perf_counter() - started
+              return
+          answer = ""
+          llm_started = time.perf_counter()
+          for token in self.build_stream_chain().stream({"context": context, "question": self.query}):
+              self.record_token(started, llm_started)
+              answer += token
+              yield token
+          self.record_span("llm_total", time.perf_counter() - llm_started)
+          self.timings["total"] = time.perf_counter() - started
+          self.store_answer(cache_filters, answer, query_vector)
+      except BaseException as e:
+          # Includes GeneratorExit when the consumer stops reading mid-answer
+          error = repr(e)
+          raise
+      finally:
+          self.finish_trace(cache_filters, cached, error)
+
+  async def astream(self):
+      """
+      Async variant of stream(), used by the Gradio app.
+      """
+      started = time.perf_counter()
+      self.timings = {}
+      self.start_trace()
+      cache_filters, cached, error = None, False, None
+      try:
+          cache_filters, cached_answer, query_vector, context = await self.aprepare()
+          self.timings["retrieval"] = time.perf_counter() - started
+          if cached_answer is not None:
+              cached = True
+              self.timings["cached"] = True
+              self.timings["ttft"] = self.timings["retrieval"]
+              yield cached_answer
+              self.timings["total"] = time.perf_counter() - started
+              return
+          answer = ""
+          llm_started = time.perf_counter()
+          async for token in self.build_stream_chain().astream({"context": context, "question": self.query}):
+              self.record_token(started, llm_started)
+              answer += token
+              yield token
+          self.record_span("llm_total", time.perf_counter() - llm_started)
+          self.timings["total"] = time.perf_counter() - started
+          await self.astore_answer(cache_filters, answer, query_vector)
+      except BaseException as e:
+          # Includes GeneratorExit / CancelledError when the client disconnects mid-answer
+          error = repr(e)
+          raise
+      finally:
+          self.finish_trace(cache_filters, cached, error)
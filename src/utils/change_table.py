@@ -0,0 +1,228 @@
+from bisect import bisect_left, bisect_right
+import numpy as np
+import os
+import re
+
+from src.vectorstore.conversion import version_sort_key, extract_changes
+
+CHANGES_FILE = "changes.npz"
+CATEGORICAL_FIELDS = ("entity_kind", "entity", "hero", "category", "attribute", "verb", "patch_version")
+# Attributes where a smaller value helps the hero/item ("cooldown reduced" is a buff), matched on the head noun
+# only: "cooldown reduction" or "bonus move speed while on cooldown" are the opposite
+LOWER_IS_BETTER = re.compile(
+  r"\b(?:cooldown|cost|manacost|cast point|attack time|bat|delay|respawn time|respawn|cast time|channel time|restore time|"
+  r"replenish time|damage taken)$"
+)
+# Trailing qualifier of an attribute ("... while on cooldown", "... during duel", "... per hero death"), dropped before
+# finding its head noun; "of" is left alone because ability names use it ("hammer of purity cooldown")
+QUALIFIER_PATTERN = re.compile(r"\s+\b(?:while|when|during|on|per|for|between|in|against|after|before)\b.*$")
+# A recipe cost moves with the total cost of the item when both change in a patch; the total decides buff or nerf
+RECIPE_PATTERN = re.compile(r"\brecipe(?: cost)?$")
+TOTAL_COST = "total cost"
+VERB_DIRECTIONS = {"increased": 1, "raised": 1, "improved": 1, "decreased": -1, "reduced": -1, "lowered": -1}
+# change kind -> (column, value) it selects
+CHANGE_KINDS = {"buff": ("impact", 1), "nerf": ("impact", -1), "increase": ("direction", 1), "decrease": ("direction", -1)}
+
+def is_lower_better(attribute):
+  """
+  Whether a smaller value of the attribute helps the entity, judged on its head noun
+  (the attribute without a trailing "while/on/during ..." qualifier).
+  """
+  return bool(LOWER_IS_BETTER.search(QUALIFIER_PATTERN.sub("", attribute)))
+
+def csr(arrays):
+  # Flattens a list of float lists into (indptr, values)
+  indptr = np.zeros(len(arrays) + 1, dtype=np.int64)
+  indptr[1:] = np.cumsum([len(values) for values in arrays])
+  values = np.fromiter((value for values in arrays for value in values), dtype=np.float64, count=int(indptr[-1]))
+  return indptr, values
+
+def level_means(indptr, values):
+  # Mean of each row's levels, vectorized over the CSR arrays
+  counts = np.diff(indptr)
+  sums = np.add.reduceat(values, indptr[:-1]) if values.size else np.zeros(len(counts))
+  return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+class ChangeTable:
+  """
+  Numeric changes parsed from the patch notes ("Cooldown reduced from 80/65/50
+  to 75/60/45"), one row per change, stored column by column. Text fields are
+  category codes as in MetadataStore; per-level values are CSR arrays
+  (old_levels[old_indptr[i]:old_indptr[i + 1]]). Aggregates such as "biggest
+  nerfs in 7.38" are boolean masks and an argsort over these columns.
+  """
+
+  def __init__(self, codes, categories, old_indptr, old_levels, new_indptr, new_levels, patch_timestamps, notes):
+    self.codes = codes
+    self.categories = categories
+    self.attributes = categories["attribute"].tolist()
+    self.value_to_code = {
+      field: {value: code for code, value in enumerate(values.tolist())}
+      for field, values in categories.items()
+    }
+    self.old_indptr, self.old_levels = old_indptr, old_levels
+    self.new_indptr, self.new_levels = new_indptr, new_levels
+    self.patch_timestamps = patch_timestamps
+    self.notes = notes
+    self.n_rows = len(notes)
+
+    # Derived columns: mean value before/after, signed change and whether it helps the entity
+    self.old = level_means(old_indptr, old_levels)
+    self.new = level_means(new_indptr, new_levels)
+    self.delta = self.new - self.old
+    self.relative = np.divide(self.delta, np.abs(self.old), out=np.sign(self.delta), where=self.old != 0)
+    verb_directions = np.array([VERB_DIRECTIONS.get(verb, 0) for verb in categories["verb"].tolist()], dtype=np.int8)
+    self.direction = np.sign(self.delta).astype(np.int8)
+    self.direction = np.where(self.direction == 0, verb_directions[codes["verb"]], self.direction).astype(np.int8)
+    lower_is_better = np.array([is_lower_better(attribute) for attribute in self.attributes], dtype=bool)
+    self.impact = np.where(lower_is_better[codes["attribute"]], -self.direction, self.direction).astype(np.int8)
+    self.impact[codes["verb"] == self.value_to_code["verb"].get("improved", -1)] = 1
+    self.follow_total_cost()
+    # General notes ("Roshan health increased") are neither buffs nor nerfs
+    self.impact[codes["entity_kind"] == self.value_to_code["entity_kind"].get("generic", -1)] = 0
+
+  def follow_total_cost(self):
+    # Recipe rows take the impact of the same item's total cost change in the same patch, when there is one
+    total_code = self.value_to_code["attribute"].get(TOTAL_COST)
+    is_recipe = np.array([bool(RECIPE_PATTERN.search(attribute)) for attribute in self.attributes], dtype=bool)
+    if total_code is None or not is_recipe.any():
+      return
+    keys = self.codes["entity"].astype(np.int64) * len(self.categories["patch_version"]) + self.codes["patch_version"]
+    totals = np.flatnonzero(self.codes["attribute"] == total_code)
+    recipes = np.flatnonzero(is_recipe[self.codes["attribute"]])
+    total_keys, first = np.unique(keys[totals], return_index=True)
+    positions = np.searchsorted(total_keys, keys[recipes])
+    found = positions < len(total_keys)
+    found[found] = total_keys[positions[found]] == keys[recipes[found]]
+    self.impact[recipes[found]] = self.impact[totals[first[positions[found]]]]
+
+  @classmethod
+  def from_records(cls, records):
+    """
+    Builds the table from ExtractNumericChanges.extract() records.
+    """
+    codes, categories = {}, {}
+    for field in CATEGORICAL_FIELDS:
+      values = [str(record[field]) for record in records]
+      distinct = sorted(set(values))
+      lookup = {value: code for code, value in enumerate(distinct)}
+      codes[field] = np.array([lookup[value] for value in values], dtype=np.int32)
+      categories[field] = np.array(distinct, dtype=str)
+    old_indptr, old_levels = csr([record["old_levels"] for record in records])
+    new_indptr, new_levels = csr([record["new_levels"] for record in records])
+    patch_timestamps = np.array([int(record["patch_timestamp"] or 0) for record in records], dtype=np.int64)
+    notes = [record["note"] for record in records]
+    return cls(codes, categories, old_indptr, old_levels, new_indptr, new_levels, patch_timestamps, notes)
+
+  def save(self, directory):
+    # Notes as a UTF-8 blob plus offsets (like the docstore text), not fixed-width strings
+    encoded = [note.encode("utf-8") for note in self.notes]
+    note_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=note_offsets[1:])
+    columns = {
+      "old_indptr": self.old_indptr, "old_levels": self.old_levels, "new_indptr": self.new_indptr,
+      "new_levels": self.new_levels, "patch_timestamps": self.patch_timestamps,
+      "notes": np.frombuffer(b"".join(encoded), dtype=np.uint8), "note_offsets": note_offsets
+    }
+    for field in self.codes:
+      columns[f"codes/{field}"] = self.codes[field]
+      columns[f"categories/{field}"] = self.categories[field]
+    np.savez(os.path.join(directory, CHANGES_FILE), **columns)
+
+  @classmethod
+  def load(cls, directory):
+    with np.load(os.path.join(directory, CHANGES_FILE), allow_pickle=False) as data:
+      blob, offsets = data["notes"].tobytes(), data["note_offsets"].tolist()
+      return cls(
+        {field: data[f"codes/{field}"] for field in CATEGORICAL_FIELDS},
+        {field: data[f"categories/{field}"] for field in CATEGORICAL_FIELDS},
+        data["old_indptr"], data["old_levels"], data["new_indptr"], data["new_levels"],
+        data["patch_timestamps"], [blob[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+      )
+
+  @classmethod
+  def load_or_build(cls, directory, patch_notes_path="./patchnotes"):
+    """
+    Loads the table saved at ingest, extracting it from the patch notes when
+    the vectorstore predates it.
+    """
+    if os.path.exists(os.path.join(directory, CHANGES_FILE)):
+      return cls.load(directory)
+    patch_notes = [p for p in os.listdir(patch_notes_path) if p.endswith(".json")]
+    return cls.from_records([change for changes in extract_changes(patch_notes, patch_notes_path=patch_notes_path).values() for change in changes])
+
+  def patch_versions(self, since=None, until=None, last_n=None):
+    # Indexed patches in a range, as in TimelineIndex: "until 7.33" includes 7.33c, last_n counts from the newest
+    versions = sorted(self.categories["patch_version"].tolist(), key=version_sort_key)
+    keys = [version_sort_key(version) for version in versions]
+    start = bisect_left(keys, version_sort_key(since)) if since else 0
+    end = bisect_right(keys, version_sort_key(until) + ((2, ""),)) if until else len(keys)
+    if last_n:
+      start = max(start, len(keys) - last_n)
+    return versions[start:end]
+
+  def mask(self, field, values):
+    # Rows whose categorical field is one of values (lower-cased, as extracted)
+    lookup = self.value_to_code[field]
+    codes = [lookup[value] for value in (str(value).lower() for value in values) if value in lookup]
+    return np.isin(self.codes[field], codes)
+
+  def select(self, change=None, attribute=None, entity_kind=None, entity=None, hero=None, category=None,
+             patch_version=None, since=None, until=None, last_n=None):
+    """
+    Rows matching every given condition.
+    Args:
+        change (str, optional): "buff", "nerf", "increase" or "decrease".
+        attribute (str, optional): Substring of the attribute ("cooldown" matches "echo strike cooldown").
+        entity_kind, entity, hero, category (str or list, optional): Exact values.
+        patch_version (str or list, optional): Patch versions; otherwise since/until/last_n select a range.
+    Returns:
+        np.ndarray: The row IDs (ascending).
+    """
+    selected = np.ones(self.n_rows, dtype=bool)
+    if change in CHANGE_KINDS:
+      column, value = CHANGE_KINDS[change]
+      selected &= getattr(self, column) == value
+    if attribute:
+      attribute = attribute.lower()
+      selected &= np.isin(self.codes["attribute"], [code for code, value in enumerate(self.attributes) if attribute in value])
+    for field, values in (("entity_kind", entity_kind), ("entity", entity), ("hero", hero), ("category", category)):
+      if values:
+        selected &= self.mask(field, values if isinstance(values, list) else [values])
+    if patch_version:
+      selected &= self.mask("patch_version", patch_version if isinstance(patch_version, list) else [patch_version])
+    elif since or until or last_n:
+      selected &= self.mask("patch_version", self.patch_versions(since, until, last_n))
+    return np.flatnonzero(selected)
+
+  def rank(self, rows, order="magnitude", limit=None):
+    """
+    Orders rows by the size of the relative change (largest first) or by patch
+    (oldest first), keeping at most limit rows.
+    """
+    if order == "magnitude":
+      rows = rows[np.argsort(-np.abs(self.relative[rows]), kind="stable")]
+    else:
+      rows = rows[np.argsort(self.patch_timestamps[rows], kind="stable")]
+    return rows[:limit] if limit else rows
+
+  def levels(self, row):
+    return (
+      self.old_levels[self.old_indptr[row]:self.old_indptr[row + 1]],
+      self.new_levels[self.new_indptr[row]:self.new_indptr[row + 1]]
+    )
+
+  def value(self, field, row):
+    return self.categories[field][self.codes[field][row]]
+
+  def describe(self, row):
+    """
+    One change as a line of LLM context.
+    """
+    entity_kind, entity, hero = self.value("entity_kind", row), self.value("entity", row), self.value("hero", row)
+    subject = f"{entity_kind.capitalize()}: {entity}" + (f" (hero: {hero})" if entity_kind == "ability" else "")
+    impact = {1: "buff", -1: "nerf"}.get(int(self.impact[row]), "change")
+    return (
+      f"Patch-Version: {self.value('patch_version', row)}. {subject}. {self.notes[row]} "
+      f"(mean {self.old[row]:g} -> {self.new[row]:g}, {self.relative[row]:+.0%}, {impact})"
+    )
@@ -0,0 +1,46 @@
+# Runtime settings, overridable through environment variables
+import os
+
+# Max chat requests the Gradio app processes at the same time
+CONCURRENCY_LIMIT = int(os.getenv("RAG_CONCURRENCY_LIMIT", "16"))
+
+# Batch question answering (src/api/batch.py)
+BATCH_SIZE = int(os.getenv("RAG_BATCH_SIZE", "256"))  # questions embedded and retrieved together
+BATCH_LLM_CONCURRENCY = int(os.getenv("RAG_BATCH_LLM_CONCURRENCY", "8"))  # LLM calls in flight
+
+# Chat history store shared by all sessions (one history per Gradio session)
+CHAT_HISTORY_DB = os.getenv("RAG_CHAT_HISTORY_DB", "sqlite:///chat_history.db")
+
+# Answer cache (src/utils/answer_cache.py)
+ANSWER_CACHE_DB = os.getenv("RAG_ANSWER_CACHE_DB", "./answer_cache.db")
+ANSWER_CACHE_TTL = int(os.getenv("RAG_ANSWER_CACHE_TTL", "86400"))  # seconds
+ANSWER_CACHE_SIZE = int(os.getenv("RAG_ANSWER_CACHE_SIZE", "10000"))  # entries
+ANSWER_CACHE_SIMILARITY = float(os.getenv("RAG_ANSWER_CACHE_SIMILARITY", "0.95"))  # cosine, near-duplicate tier
+
+# Vector index built by add_to_vectorstore (src/vectorstore/index_factory.py); changing it triggers a rebuild
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat")  # flat | hnsw | ivf-flat | ivf-pq
+INDEX_METRIC = os.getenv("RAG_INDEX_METRIC", "l2")  # l2 | ip (inner product on L2-normalized vectors)
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))  # graph neighbours per node
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "128"))
+IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))  # 0 = ~4 * sqrt(number of vectors)
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))  # lists scanned per query
+PQ_M = int(os.getenv("RAG_PQ_M", "0"))  # IVF-PQ sub-quantizers (bytes per vector); 0 = dim / 16
+SHARD_BY = os.getenv("RAG_SHARD_BY", "family")  # family (7.2x, 7.3x) | patch (7.37 with its letter patches) | none (one shard)
+SHARD_SEARCH_THREADS = int(os.getenv("RAG_SHARD_SEARCH_THREADS", "0"))  # shards searched in parallel; 0 = one per shard, up to the core count
+
+# Model providers (src/utils/providers.py), used by the app, ingest and test.py
+EMBEDDING_PROVIDER = os.getenv("RAG_EMBEDDING_PROVIDER", "openai")  # openai | sentence-transformers | onnx | hashing
+EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "")  # "" = the provider's default model
+EMBEDDING_DIM = int(os.getenv("RAG_EMBEDDING_DIM", "384"))  # hashing embedder only
+EMBEDDING_BATCH_SIZE = int(os.getenv("RAG_EMBEDDING_BATCH_SIZE", "64"))  # texts per forward pass of a local model
+EMBEDDING_THREADS = int(os.getenv("RAG_EMBEDDING_THREADS", "0"))  # CPU threads of a local model; 0 = all cores
+LLM_PROVIDER = os.getenv("RAG_LLM_PROVIDER", "openai")  # openai | local (OpenAI-compatible server) | fake
+LLM_MODEL = os.getenv("RAG_LLM_MODEL", "")  # "" = gpt-4o-mini (openai) / llama3.1 (local)
+LLM_BASE_URL = os.getenv("RAG_LLM_BASE_URL", "http://localhost:11434/v1")  # local provider, e.g. Ollama or llama.cpp server
+FAKE_LLM_LATENCY = float(os.getenv("RAG_FAKE_LLM_LATENCY", "0.5"))  # seconds per fake answer
+
+# Request tracing (src/utils/tracing.py)
+METRICS_PORT = int(os.getenv("RAG_METRICS_PORT", "0"))  # Prometheus /metrics port; 0 = not served
+TRACE_FILE = os.getenv("RAG_TRACE_FILE", "")  # JSONL file receiving one trace per request; "" = off
+DEBUG_SAMPLE_RATE = float(os.getenv("RAG_DEBUG_SAMPLE_RATE", "0.01"))  # share of requests whose filters/documents are logged
+DEBUG_MAX_CHARS = int(os.getenv("RAG_DEBUG_MAX_CHARS", "2000"))  # cap on each logged dump
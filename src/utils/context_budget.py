@@ -0,0 +1,71 @@
+from functools import lru_cache
+import threading
+import tiktoken
+
+MAX_TOKENS = 120000  # Leave buffer under OpenAI's 128k limit
+CONTEXT_SEPARATOR = "\n\n"
+
+@lru_cache(maxsize=None)
+def get_encoder(model="gpt-4"):
+  """
+  Loads the tiktoken encoder once per process.
+  """
+  return tiktoken.encoding_for_model(model)
+
+def count_tokens_batch(texts, model="gpt-4"):
+  # Used at ingest to store a token_count per chunk
+  return [len(tokens) for tokens in get_encoder(model).encode_ordinary_batch(texts)]
+
+class ContextBudget:
+  """
+  Packs retrieved documents into the prompt context by relevance until the
+  token budget is reached. Per-document token counts come from the
+  token_count metadata written at ingest, falling back to a per-chunk cache,
+  so the joined context string is never encoded.
+  """
+
+  def __init__(self, max_tokens=MAX_TOKENS, model="gpt-4", separator=CONTEXT_SEPARATOR):
+    self.max_tokens = max_tokens
+    self.model = model
+    self.separator = separator
+    self.token_counts = {}
+    self.lock = threading.Lock()
+
+  def count_tokens(self, doc):
+    token_count = doc.metadata.get("token_count")
+    if token_count is not None:
+      return token_count
+    key = doc.id or doc.page_content
+    with self.lock:
+      token_count = self.token_counts.get(key)
+    if token_count is None:
+      token_count = len(get_encoder(self.model).encode_ordinary(doc.page_content))
+      with self.lock:
+        self.token_counts[key] = token_count
+    return token_count
+
+  def pack(self, docs):
+    """
+    Keeps the longest prefix of the (relevance-ordered) documents that fits the
+    budget, so the least relevant documents are the ones dropped.
+    Args:
+        docs (list): Retrieved documents, most relevant first.
+    Returns:
+        list: The documents that fit.
+    """
+    separator_tokens = len(get_encoder(self.model).encode_ordinary(self.separator))
+    packed = []
+    used = 0
+    for doc in docs:
+      cost = self.count_tokens(doc) + (separator_tokens if packed else 0)
+      if used + cost > self.max_tokens:
+        break
+      packed.append(doc)
+      used += cost
+    return packed
+
+  def fits(self, docs):
+    return len(self.pack(docs)) == len(docs)
+
+  def build_context(self, docs):
+    return self.separator.join(doc.page_content for doc in self.pack(docs))
@@ -0,0 +1,198 @@
+from collections import OrderedDict
+from filelock import FileLock
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import hashlib
+import json
+import os
+import re
+import threading
+
+EMBEDDING_CACHE_PATH = "./embedding_cache"
+
+def truncate(path, size):
+  if os.path.exists(path) and os.path.getsize(path) > size:
+    with open(path, "r+b") as f:
+      f.truncate(size)
+
+class CachedEmbeddings(Embeddings):
+  """
+  Content-addressed embedding cache wrapped around any LangChain Embeddings.
+  Vectors are keyed by (model name, sha256 of the text) and stored on disk as
+  an append-only float32 matrix (memory-mapped for reads) plus a key index,
+  appended under a file lock.
+  Query embeddings additionally go through a bounded in-memory LRU.
+  """
+
+  def __init__(self, embeddings, cache_path=EMBEDDING_CACHE_PATH, query_cache_size=10000):
+    self.embeddings = embeddings
+    self.model_name = self.get_model_name(embeddings)
+    self.cache_dir = os.path.join(cache_path, re.sub(r"[^\w.-]", "_", self.model_name))
+    self.vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+    self.keys_path = os.path.join(self.cache_dir, "keys.txt")
+    self.meta_path = os.path.join(self.cache_dir, "meta.json")
+    self.query_cache = OrderedDict()
+    self.query_cache_size = query_cache_size
+    self.hits = {"documents": 0, "query": 0}
+    self.misses = {"documents": 0, "query": 0}
+    self.lock = threading.Lock()
+    self.dim = None
+    self.key_to_row = {}
+    self.vectors = None
+    self.file_lock = FileLock(os.path.join(self.cache_dir, "cache.lock"))
+    if os.path.exists(self.meta_path):
+      with self.file_lock:
+        self.load_index()
+
+  @staticmethod
+  def get_model_name(embeddings):
+    return str(getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None) or type(embeddings).__name__)
+
+  @staticmethod
+  def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+  # --- On-disk store ---
+
+  def load_index(self):
+    """
+    Reads the key index; call it with the file lock held. An interrupted append
+    can leave vectors without keys or a partial last key line: both tails are
+    truncated, so key rows always match the rows of the vector file.
+    """
+    if not os.path.exists(self.meta_path):
+      return
+    with open(self.meta_path, "r", encoding="utf-8") as f:
+      self.dim = json.load(f)["dim"]
+    data = b""
+    if os.path.exists(self.keys_path):
+      with open(self.keys_path, "rb") as f:
+        data = f.read()
+    lines = data.split(b"\n")[:-1]  # the last element is "" or a partial line
+    vector_rows = os.path.getsize(self.vectors_path) // self.row_bytes() if os.path.exists(self.vectors_path) else 0
+    n_rows = min(len(lines), vector_rows)
+    self.vectors = None
+    truncate(self.keys_path, sum(len(line) + 1 for line in lines[:n_rows]))
+    truncate(self.vectors_path, n_rows * self.row_bytes())
+    self.key_to_row = {line.strip().decode("ascii"): row for row, line in enumerate(lines[:n_rows])}
+
+  def row_bytes(self):
+    return 4 * self.dim
+
+  def get_vectors(self):
+    # Re-mapped lazily after each append
+    if self.vectors is None and self.key_to_row:
+      self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.key_to_row), self.dim))
+    return self.vectors
+
+  def lookup(self, key):
+    row = self.key_to_row.get(key)
+    return None if row is None else self.get_vectors()[row].tolist()
+
+  def append(self, keys, vectors):
+    """
+    Writes new vectors and their keys under the file lock, which serializes
+    processes sharing the cache (e.g. the app and an ingest). The index is
+    re-read first, so rows written by another process keep their numbers and
+    the new vectors go right after the last indexed row. Keys are written
+    after their vectors are on disk, so a key never points to a missing row.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    os.makedirs(self.cache_dir, exist_ok=True)
+    with self.file_lock:
+      self.load_index()
+      if self.dim is None:
+        self.dim = matrix.shape[1]
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+          json.dump({"model": self.model_name, "dim": self.dim}, f)
+      fresh = [position for position, key in enumerate(keys) if key not in self.key_to_row]
+      if not fresh:
+        return
+      with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+        f.seek(len(self.key_to_row) * self.row_bytes())
+        f.write(matrix[fresh].tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+      with open(self.keys_path, "ab") as f:
+        f.write("".join(f"{keys[position]}\n" for position in fresh).encode("ascii"))
+      for position in fresh:
+        self.key_to_row[keys[position]] = len(self.key_to_row)
+      self.vectors = None
+
+  # --- Embeddings interface ---
+
+  def lookup_documents(self, texts):
+    """
+    Returns (keys, cached vectors or None, {key: text} of distinct misses).
+    """
+    keys = [self.text_key(text) for text in texts]
+    with self.lock:
+      results = [self.lookup(key) for key in keys]
+    missing = {key: text for key, text, vector in zip(keys, texts, results) if vector is None}
+    self.hits["documents"] += len(texts) - sum(vector is None for vector in results)
+    self.misses["documents"] += len(missing)
+    return keys, results, missing
+
+  def store_documents(self, keys, results, missing, new_vectors):
+    with self.lock:
+      fresh = [(key, vector) for key, vector in zip(missing, new_vectors) if key not in self.key_to_row]
+      if fresh:
+        self.append([key for key, _ in fresh], [vector for _, vector in fresh])
+    computed = dict(zip(missing, new_vectors))
+    return [vector if vector is not None else list(computed[key]) for key, vector in zip(keys, results)]
+
+  def embed_documents(self, texts: list[str]) -> list[list[float]]:
+    keys, results, missing = self.lookup_documents(texts)
+    if not missing:
+      return results
+    # Embed each distinct missing text once
+    new_vectors = self.embeddings.embed_documents(list(missing.values()))
+    return self.store_documents(keys, results, missing, new_vectors)
+
+  async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+    keys, results, missing = self.lookup_documents(texts)
+    if not missing:
+      return results
+    new_vectors = await self.embeddings.aembed_documents(list(missing.values()))
+    return self.store_documents(keys, results, missing, new_vectors)
+
+  def embed_query(self, text: str) -> list[float]:
+    key = self.text_key(text)
+    with self.lock:
+      vector = self.query_cache.get(key)
+      if vector is None:
+        vector = self.lookup(key)
+      if vector is not None:
+        self.hits["query"] += 1
+        self.remember_query(key, vector)
+        return vector
+    self.misses["query"] += 1
+    vector = self.embeddings.embed_query(text)
+    with self.lock:
+      self.remember_query(key, vector)
+    return vector
+
+  async def aembed_query(self, text: str) -> list[float]:
+    key = self.text_key(text)
+    with self.lock:
+      vector = self.query_cache.get(key)
+      if vector is None:
+        vector = self.lookup(key)
+      if vector is not None:
+        self.hits["query"] += 1
+        self.remember_query(key, vector)
+        return vector
+    self.misses["query"] += 1
+    vector = await self.embeddings.aembed_query(text)
+    with self.lock:
+      self.remember_query(key, vector)
+    return vector
+
+  def remember_query(self, key, vector):
+    self.query_cache[key] = vector
+    self.query_cache.move_to_end(key)
+    while len(self.query_cache) > self.query_cache_size:
+      self.query_cache.popitem(last=False)
+
+  def stats(self):
+    return {"model": self.model_name, "rows": len(self.key_to_row), "hits": dict(self.hits), "misses": dict(self.misses)}
@@ -0,0 +1,111 @@
+from collections import Counter
+import numpy as np
+import os
+import re
+
+from src.utils.metadata_store import row_chunk_ids, fingerprint
+
+LEXICAL_FILE = "bm25.npz"
+
+# Version strings and decimals stay whole ("7.37e", "0.45"); a letter suffix only when it ends the token
+TOKEN_PATTERN = re.compile(r"\d+(?:\.\d+)*(?:[a-z](?![a-z]))?|[a-z][a-z0-9']*")
+
+def tokenize(text: str):
+  return TOKEN_PATTERN.findall(text.lower())
+
+class LexicalIndex:
+  """
+  BM25 over the chunk texts, aligned with the FAISS row IDs and stored as CSR
+  arrays: the postings of term t are rows[indptr[t]:indptr[t + 1]] with their
+  precomputed BM25 weights, so scoring a query is a few slice-adds into one
+  score array.
+  """
+
+  def __init__(self, terms, indptr, rows, weights, n_rows, chunk_fingerprint=""):
+    self.terms = terms
+    self.term_ids = {term: i for i, term in enumerate(terms.tolist())}
+    self.indptr = indptr
+    self.rows = rows
+    self.weights = weights
+    self.n_rows = n_rows
+    self.chunk_fingerprint = chunk_fingerprint
+
+  @classmethod
+  def from_texts(cls, texts, chunk_ids=(), k1=1.5, b=0.75):
+    term_freqs = [Counter(tokenize(text)) for text in texts]
+    doc_lengths = np.array([sum(freqs.values()) for freqs in term_freqs], dtype=np.float32)
+    avg_length = float(doc_lengths.mean()) if len(texts) else 0.0
+
+    postings = {}
+    for row, freqs in enumerate(term_freqs):
+      for term, freq in freqs.items():
+        postings.setdefault(term, ([], []))
+        postings[term][0].append(row)
+        postings[term][1].append(freq)
+
+    terms = sorted(postings)
+    indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(postings[term][0]) for term in terms])
+    rows = np.concatenate([np.array(postings[term][0], dtype=np.int32) for term in terms]) if terms else np.empty(0, dtype=np.int32)
+    freqs = np.concatenate([np.array(postings[term][1], dtype=np.float32) for term in terms]) if terms else np.empty(0, dtype=np.float32)
+
+    # BM25 weight of every posting: idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len))
+    doc_freqs = np.diff(indptr).astype(np.float32)
+    idf = np.log(1 + (len(texts) - doc_freqs + 0.5) / (doc_freqs + 0.5))
+    norms = k1 * (1 - b + b * doc_lengths[rows] / max(avg_length, 1e-9))
+    weights = np.repeat(idf, np.diff(indptr)) * freqs * (k1 + 1) / (freqs + norms)
+    return cls(np.array(terms, dtype=str), indptr, rows, weights.astype(np.float32), len(texts), fingerprint(chunk_ids))
+
+  @classmethod
+  def from_vector_store(cls, vector_store):
+    chunk_ids = row_chunk_ids(vector_store)
+    index_to_docstore_id = vector_store.index_to_docstore_id
+    texts = [vector_store.docstore.search(index_to_docstore_id[row]).page_content for row in range(len(chunk_ids))]
+    return cls.from_texts(texts, [str(chunk_id) for chunk_id in chunk_ids])
+
+  def save(self, directory):
+    np.savez(
+      os.path.join(directory, LEXICAL_FILE),
+      terms=self.terms, indptr=self.indptr, rows=self.rows, weights=self.weights,
+      n_rows=np.array(self.n_rows), chunk_fingerprint=np.array(self.chunk_fingerprint)
+    )
+
+  @classmethod
+  def load(cls, directory):
+    with np.load(os.path.join(directory, LEXICAL_FILE), allow_pickle=False) as data:
+      return cls(data["terms"], data["indptr"], data["rows"], data["weights"], int(data["n_rows"]), str(data["chunk_fingerprint"]))
+
+  @classmethod
+  def load_or_build(cls, vector_store, directory):
+    """
+    Loads the index saved at ingest, rebuilding it when it is missing or was
+    built for other rows.
+    """
+    if os.path.exists(os.path.join(directory, LEXICAL_FILE)):
+      index = cls.load(directory)
+      if index.chunk_fingerprint == fingerprint([str(chunk_id) for chunk_id in row_chunk_ids(vector_store)]):
+        return index
+    return cls.from_vector_store(vector_store)
+
+  def scores(self, query: str):
+    scores = np.zeros(self.n_rows, dtype=np.float32)
+    for term in tokenize(query):
+      term_id = self.term_ids.get(term)
+      if term_id is not None:
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        scores[self.rows[start:end]] += self.weights[start:end]
+    return scores
+
+  def search(self, query: str, ids=None, k: int = 1000):
+    """
+    Top-k rows by BM25, optionally restricted to the given row IDs. Rows
+    sharing no term with the query are left out.
+    Returns:
+        tuple: (rows, scores), best first.
+    """
+    scores = self.scores(query)
+    rows = np.flatnonzero(scores) if ids is None else ids[scores[ids] > 0]
+    if rows.size > k:
+      rows = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+    rows = rows[np.argsort(-scores[rows], kind="stable")]
+    return rows.astype(np.int64), scores[rows]
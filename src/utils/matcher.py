@@ -0,0 +1,119 @@
+from collections import deque
+from typing import NamedTuple
+
+class EntityMatch(NamedTuple):
+  name: str
+  kinds: frozenset
+  start: int
+  end: int
+
+class EntityMatcher:
+  """
+  Aho-Corasick automaton over every hero, item and ability name (and alias).
+  Finds all entity mentions in a single pass over the query.
+  """
+
+  def __init__(self, names_by_kind: dict, aliases: dict = None):
+    # Pattern -> kinds it belongs to (a name can be both an item and an ability)
+    pattern_kinds = {}
+    for kind, names in names_by_kind.items():
+      for name in names:
+        if name:
+          pattern_kinds.setdefault(name, set()).add(kind)
+    # Aliases are matched like names and reported as the name they stand for: (kind, alias) -> name
+    self.canonical = {}
+    for kind, kind_aliases in (aliases or {}).items():
+      for alias, name in kind_aliases.items():
+        pattern_kinds.setdefault(alias, set()).add(kind)
+        self.canonical[(kind, alias)] = name
+    self.pattern_kinds = {pattern: frozenset(kinds) for pattern, kinds in pattern_kinds.items()}
+
+    # Trie transitions, failure links and per-state output patterns
+    self.goto = [{}]
+    self.fail = [0]
+    self.outputs = [[]]
+    for pattern in self.pattern_kinds:
+      self.add_pattern(pattern)
+    self.build_failure_links()
+
+  def add_pattern(self, pattern):
+    state = 0
+    for char in pattern:
+      next_state = self.goto[state].get(char)
+      if next_state is None:
+        next_state = len(self.goto)
+        self.goto[state][char] = next_state
+        self.goto.append({})
+        self.fail.append(0)
+        self.outputs.append([])
+      state = next_state
+    self.outputs[state].append(pattern)
+
+  def build_failure_links(self):
+    queue = deque(self.goto[0].values())
+    while queue:
+      state = queue.popleft()
+      for char, next_state in self.goto[state].items():
+        queue.append(next_state)
+        fallback = self.fail[state]
+        while fallback and char not in self.goto[fallback]:
+          fallback = self.fail[fallback]
+        self.fail[next_state] = self.goto[fallback].get(char, 0)
+        # Inherit the patterns that end at the failure state (suffix matches)
+        self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+  @staticmethod
+  def is_word_boundary(text, start, end):
+    before_ok = start == 0 or not text[start - 1].isalnum()
+    after_ok = end == len(text) or not text[end].isalnum()
+    return before_ok and after_ok
+
+  def find_all(self, text: str) -> list:
+    """
+    Finds every entity name occurring in the text on word boundaries.
+    Overlapping matches are all kept; see resolve() for picking one per span.
+    Args:
+        text (str): The query (matched case-insensitively).
+    Returns:
+        list: EntityMatch spans ordered by end position.
+    """
+    text = text.lower()
+    goto, fail, outputs = self.goto, self.fail, self.outputs
+    matches = []
+    state = 0
+    for pos, char in enumerate(text):
+      while state and char not in goto[state]:
+        state = fail[state]
+      state = goto[state].get(char, 0)
+      for pattern in outputs[state]:
+        start, end = pos + 1 - len(pattern), pos + 1
+        if self.is_word_boundary(text, start, end):
+          matches.append(EntityMatch(pattern, self.pattern_kinds[pattern], start, end))
+    return matches
+
+  @staticmethod
+  def resolve(matches: list, kind=None) -> list:
+    """
+    Keeps the leftmost-longest, non-overlapping matches (optionally of one kind only).
+    """
+    candidates = sorted(
+      (m for m in matches if kind is None or kind in m.kinds),
+      key=lambda m: (m.start, m.start - m.end)
+    )
+    resolved = []
+    last_end = -1
+    for match in candidates:
+      if match.start >= last_end:
+        resolved.append(match)
+        last_end = match.end
+    return resolved
+
+  def find(self, text: str, kind=None) -> list:
+    return self.resolve(self.find_all(text), kind)
+
+  def first(self, matches: list, kind):
+    """
+    Returns the name of the first mention of the given kind (aliases resolved), or None.
+    """
+    resolved = self.resolve(matches, kind)
+    return self.canonical.get((kind, resolved[0].name), resolved[0].name) if resolved else None
@@ -0,0 +1,162 @@
+import numpy as np
+import hashlib
+import os
+
+# Metadata fields produced by ConvertPatchNotesToDocuments that dynamic_filter can pin down
+FILTER_FIELDS = ("patch_version", "hero_id", "item_id", "ability_id", "category")
+# List-valued metadata -> the single-valued field it extends (chunks converted before the list existed fall back to it)
+LIST_FIELDS = {"ability_ids": "ability_id"}
+METADATA_FILE = "metadata.npz"
+
+def row_chunk_ids(vector_store):
+  # Chunk ID of every FAISS row; the columnar docstore keys rows by integer and keeps the IDs as a column
+  chunk_ids = getattr(vector_store.docstore, "chunk_ids", None)
+  if chunk_ids is not None:
+    return chunk_ids
+  index_to_docstore_id = vector_store.index_to_docstore_id
+  return [index_to_docstore_id[row] for row in range(len(index_to_docstore_id))]
+
+def fingerprint(chunk_ids):
+  # Identifies the row order an index was built for
+  return hashlib.sha256("\n".join(chunk_ids).encode("utf-8")).hexdigest()
+
+class MetadataStore:
+  """
+  Columnar copy of the chunk metadata, aligned with the FAISS row IDs.
+  Each filter field is stored as integer category codes (-1 when missing)
+  plus one packed bitmap per distinct value, so a dynamic_filter() result
+  resolves to rows with a few bitwise ANDs/ORs. patch_timestamp and
+  token_count are kept as plain columns for ordering and budgeting.
+  List-valued fields (LIST_FIELDS) are kept as (row, code) pairs in
+  list_rows/list_codes, with their values in categories.
+  """
+
+  def __init__(self, doc_ids, codes, categories, patch_timestamps, token_counts, list_rows=None, list_codes=None):
+    self.doc_ids = doc_ids
+    self.codes = codes
+    self.categories = categories
+    self.list_rows = list_rows or {}
+    self.list_codes = list_codes or {}
+    self.patch_timestamps = patch_timestamps
+    self.token_counts = token_counts
+    self.n_rows = len(doc_ids)
+    self.value_to_code = {
+      field: {value: code for code, value in enumerate(categories[field].tolist())}
+      for field in codes
+    }
+    self.bitmaps = {field: self.build_bitmaps(codes[field], len(categories[field])) for field in codes}
+
+  def build_bitmaps(self, codes, n_values):
+    # One row per value: bit i is set when FAISS row i carries that value
+    bits = np.zeros((n_values, self.n_rows), dtype=bool)
+    present = codes >= 0
+    bits[codes[present], np.flatnonzero(present)] = True
+    return np.packbits(bits, axis=1)
+
+  @classmethod
+  def from_vector_store(cls, vector_store, filter_fields=FILTER_FIELDS):
+    """
+    Builds the columns from the docstore (row order = FAISS row IDs).
+    """
+    index_to_docstore_id = vector_store.index_to_docstore_id
+    doc_ids = row_chunk_ids(vector_store)
+    metadatas = [vector_store.docstore.search(index_to_docstore_id[row]).metadata for row in range(len(doc_ids))]
+
+    codes, categories = {}, {}
+    for field in filter_fields:
+      values = [metadata.get(field) for metadata in metadatas]
+      normalized = [None if value is None else str(value).lower() for value in values]
+      distinct = sorted({value for value in normalized if value is not None})
+      lookup = {value: code for code, value in enumerate(distinct)}
+      codes[field] = np.array([-1 if value is None else lookup[value] for value in normalized], dtype=np.int32)
+      categories[field] = np.array(distinct, dtype=str)
+
+    list_rows, list_codes = {}, {}
+    for field, single_field in LIST_FIELDS.items():
+      pairs = []
+      for row, metadata in enumerate(metadatas):
+        values = metadata[field] if field in metadata else [metadata.get(single_field)]
+        pairs.extend((row, str(value).lower()) for value in dict.fromkeys(values) if value is not None)
+      distinct = sorted({value for _, value in pairs})
+      lookup = {value: code for code, value in enumerate(distinct)}
+      list_rows[field] = np.array([row for row, _ in pairs], dtype=np.int64)
+      list_codes[field] = np.array([lookup[value] for _, value in pairs], dtype=np.int32)
+      categories[field] = np.array(distinct, dtype=str)
+
+    patch_timestamps = np.array([int(metadata.get("patch_timestamp") or 0) for metadata in metadatas], dtype=np.int64)
+    token_counts = np.array([metadata.get("token_count", -1) for metadata in metadatas], dtype=np.int32)
+    return cls(np.array(doc_ids, dtype=str), codes, categories, patch_timestamps, token_counts, list_rows, list_codes)
+
+  def save(self, directory):
+    columns = {"doc_ids": self.doc_ids, "patch_timestamps": self.patch_timestamps, "token_counts": self.token_counts}
+    for field in self.codes:
+      columns[f"codes/{field}"] = self.codes[field]
+      columns[f"categories/{field}"] = self.categories[field]
+    for field in self.list_codes:
+      columns[f"list_rows/{field}"] = self.list_rows[field]
+      columns[f"list_codes/{field}"] = self.list_codes[field]
+      columns[f"categories/{field}"] = self.categories[field]
+    np.savez(os.path.join(directory, METADATA_FILE), **columns)
+
+  @classmethod
+  def load(cls, directory):
+    with np.load(os.path.join(directory, METADATA_FILE), allow_pickle=False) as data:
+      fields = [name.split("/", 1)[1] for name in data.files if name.startswith("codes/")]
+      list_fields = [name.split("/", 1)[1] for name in data.files if name.startswith("list_codes/")]
+      return cls(
+        data["doc_ids"],
+        {field: data[f"codes/{field}"] for field in fields},
+        {field: data[f"categories/{field}"] for field in fields + list_fields},
+        data["patch_timestamps"],
+        data["token_counts"],
+        {field: data[f"list_rows/{field}"] for field in list_fields},
+        {field: data[f"list_codes/{field}"] for field in list_fields}
+      )
+
+  @classmethod
+  def load_or_build(cls, vector_store, directory, filter_fields=FILTER_FIELDS):
+    """
+    Loads the store saved at ingest, rebuilding it from the docstore when it
+    is missing or out of sync with the index (e.g. a vectorstore saved by an older build).
+    """
+    if os.path.exists(os.path.join(directory, METADATA_FILE)):
+      store = cls.load(directory)
+      ids = row_chunk_ids(vector_store)
+      in_sync = store.n_rows == len(ids) and all(store.doc_ids[row] == ids[row] for row in range(store.n_rows))
+      if in_sync and set(filter_fields) <= set(store.codes) and set(LIST_FIELDS) <= set(store.list_codes):
+        return store
+    return cls.from_vector_store(vector_store, filter_fields)
+
+  def select(self, filter_criteria: dict):
+    """
+    Resolves the dynamic_filter() output to row IDs by bitmap intersection.
+    Values of one key are OR-ed, different keys are AND-ed (same rules as
+    FilterRetrievedDocuments.get_filtered_docs).
+    Returns:
+        np.ndarray | None: The matching row IDs (ascending), or None when nothing is filtered.
+    """
+    mask = None
+    for key, values in filter_criteria.items():
+      if not isinstance(values, list):
+        values = [values]
+      key_mask = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+      lookup = self.value_to_code.get(key, {})
+      for value in values:
+        code = lookup.get(str(value).lower())
+        if code is not None:
+          key_mask |= self.bitmaps[key][code]
+      mask = key_mask if mask is None else mask & key_mask
+      if not mask.any():
+        break
+    if mask is None:
+      return None
+    return np.flatnonzero(np.unpackbits(mask, count=self.n_rows)).astype(np.int64)
+
+  def order_by_timestamp(self, rows):
+    # Oldest patch first; chunks of the same patch keep their ingest order
+    return rows[np.argsort(self.patch_timestamps[rows], kind="stable")]
+
+  def known_tokens(self, rows):
+    # Lower bound on the rows' token total (chunks indexed without a token_count are skipped)
+    counts = self.token_counts[rows]
+    return int(counts[counts >= 0].sum())
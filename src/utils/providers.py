@@ -0,0 +1,210 @@
+# Embedding and chat model providers, selected by the RAG_EMBEDDING_* / RAG_LLM_* settings
+# Local backends are optional imports: only the selected provider's packages need to be installed.
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+import numpy as np
+import asyncio
+import hashlib
+import os
+import re
+import time
+
+from src.utils.config import (
+  EMBEDDING_PROVIDER, EMBEDDING_MODEL, EMBEDDING_DIM, EMBEDDING_BATCH_SIZE, EMBEDDING_THREADS,
+  LLM_PROVIDER, LLM_MODEL, LLM_BASE_URL, FAKE_LLM_LATENCY
+)
+
+EMBEDDING_PROVIDERS = ("openai", "sentence-transformers", "onnx", "hashing")
+LLM_PROVIDERS = ("openai", "local", "fake")
+DEFAULT_LOCAL_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+def cpu_threads(threads=EMBEDDING_THREADS):
+  return threads or os.cpu_count() or 1
+
+# --- Embeddings ---
+
+def hashing_embed(texts, dim):
+  # Signed feature hashing of word unigrams: deterministic, offline, and similar texts get similar vectors
+  vectors = np.zeros((len(texts), dim), dtype=np.float32)
+  buckets = {}
+  for row, text in enumerate(texts):
+    for token in re.findall(r"\w+(?:\.\w+)*", text.lower()):
+      if token not in buckets:
+        digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        buckets[token] = (digest % dim, 1.0 if (digest >> 63) else -1.0)
+      column, sign = buckets[token]
+      vectors[row, column] += sign
+  norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+  return vectors / np.maximum(norms, 1e-12)
+
+class HashingEmbeddings(Embeddings):
+  """
+  Deterministic hashing embedder: no model and no network, for tests,
+  offline builds and load tests. Retrieval quality is lexical only.
+  """
+
+  def __init__(self, dim=EMBEDDING_DIM):
+    self.dim = dim
+    # Read by CachedEmbeddings to key its cache
+    self.model = f"hashing-{dim}"
+
+  def embed_documents(self, texts: list[str]) -> list[list[float]]:
+    return hashing_embed(texts, self.dim).tolist()
+
+  def embed_query(self, text: str) -> list[float]:
+    return hashing_embed([text], self.dim)[0].tolist()
+
+class OnnxEmbeddings(Embeddings):
+  """
+  Sentence-transformer model exported to ONNX and run with onnxruntime on the
+  CPU (mean pooling, L2-normalized). Texts are sorted by length before
+  batching to limit padding; each batch runs on all `threads` cores.
+  model_name is a local directory or a Hugging Face repo with onnx/model.onnx.
+  """
+
+  def __init__(self, model_name=DEFAULT_LOCAL_EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE, threads=EMBEDDING_THREADS, max_length=256):
+    import onnxruntime
+    from tokenizers import Tokenizer
+    self.model = f"{model_name}:onnx"
+    self.batch_size = batch_size
+    model_path, tokenizer_path = self.model_files(model_name)
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = cpu_threads(threads)
+    self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+    self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+    self.tokenizer = Tokenizer.from_file(tokenizer_path)
+    self.tokenizer.enable_truncation(max_length=max_length)
+    self.tokenizer.enable_padding()
+
+  @staticmethod
+  def model_files(model_name):
+    if os.path.isdir(model_name):
+      model_path = os.path.join(model_name, "model.onnx")
+      if not os.path.exists(model_path):
+        model_path = os.path.join(model_name, "onnx", "model.onnx")
+      return model_path, os.path.join(model_name, "tokenizer.json")
+    from huggingface_hub import hf_hub_download
+    return hf_hub_download(model_name, "onnx/model.onnx"), hf_hub_download(model_name, "tokenizer.json")
+
+  def embed_batch(self, texts):
+    encodings = self.tokenizer.encode_batch(texts)
+    input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+    attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+    inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+    if "token_type_ids" in self.input_names:
+      inputs["token_type_ids"] = np.zeros_like(input_ids)
+    token_embeddings = self.session.run(None, inputs)[0]
+    mask = attention_mask[..., None].astype(np.float32)
+    pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+  def embed_documents(self, texts: list[str]) -> list[list[float]]:
+    order = np.argsort([len(text) for text in texts], kind="stable")
+    vectors = [None] * len(texts)
+    for start in range(0, len(texts), self.batch_size):
+      batch = order[start:start + self.batch_size]
+      for row, vector in zip(batch, self.embed_batch([texts[i] for i in batch])):
+        vectors[row] = vector.tolist()
+    return vectors
+
+  def embed_query(self, text: str) -> list[float]:
+    return self.embed_documents([text])[0]
+
+def sentence_transformer_embeddings(model_name=DEFAULT_LOCAL_EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE, threads=EMBEDDING_THREADS):
+  import torch
+  from langchain_huggingface import HuggingFaceEmbeddings
+  torch.set_num_threads(cpu_threads(threads))
+  return HuggingFaceEmbeddings(
+    model_name=model_name,
+    model_kwargs={"device": "cpu"},
+    encode_kwargs={"batch_size": batch_size, "normalize_embeddings": True}
+  )
+
+def get_embeddings(provider=EMBEDDING_PROVIDER, model=EMBEDDING_MODEL):
+  """
+  Returns the configured LangChain Embeddings (wrap it in CachedEmbeddings to
+  reuse vectors across builds; the cache is keyed by model name).
+  """
+  if provider == "openai":
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=model) if model else OpenAIEmbeddings()
+  if provider == "sentence-transformers":
+    return sentence_transformer_embeddings(model or DEFAULT_LOCAL_EMBEDDING_MODEL)
+  if provider == "onnx":
+    return OnnxEmbeddings(model or DEFAULT_LOCAL_EMBEDDING_MODEL)
+  if provider == "hashing":
+    return HashingEmbeddings(int(model) if model else EMBEDDING_DIM)
+  raise ValueError(f"Unknown embedding provider {provider!r}, expected one of {EMBEDDING_PROVIDERS}")
+
+def embedding_pipeline_options(provider=EMBEDDING_PROVIDER):
+  """
+  EmbeddingPipeline settings for the provider. A local model already uses every
+  core per batch, so batches run one at a time instead of as concurrent API calls.
+  """
+  if provider == "openai":
+    return {}
+  return {"batch_size": EMBEDDING_BATCH_SIZE * 4, "max_concurrency": 1, "initial_concurrency": 1}
+
+# --- Chat models ---
+
+class StubChatModel(BaseChatModel):
+  """
+  Answers every prompt with the same text after `latency` seconds.
+  The async path sleeps on the event loop, like a real network-bound LLM call.
+  When streamed, the first word arrives after `first_token_latency` and the
+  rest of the latency is spread over the remaining words.
+  """
+  latency: float = 0.5
+  response: str = "Stub answer based on the provided patch notes context."
+  first_token_latency: float = 0.1
+
+  @property
+  def _llm_type(self) -> str:
+    return "stub-chat-model"
+
+  def _result(self):
+    return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+  def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+    time.sleep(self.latency)
+    return self._result()
+
+  async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+    await asyncio.sleep(self.latency)
+    return self._result()
+
+  def _token_delays(self):
+    tokens = self.response.split(" ")
+    tokens = [token if i == 0 else " " + token for i, token in enumerate(tokens)]
+    rest = max(self.latency - self.first_token_latency, 0) / max(len(tokens) - 1, 1)
+    return [(token, self.first_token_latency if i == 0 else rest) for i, token in enumerate(tokens)]
+
+  def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+    for token, delay in self._token_delays():
+      time.sleep(delay)
+      yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+  async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+    for token, delay in self._token_delays():
+      await asyncio.sleep(delay)
+      yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+def get_chat_model(provider=LLM_PROVIDER, model=LLM_MODEL):
+  """
+  Returns the configured chat model:
+  - openai: ChatOpenAI (gpt-4o-mini by default)
+  - local: any OpenAI-compatible server at RAG_LLM_BASE_URL (Ollama, llama.cpp, vLLM)
+  - fake: StubChatModel, a fixed answer after RAG_FAKE_LLM_LATENCY seconds
+  """
+  if provider == "openai":
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model or "gpt-4o-mini", temperature=0)
+  if provider == "local":
+    from langchain_openai import ChatOpenAI
+    # Local servers ignore the key, but the client requires one
+    return ChatOpenAI(model=model or "llama3.1", temperature=0, base_url=LLM_BASE_URL, api_key="local")
+  if provider == "fake":
+    return StubChatModel(latency=FAKE_LLM_LATENCY, first_token_latency=min(0.1, FAKE_LLM_LATENCY))
+  raise ValueError(f"Unknown LLM provider {provider!r}, expected one of {LLM_PROVIDERS}")
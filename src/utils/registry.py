@@ -0,0 +1,134 @@
+from functools import cached_property
+import csv
+import os
+import re
+import threading
+
+from src.utils.matcher import EntityMatcher
+
+MAPPER_PATHS = {
+  "heroes": "./data/mappers/heroes_mapper.csv",
+  "items": "./data/mappers/items_mapper.csv",
+  "abilities": "./data/mappers/heroes_abilities_mapper.csv",
+}
+# Ability names carry the hero's internal name ("nevermore shadowraze"); heroes whose internal name
+# is not their display name written without spaces or punctuation ("queen of pain" -> "queenofpain")
+INTERNAL_HERO_NAMES = {
+  "centaur warrunner": "centaur", "clockwerk": "rattletrap", "doom": "doom bringer", "io": "wisp",
+  "lifestealer": "life stealer", "magnus": "magnataur", "nature's prophet": "furion", "necrophos": "necrolyte",
+  "outworld destroyer": "obsidian destroyer", "shadow fiend": "nevermore", "timbersaw": "shredder",
+  "treant protector": "treant", "underlord": "abyssal underlord", "windranger": "windrunner",
+  "wraith king": "skeleton king", "zeus": "zuus",
+}
+
+class EntityRegistry:
+  """
+  Process-wide view of the hero, item and ability mappers.
+  Holds the id -> name maps used at ingest and the normalized name sets /
+  name -> id maps (plus the ability aliases) used for query filtering.
+  """
+
+  def __init__(self, mapper_paths=MAPPER_PATHS):
+    self.mapper_paths = dict(mapper_paths)
+    self.mtimes = self.current_mtimes()
+    self.id_to_name = {kind: self.load_mapper_csv(path) for kind, path in self.mapper_paths.items()}
+    self.name_to_id = {
+      kind: {name.strip().lower(): entity_id for entity_id, name in mapper.items()}
+      for kind, mapper in self.id_to_name.items()
+    }
+    # Normalized (stripped, lower-cased) name sets for query matching
+    self.heroes_set = set(self.name_to_id["heroes"])
+    self.items_set = set(self.name_to_id["items"])
+    self.abilities_set = set(self.name_to_id["abilities"])
+    self.ability_aliases = self.build_ability_aliases()
+
+  def load_mapper_csv(self, csv_path):
+    """
+    Loads an id -> name mapper CSV (columns: id, name).
+    """
+    with open(csv_path, "r", encoding="utf-8") as f:
+      return {row["id"]: row["name"] for row in csv.DictReader(f)}
+
+  def hero_prefixes(self):
+    # Internal-name prefix of the hero abilities -> hero display name (longest prefix first)
+    prefixes = {}
+    for hero in self.heroes_set:
+      for prefix in (hero, hero.replace("-", " "), re.sub(r"[^a-z0-9]", "", hero), INTERNAL_HERO_NAMES.get(hero)):
+        if prefix:
+          prefixes[prefix] = hero
+    return dict(sorted(prefixes.items(), key=lambda item: -len(item[0])))
+
+  def build_ability_aliases(self):
+    """
+    Names a query may use for a hero ability, mapped to its mapper name:
+    "pudge's meat hook", "shadow fiend shadowraze" and, for multi-word names
+    that belong to a single hero, the bare "meat hook". Single-word bare names
+    ("bash", "return") are too common in questions to be matched on their own.
+    Returns:
+        dict: Alias -> ability name (normalized).
+    """
+    prefixes = self.hero_prefixes()
+    aliases, bare_names = {}, {}
+    for ability in self.abilities_set:
+      prefix = next((prefix for prefix in prefixes if ability.startswith(prefix + " ")), None)
+      if prefix is None:
+        continue
+      hero, bare_name = prefixes[prefix], ability[len(prefix) + 1:]
+      aliases[f"{hero} {bare_name}"] = ability
+      aliases[f"{hero}'s {bare_name}"] = ability
+      if " " in bare_name:
+        bare_names.setdefault(bare_name, set()).add(ability)
+    for bare_name, abilities in bare_names.items():
+      if len(abilities) == 1:
+        aliases[bare_name] = next(iter(abilities))
+    # Real entity names keep their own meaning ("pudge meat hook" is already an ability)
+    taken = self.heroes_set | self.items_set | self.abilities_set
+    return {alias: ability for alias, ability in aliases.items() if alias not in taken}
+
+  def current_mtimes(self):
+    return {kind: os.path.getmtime(path) for kind, path in self.mapper_paths.items()}
+
+  def is_stale(self):
+    try:
+      return self.current_mtimes() != self.mtimes
+    except OSError:
+      return True
+
+  @cached_property
+  def matcher(self):
+    """
+    Aho-Corasick matcher over all normalized entity names (built on first use).
+    """
+    return EntityMatcher({
+      "heroes": self.heroes_set,
+      "items": self.items_set,
+      "abilities": self.abilities_set,
+    }, aliases={"abilities": self.ability_aliases})
+
+  # id -> name maps for ConvertPatchNotesToDocuments
+  @property
+  def dict_heroes_mapper(self):
+    return self.id_to_name["heroes"]
+
+  @property
+  def dict_items_mapper(self):
+    return self.id_to_name["items"]
+
+  @property
+  def dict_heroes_abilities_mapper(self):
+    return self.id_to_name["abilities"]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_entity_registry():
+  """
+  Returns the shared EntityRegistry, rebuilding it only when a mapper CSV
+  has been modified since it was loaded (e.g. after fetch_mappers runs).
+  """
+  global _registry
+  with _registry_lock:
+    if _registry is None or _registry.is_stale():
+      _registry = EntityRegistry()
+    return _registry
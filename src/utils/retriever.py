@@ -0,0 +1,268 @@
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+import asyncio
+import numpy as np
+import faiss
+
+from src.utils.metadata_store import MetadataStore, FILTER_FIELDS
+from src.utils.tracing import span, in_context
+from src.vectorstore.index_factory import ShardedIndex, search_index
+
+# Reciprocal rank fusion constant: a row scores sum(1 / (RRF_K + rank)) over the rankings it appears in
+RRF_K = 60
+
+def reciprocal_rank_fusion(rankings, k: int, rrf_k: int = RRF_K):
+  """
+  Merges ranked row ID arrays (best first) into one ranking.
+  Returns:
+      tuple: (rows, fused scores), best first.
+  """
+  rankings = [np.asarray(ranking, dtype=np.int64) for ranking in rankings]
+  rows = np.concatenate(rankings)
+  contributions = np.concatenate([1.0 / (rrf_k + np.arange(1, len(ranking) + 1)) for ranking in rankings])
+  unique_rows, positions = np.unique(rows, return_inverse=True)
+  scores = np.bincount(positions, weights=contributions, minlength=len(unique_rows))
+  best = np.argsort(-scores, kind="stable")[:k]
+  return unique_rows[best], scores[best]
+
+class FilteredRetriever:
+
+  def __init__(self, vector_store, filter_fields=FILTER_FIELDS, metadata_store=None, lexical_index=None, timeline_index=None, change_table=None):
+    self.vector_store = vector_store
+    self.filter_fields = filter_fields
+    # Pass the store saved at ingest (MetadataStore.load_or_build); building it here scans the docstore
+    self.metadata_store = metadata_store or MetadataStore.from_vector_store(vector_store, filter_fields)
+    # Optional LexicalIndex: when set, searches fuse BM25 and vector rankings (exact terms such as "7.37e" or "0.45")
+    self.lexical_index = lexical_index
+    self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25") if lexical_index is not None else None
+    # Optional TimelineIndex: per-entity postings by patch timestamp for range questions ("since 7.30")
+    self.timeline_index = timeline_index
+    # Optional ChangeTable: numeric changes for aggregate questions ("biggest nerfs in 7.38")
+    self.change_table = change_table
+
+  def candidate_ids(self, filter_criteria: dict):
+    """
+    Resolves the dynamic_filter() output to the FAISS row IDs that match it.
+    Returns:
+        np.ndarray | None: The matching row IDs, or None when nothing is filtered.
+    """
+    with span("straining"):
+      return self.metadata_store.select(filter_criteria)
+
+  def get_documents(self, rows):
+    docstore = self.vector_store.docstore
+    with span("docstore_fetch"):
+      return [docstore.search(self.vector_store.index_to_docstore_id[int(row)]) for row in rows]
+
+  def structured_search(self, filter_criteria: dict, context_budget):
+    """
+    Answers fully filtered questions from metadata alone: when the filters pin
+    down a set of chunks that fits the context budget, returns all of them
+    ordered by patch timestamp, without a vector search.
+    Returns:
+        list | None: The documents, or None when vector ranking is needed.
+    """
+    ids = self.candidate_ids(filter_criteria)
+    if ids is None:
+      return None
+    if ids.size == 0:
+      return []
+    if self.metadata_store.known_tokens(ids) > context_budget.max_tokens:
+      return None
+    docs = self.get_documents(self.metadata_store.order_by_timestamp(ids))
+    return docs if context_budget.fits(docs) else None
+
+  def timeline_search(self, timeline: dict, filter_criteria: dict, context_budget):
+    """
+    Answers range questions about one entity (timeline_filter() output) from
+    the timeline index, without a vector search: every chunk of the entity in
+    the patch range, oldest first. The category filter still applies; over
+    the budget, the oldest chunks are dropped.
+    Returns:
+        list | None: The documents, or None when the entity is not in the index.
+    """
+    if self.timeline_index is None:
+      return None
+    with span("timeline_lookup"):
+      rows = self.timeline_index.lookup(
+        timeline["entity_kind"], timeline["entity"],
+        since=timeline.get("since"), until=timeline.get("until"), last_n=timeline.get("last_n")
+      )
+    if rows is None:
+      return None
+    if "category" in filter_criteria and rows.size:
+      rows = rows[np.isin(rows, self.candidate_ids({"category": filter_criteria["category"]}))]
+    docs = self.get_documents(rows)
+    return context_budget.pack(docs[::-1])[::-1]
+
+  def change_search(self, aggregate: dict, context_budget):
+    """
+    Answers aggregate questions (aggregate_filter() output) from the change
+    table: one line per matching change, largest first or in patch order,
+    instead of every chunk that mentions them.
+    Returns:
+        list | None: One document per change, or None when the table has no matching rows.
+    """
+    if self.change_table is None:
+      return None
+    conditions = {key: value for key, value in aggregate.items() if key not in ("order", "limit")}
+    with span("change_lookup"):
+      rows = self.change_table.select(**conditions)
+      if not rows.size and "attribute" in conditions and ("entity" in conditions or "hero" in conditions):
+        # The "attribute" may be the rest of the entity's name ("blink dagger" matches the item "blink")
+        conditions.pop("attribute")
+        rows = self.change_table.select(**conditions)
+      rows = self.change_table.rank(rows, aggregate.get("order", "magnitude"), aggregate.get("limit"))
+    if not rows.size:
+      return None
+    table = self.change_table
+    docs = [
+      Document(
+        page_content=table.describe(row),
+        metadata={"patch_version": table.value("patch_version", row), "category": "changes", "patch_timestamp": int(table.patch_timestamps[row])}
+      )
+      for row in rows.tolist()
+    ]
+    return context_budget.pack(docs)
+
+  def to_search_vector(self, embedding):
+    return self.to_search_vectors([embedding])
+
+  def to_search_vectors(self, embeddings):
+    vectors = np.array(embeddings, dtype=np.float32)
+    if getattr(self.vector_store, "_normalize_L2", False):
+      faiss.normalize_L2(vectors)
+    return vectors
+
+  def embed_query(self, query: str):
+    with span("query_embedding"):
+      return self.to_search_vector(self.vector_store.embedding_function.embed_query(query))
+
+  def embed_queries(self, queries: list):
+    # Many queries in one embedding call (batch jobs); returns an (n, d) matrix
+    with span("query_embedding"):
+      return self.to_search_vectors(self.vector_store.embedding_function.embed_documents(queries))
+
+  async def aembed_query(self, query: str):
+    with span("query_embedding"):
+      return self.to_search_vector(await self.vector_store.embedding_function.aembed_query(query))
+
+  def vector_rows(self, vector, ids, k: int):
+    """
+    Vector top-k over all rows (ids is None) or over the given row IDs.
+    Returns:
+        tuple: (rows, scores), closest first.
+    """
+    return self.vector_rows_batch(vector, ids, k)[0]
+
+  def vector_rows_batch(self, vectors, ids, k: int):
+    """
+    vector_rows() for an (n, d) matrix of queries sharing the same candidate
+    rows, in one FAISS call.
+    Returns:
+        list: One (rows, scores) pair per query.
+    """
+    index = self.vector_store.index
+    with span("faiss_search"):
+      if isinstance(index, ShardedIndex):
+        # Sharded vectorstore: fan out to the shards holding the candidates and merge
+        distances, rows = index.search_rows(vectors, ids, k)
+      else:
+        distances, rows = search_index(index, vectors, ids, k)
+    results = []
+    for query_rows, query_distances in zip(rows, distances):
+      found = query_rows != -1
+      results.append((query_rows[found].astype(np.int64), query_distances[found]))
+    return results
+
+  def lexical_rows(self, query: str, ids, k: int):
+    with span("lexical_search"):
+      return self.lexical_index.search(query, ids, k)
+
+  def with_documents(self, rows, scores):
+    docs = self.get_documents(rows)
+    return [(doc, float(score)) for doc, score in zip(docs, scores)]
+
+  def search_by_vector(self, vector, filter_criteria: dict, k: int = 1000):
+    """
+    Runs the vector search only over the documents matching the filters.
+    Args:
+        vector (np.ndarray): The (1, d) query embedding.
+        filter_criteria (dict): The metadata filters from dynamic_filter().
+        k (int): Number of documents to return.
+    Returns:
+        list: (Document, score) pairs, closest first.
+    """
+    ids = self.candidate_ids(filter_criteria)
+    if ids is not None and ids.size == 0:
+      return []
+    return self.with_documents(*self.vector_rows(vector, ids, k))
+
+  def hybrid_search(self, query: str, filter_criteria: dict, k: int = 1000, vector=None):
+    """
+    BM25 and vector search over the documents matching the filters, merged
+    with reciprocal rank fusion. BM25 runs on the retriever's thread pool
+    while the query is embedded (unless vector is given) and FAISS searches
+    in the calling thread.
+    Returns:
+        list: (Document, fused score) pairs, best first.
+    """
+    ids = self.candidate_ids(filter_criteria)
+    if ids is not None and ids.size == 0:
+      return []
+    lexical = self.executor.submit(in_context(self.lexical_rows), query, ids, k)
+    if vector is None:
+      vector = self.embed_query(query)
+    vector_rows, _ = self.vector_rows(vector, ids, k)
+    lexical_rows, _ = lexical.result()
+    return self.with_documents(*reciprocal_rank_fusion([vector_rows, lexical_rows], k))
+
+  def search_with_scores(self, query: str, filter_criteria: dict, k: int = 1000):
+    if self.lexical_index is not None:
+      return self.hybrid_search(query, filter_criteria, k)
+    return self.search_by_vector(self.embed_query(query), filter_criteria, k)
+
+  def search(self, query: str, filter_criteria: dict, k: int = 1000):
+    return [doc for doc, _ in self.search_with_scores(query, filter_criteria, k)]
+
+  def search_batch(self, queries: list, vectors, filter_criteria: dict, k: int = 1000):
+    """
+    search() for many queries sharing the same filters: the filters are
+    resolved once and the (n, d) query matrix is searched in one FAISS call.
+    With a lexical index, the BM25 rankings run on the thread pool meanwhile.
+    Returns:
+        list: The documents of each query, best first.
+    """
+    ids = self.candidate_ids(filter_criteria)
+    if ids is not None and ids.size == 0:
+      return [[] for _ in queries]
+    lexical = None
+    if self.lexical_index is not None:
+      lexical = [self.executor.submit(in_context(self.lexical_rows), query, ids, k) for query in queries]
+    results = []
+    for i, (rows, _) in enumerate(self.vector_rows_batch(vectors, ids, k)):
+      if lexical is not None:
+        rows, _ = reciprocal_rank_fusion([rows, lexical[i].result()[0]], k)
+      results.append(self.get_documents(rows))
+    return results
+
+  async def asearch(self, query: str, filter_criteria: dict, k: int = 1000):
+    """
+    Async variant of search(): awaits the query embedding and runs the FAISS
+    search in a worker thread (FAISS releases the GIL) so the event loop stays free.
+    With a lexical index, BM25 scoring starts while the query is being embedded.
+    """
+    if self.lexical_index is None:
+      vector = await self.aembed_query(query)
+      results = await asyncio.to_thread(self.search_by_vector, vector, filter_criteria, k)
+      return [doc for doc, _ in results]
+
+    ids = self.candidate_ids(filter_criteria)
+    if ids is not None and ids.size == 0:
+      return []
+    lexical = asyncio.get_running_loop().run_in_executor(self.executor, in_context(self.lexical_rows), query, ids, k)
+    vector = await self.aembed_query(query)
+    vector_rows, _ = await asyncio.to_thread(self.vector_rows, vector, ids, k)
+    lexical_rows, _ = await lexical
+    rows, _ = reciprocal_rank_fusion([vector_rows, lexical_rows], k)
+    return await asyncio.to_thread(self.get_documents, rows)
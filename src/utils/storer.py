@@ -1,14 +1,64 @@
-from langchain_community.document_loaders import JSONLoader
+from langchain_core.documents import Document
+from pathlib import Path
+import orjson
 import json
+import os
 import re
 
+from src.utils.transforms import DEFAULT_TRANSFORMS, apply_transforms
+
+# Numeric change lines: "Damage per attribute decreased from 0.7 to 0.45", "Cooldown reduced from 80/65/50 to 75/60/45s",
+# ranges ("Base Damage decreased by 19 (from 31-35 to 12-16)") and lines without a verb ("Slow from 12/20% to 15/25%")
+CHANGE_VERBS = ("increased", "decreased", "reduced", "rescaled", "changed", "improved", "lowered", "raised")
+CHANGE_VALUE = r"[+-]?\d+(?:\.\d+)?(?:-\d+(?:\.\d+)?)?(?:%|x|s\b)?"
+CHANGE_LEVELS = rf"{CHANGE_VALUE}(?:\s*/\s*{CHANGE_VALUE})*"
+# The "from A to B" span is matched first; attribute and verb are read from the clause before it
+CHANGE_PATTERN = re.compile(rf"\bfrom\s+(?P<old>{CHANGE_LEVELS})\s+to\s+(?P<new>{CHANGE_LEVELS})")
+CLAUSE_PATTERN = re.compile(
+  rf"^\s*(?:and\s+)?(?P<attribute>[^.,;:()]*?)\s*(?:\b(?P<verb>{'|'.join(CHANGE_VERBS)})\s*)?(?:\bby\s+[\d.+-]+\s+\(\s*)?$",
+  re.IGNORECASE
+)
+CHANGE_NUMBER = re.compile(r"[+-]?\d+(?:\.\d+)?")
+
+def parse_levels(values):
+  # "10/15/20%" -> [10.0, 15.0, 20.0]; a range level ("31-35") counts as its midpoint
+  levels = []
+  for level in values.split("/"):
+    bounds = [abs(float(bound)) if i else float(bound) for i, bound in enumerate(CHANGE_NUMBER.findall(level))]
+    levels.append(sum(bounds) / len(bounds))
+  return levels
+
+def parse_numeric_changes(note):
+  """
+  Parses the "X increased from A to B" clauses of one note.
+  Returns:
+      list: (attribute, verb, old levels, new levels) tuples; per-level values ("1/2/3") give one float per level.
+  """
+  changes = []
+  clause_start = 0
+  for match in CHANGE_PATTERN.finditer(note):
+    prefix = note[clause_start:match.start()]
+    # The clause runs from the last separator, except the "(" of "decreased by 2 (from ..."
+    stripped = re.sub(r"\(\s*$", "", prefix)
+    boundary = max(stripped.rfind(separator) for separator in ".,;:()") + 1
+    clause = CLAUSE_PATTERN.search(prefix[boundary:])
+    attribute = clause.group("attribute").strip().lower() if clause else ""
+    verb = (clause.group("verb") or "changed").lower() if clause else "changed"
+    changes.append((attribute, verb, parse_levels(match.group("old")), parse_levels(match.group("new"))))
+    clause_start = match.end()
+  return changes
+
 class ConvertPatchNotesToDocuments:
 
-  def __init__(self, patch_note, dict_heroes_abilities_mapper, dict_heroes_mapper, dict_items_mapper):
+  def __init__(self, patch_note, dict_heroes_abilities_mapper, dict_heroes_mapper, dict_items_mapper,
+               patch_notes_path="./patchnotes", transforms=DEFAULT_TRANSFORMS):
     self.patch_note=patch_note
     self.dict_heroes_abilities_mapper = dict_heroes_abilities_mapper
     self.dict_heroes_mapper = dict_heroes_mapper
     self.dict_items_mapper = dict_items_mapper
+    self.file_path = os.path.join(patch_notes_path, self.patch_note)
+    # Normalization runs in memory on the raw patch (no patchnotes_modified round-trip)
+    self.transforms = transforms
 
   # Common
   # For replacing id vars with actual ability/hero/item names
@@ -24,184 +74,141 @@ class ConvertPatchNotesToDocuments:
       doc.page_content = f"{field_name}: {doc.metadata[field]}. {doc.page_content}"  
     return documents
 
-  def add_patch_metadata(self):
-     # Pre-load JSON file and extract timestamp
-    with open(f"./patchnotes_modified/{self.patch_note}", "r") as f:
-        patch_data = json.load(f)
-        patch_timestamp = patch_data.get("patch_timestamp", "N/A")
-        patch_number = patch_data.get("patch_number", "N/A")
-    return patch_number, patch_timestamp
+  def load_patch_data(self):
+    # Parse the patch JSON once and normalize it; every document category is built from this dict
+    with open(self.file_path, "rb") as f:
+      return apply_transforms(orjson.loads(f.read()), self.transforms)
+
+  @staticmethod
+  def get_records(patch_data, section):
+    """
+    Returns the records of a top-level section (e.g. "heroes"), or None when
+    the patch has no such section.
+    """
+    records = patch_data.get(section)
+    if records is None:
+      return None
+    if not isinstance(records, list):
+      raise ValueError(f"Expected a list for '{section}', got {type(records).__name__}")
+    return records
+
+  @staticmethod
+  def get_content(record, content_key, validate=False):
+    """
+    Renders a record's content the same way JSONLoader did (text_content=False):
+    strings as-is, dicts as JSON, everything else via str().
+    """
+    if validate and (not isinstance(record, dict) or record.get(content_key) is None):
+      raise ValueError(f"Expected the first record to have a non-null '{content_key}' key")
+    content = record[content_key]
+    if isinstance(content, str):
+      return content
+    elif isinstance(content, dict):
+      return json.dumps(content) if content else ""
+    return str(content) if content is not None else ""
 
   # Main Logic
-  def convert(self):
-    # Initialize empty list for document objects storage
-    docs_all = []
-    patch_number, patch_timestamp = self.add_patch_metadata()
-
-    # (1) Heroes' abilities
-    def extract_hero_abilities_metadata(record: dict, metadata: dict) -> dict:
-      metadata["hero_id"] = record.get("hero_id")
-      abilities=record.get("abilities", [])
-      if abilities:
-        metadata["ability_id"] = abilities[0].get("ability_id")
-      else:
-        metadata["ability_id"] = "N/A"
-      metadata["category"] = "heroes-abilities"
-      return metadata
+  def convert(self, patch_data=None):
+    # patch_data: the already-parsed patch (see load_patch_data), so other ingest stages can share one parse
+    patch_data = self.load_patch_data() if patch_data is None else patch_data
+    patch_timestamp = patch_data.get("patch_timestamp", "N/A")
+    patch_number = patch_data.get("patch_number", "N/A")
+    source = str(Path(self.file_path).resolve())
 
-    try:
-      loader_heroes_abilities = JSONLoader(
-        file_path=f"./patchnotes_modified/{self.patch_note}",
-        jq_schema=".heroes[]",
-        content_key="abilities",
-        text_content=False,
-        metadata_func=lambda r, m: {**extract_hero_abilities_metadata(r, m), "patch_timestamp": patch_timestamp, "patch_version": patch_number}
-      )
-
-      # Generate doc objects via JSONLoader
-      docs_heroes_abilities = loader_heroes_abilities.load()
-
-      # Replace hero ids with actual names
-      docs_heroes_abilities = (
-        self.replace_id_with_name(
-          documents=docs_heroes_abilities, 
-          dict_map=self.dict_heroes_mapper,
-          field="hero_id",
-          field_name="Hero")
-      )
-      # Replace ability ids with actual names
-      docs_heroes_abilities = (
-        self.replace_id_with_name(
-          documents=docs_heroes_abilities, 
-          dict_map=self.dict_heroes_abilities_mapper,
-          field="ability_id",
-          field_name="Ability")
-      )
-      # Append to docs_all
-      docs_all.append(docs_heroes_abilities)
-    except Exception as e:
-      print(f"Error processing heroes' abilities for patch note {self.patch_note}: {e}")
-      pass
-
-    # (2) Heroes' talents
-    # Heroes Talents
-    def extract_metadata_heroes_talents(record: dict, metadata: dict) -> dict:
-      metadata["hero_id"] = record.get("hero_id")
-      metadata["category"] = "heroes-talents"
-      return metadata
+    # Hero records feed three categories: (content key, category, error label)
+    hero_categories = [
+      ("abilities", "heroes-abilities", "heroes' abilities"),
+      ("talent_notes", "heroes-talents", "heroes' talents"),
+      ("hero_notes", "heroes-base", "heroes' bases"),
+    ]
 
-    try:
-      loader_heroes_talents = JSONLoader(
-        file_path=f"patchnotes_modified/{self.patch_note}",
-        jq_schema=".heroes[]",
-        content_key="talent_notes",
-        text_content=False,
-        metadata_func=lambda r, m: {**extract_metadata_heroes_talents(r, m), "patch_timestamp": patch_timestamp, "patch_version": patch_number}
-      )
-      # Generate doc objects via JSONLoader
-      docs_heroes_talents = loader_heroes_talents.load()
-      # Replace hero ids with actual names
-      docs_heroes_talents = (
-        self.replace_id_with_name(
-          documents=docs_heroes_talents, 
-          dict_map=self.dict_heroes_mapper,
-          field="hero_id",
-          field_name="Hero")
-      )
-      # Append to docs_all
-      docs_all.append(docs_heroes_talents)
-    except Exception as e:
-      print(f"Error processing heroes' talents for patch note {self.patch_note}: {e}")
-      pass
-  
-    # (3) Heroes' base
-    # Heroes Base
-    def extract_metadata_heroes_base(record: dict, metadata: dict) -> dict:
-      metadata["hero_id"] = record.get("hero_id")
-      metadata["category"] = "heroes-base"
+    def hero_metadata(record, category, seq_num):
+      metadata = {"source": source, "seq_num": seq_num, "hero_id": record.get("hero_id")}
+      if category == "heroes-abilities":
+        abilities = record.get("abilities", [])
+        metadata["ability_id"] = abilities[0].get("ability_id") if abilities else "N/A"
+        # Every ability the record changes (ability_id above only names the first), for the timeline index
+        metadata["ability_ids"] = list(dict.fromkeys(ability.get("ability_id") for ability in abilities if ability.get("ability_id") is not None))
+      metadata["category"] = category
+      metadata["patch_timestamp"] = patch_timestamp
+      metadata["patch_version"] = patch_number
       return metadata
 
+    # (1)-(3) Heroes' abilities, talents and base: one walk over the hero records.
+    # As before, a malformed record drops its whole category for this patch.
+    docs_heroes = {category: [] for _, category, _ in hero_categories}
     try:
-      loader_heroes_base = JSONLoader(
-        file_path=f"patchnotes_modified/{self.patch_note}",
-        jq_schema=".heroes[]",
-        content_key="hero_notes",
-        text_content=False,
-        metadata_func=lambda r, m: {**extract_metadata_heroes_base(r, m), "patch_timestamp": patch_timestamp, "patch_version": patch_number}
-      )
-      # Generate doc objects via JSONLoader
-      docs_heroes_base = loader_heroes_base.load()
-      # Replace hero ids with actual names
-      docs_heroes_base = (
-        self.replace_id_with_name(
-          documents=docs_heroes_base, 
-          dict_map=self.dict_heroes_mapper,
-          field="hero_id",
-          field_name="Hero")
-      )
-      # Append to docs_all
-      docs_all.append(docs_heroes_base)
+      heroes = self.get_records(patch_data, "heroes") or []
     except Exception as e:
-      print(f"Error processing heroes' bases for patch note {self.patch_note}: {e}")
-      pass
-  
-    # (4) Items
-    # Items
-    def extract_metadata_items(record: dict, metadata: dict) -> dict:
-      metadata["item_id"] = record.get("ability_id")
-      metadata["category"] = "items"
-      return metadata
+      print(f"Error processing heroes for patch note {self.patch_note}: {e}")
+      heroes = []
+    failed = set()
+    for seq_num, record in enumerate(heroes, 1):
+      for content_key, category, label in hero_categories:
+        if category in failed:
+          continue
+        try:
+          docs_heroes[category].append(Document(
+            page_content=self.get_content(record, content_key, validate=seq_num == 1),
+            metadata=hero_metadata(record, category, seq_num)
+          ))
+        except Exception as e:
+          print(f"Error processing {label} for patch note {self.patch_note}: {e}")
+          failed.add(category)
+          docs_heroes[category] = []
+
+    # Replace hero/ability ids with actual names
+    for category, docs in docs_heroes.items():
+      self.replace_id_with_name(documents=docs, dict_map=self.dict_heroes_mapper, field="hero_id", field_name="Hero")
+    self.replace_id_with_name(
+      documents=docs_heroes["heroes-abilities"],
+      dict_map=self.dict_heroes_abilities_mapper,
+      field="ability_id",
+      field_name="Ability"
+    )
+    for doc in docs_heroes["heroes-abilities"]:
+      doc.metadata["ability_ids"] = [self.dict_heroes_abilities_mapper.get(str(id), id) for id in doc.metadata["ability_ids"]]
 
+    # (4) Items
+    docs_items = []
     try:
-      loader_items = JSONLoader(
-        file_path=f"patchnotes_modified/{self.patch_note}",
-        jq_schema=".items[]",
-        content_key="ability_notes",
-        is_content_key_jq_parsable=False,
-        text_content=False,
-        metadata_func=lambda r, m: {**extract_metadata_items(r, m), "patch_timestamp": patch_timestamp, "patch_version": patch_number}
-      )
-      # Generate doc objects via JSONLoader
-      docs_items = loader_items.load()
+      for seq_num, record in enumerate(self.get_records(patch_data, "items") or [], 1):
+        docs_items.append(Document(
+          page_content=self.get_content(record, "ability_notes", validate=seq_num == 1),
+          metadata={
+            "source": source, "seq_num": seq_num, "item_id": record.get("ability_id"), "category": "items",
+            "patch_timestamp": patch_timestamp, "patch_version": patch_number
+          }
+        ))
       # Replace item ids with actual names
-      docs_items = (
-        self.replace_id_with_name(
-          documents=docs_items, 
-          dict_map=self.dict_items_mapper,
-          field="item_id",
-          field_name="Item")
-      )
-      # Append to docs_all
-      docs_all.append(docs_items)
+      self.replace_id_with_name(documents=docs_items, dict_map=self.dict_items_mapper, field="item_id", field_name="Item")
     except Exception as e:
       print(f"Error processing items for patch note {self.patch_note}: {e}")
-      pass
+      docs_items = []
 
     # (5) Generic patch updates
-    # Pre-load JSON file and extract timestamp
+    docs_generic_updates = []
     try:
-      loader_generic_updates = JSONLoader(
-        file_path=f"./patchnotes_modified/{self.patch_note}",
-        jq_schema=".generic[]",
-        content_key="note",
-        text_content=False,
-        metadata_func=lambda r, m: {**m, "category": "generic-updates", "patch_timestamp": patch_timestamp, "patch_version": patch_number}
-      )
-
-      # Generate doc objects via JSONLoader
-      docs_generic_updates = loader_generic_updates.load()
-
-      # Append to docs_all
-      docs_all.append(docs_generic_updates)
+      for seq_num, record in enumerate(self.get_records(patch_data, "generic") or [], 1):
+        docs_generic_updates.append(Document(
+          page_content=self.get_content(record, "note", validate=seq_num == 1),
+          metadata={
+            "source": source, "seq_num": seq_num, "category": "generic-updates",
+            "patch_timestamp": patch_timestamp, "patch_version": patch_number
+          }
+        ))
     except Exception as e:
       print(f"Error processing generic updates for patch note {self.patch_note}: {e}")
-      pass
-  
-    # (6) Get docs_all
-    docs_all = [doc for doc_list in docs_all for doc in doc_list]
-
-    
+      docs_generic_updates = []
 
+    # (6) Get docs_all (same category order as before)
+    docs_all = [
+      *docs_heroes["heroes-abilities"],
+      *docs_heroes["heroes-talents"],
+      *docs_heroes["heroes-base"],
+      *docs_items,
+      *docs_generic_updates,
+    ]
     return docs_all
   
 class SanitizeDocuments:
@@ -242,4 +249,67 @@ class SanitizeDocuments:
       doc.page_content = clean_content.strip()
       sanitized_docs.append(doc)
 
-    return sanitized_docs
\ No newline at end of file
+    return sanitized_docs
+
+class ExtractNumericChanges:
+  """
+  Ingest stage run next to SanitizeDocuments: parses the numeric change lines
+  of one patch into flat records for the ChangeTable. It reads the normalized
+  patch dict rather than the documents, because a heroes-abilities document
+  mixes every ability of the hero.
+  """
+
+  def __init__(self, patch_data, dict_heroes_abilities_mapper, dict_heroes_mapper, dict_items_mapper):
+    self.patch_data = patch_data
+    self.dict_heroes_abilities_mapper = dict_heroes_abilities_mapper
+    self.dict_heroes_mapper = dict_heroes_mapper
+    self.dict_items_mapper = dict_items_mapper
+
+  @staticmethod
+  def iter_notes(notes):
+    # Note lists hold {"note": ...} dicts, or plain strings for the "None" defaults added by the transforms
+    for note in notes or []:
+      text = note.get("note") if isinstance(note, dict) else note
+      if isinstance(text, str):
+        yield text
+
+  def records(self, notes, entity_kind, entity, hero, category):
+    for note in self.iter_notes(notes):
+      for attribute, verb, old_levels, new_levels in parse_numeric_changes(note):
+        yield {
+          "entity_kind": entity_kind, "entity": entity, "hero": hero, "category": category,
+          "attribute": attribute, "verb": verb, "old_levels": old_levels, "new_levels": new_levels,
+          # Drop the "The following are the changes in ...: " prefix added by the transforms
+          "note": note.split(": ", 1)[1] if note.startswith("The following are the changes") else note
+        }
+
+  def extract(self):
+    """
+    Returns:
+        list: One dict per parsed change (entity_kind, entity, hero, category, attribute, verb,
+              old_levels, new_levels, note, patch_version, patch_timestamp); names are lower-cased.
+    """
+    def name(dict_map, entity_id):
+      return str(dict_map.get(str(entity_id), entity_id)).strip().lower()
+
+    changes = []
+    for record in self.patch_data.get("heroes") or []:
+      hero = name(self.dict_heroes_mapper, record.get("hero_id"))
+      for ability in record.get("abilities") or []:
+        ability_name = name(self.dict_heroes_abilities_mapper, ability.get("ability_id"))
+        changes.extend(self.records(ability.get("ability_notes"), "ability", ability_name, hero, "heroes-abilities"))
+      changes.extend(self.records(record.get("talent_notes"), "hero", hero, hero, "heroes-talents"))
+      changes.extend(self.records(record.get("hero_notes"), "hero", hero, hero, "heroes-base"))
+    for section in ("items", "neutral_items"):
+      for record in self.patch_data.get(section) or []:
+        item = name(self.dict_items_mapper, record.get("ability_id"))
+        changes.extend(self.records(record.get("ability_notes"), "item", item, "N/A", "items"))
+    for record in self.patch_data.get("general_notes") or []:
+      changes.extend(self.records(record.get("generic"), "generic", "N/A", "N/A", "generic-updates"))
+
+    patch_version = self.patch_data.get("patch_number", "N/A")
+    patch_timestamp = self.patch_data.get("patch_timestamp") or 0
+    for change in changes:
+      change["patch_version"] = patch_version
+      change["patch_timestamp"] = patch_timestamp
+    return changes
@@ -1,24 +1,33 @@
 import re
-import csv
 import os
 
+from src.utils.registry import get_entity_registry
+from src.utils.tracing import sampled_log
+
+PATCH_VERSION = r"7\.\d+[a-z]?"
+BETWEEN_PATTERN = re.compile(rf"\b(?:between|from)\s+(?:patch\s+)?({PATCH_VERSION})\s+(?:and|to)\s+(?:patch\s+)?({PATCH_VERSION})")
+SINCE_PATTERN = re.compile(rf"\b(?:since|after|starting (?:from|with))\s+(?:patch\s+)?({PATCH_VERSION})")
+UNTIL_PATTERN = re.compile(rf"\b(?:until|up to|through)\s+(?:patch\s+)?({PATCH_VERSION})")
+LAST_N_PATTERN = re.compile(r"\b(?:last|past|previous|recent)\s+(\d+|two|three|four|five|six|seven|eight|nine|ten)\s+(?:patch(?:es)?|updates)")
+# Aggregate questions over the change table: "biggest nerfs in 7.38", "all cooldown reductions for items", "top 5 Pudge buffs"
+AGGREGATE_PATTERN = re.compile(
+    r"\b(?P<scope>biggest|largest|most significant|top(?:\s+(?P<limit>\d+))?|major|all|every|list(?: of)?(?: all)?)\s+(?:the\s+)?"
+    r"(?P<attribute>[a-z' ]*?)\s*\b(?P<change>nerfs|buffs|increases|reductions|decreases)\b"
+)
+AGGREGATE_CHANGES = {"nerfs": "nerf", "buffs": "buff", "increases": "increase", "reductions": "decrease", "decreases": "decrease"}
+# Words naming the entity kind rather than an attribute; hero changes include their abilities
+ENTITY_KIND_WORDS = {
+    "item": "item", "items": "item", "hero": ["hero", "ability"], "heroes": ["hero", "ability"],
+    "ability": "ability", "abilities": "ability"
+}
+NUMBER_WORDS = {"two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+
 class FilterRetrievedDocuments:
 
   def __init__(self, query, previous_query=None):    
     self.query = query
     self.previous_query = previous_query  # Store previous query for context inference
 
-  def load_set_from_csv(self,csv_path, key="name"):
-    """
-    Loads a set of names from a CSV file based on a specific column key.
-    """
-    data_set = set()
-    with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            data_set.add(row[key].strip().lower())
-    return data_set
-  
   def get_latest_patch_version(self, folder_path):
     """
     Scans the folder for patch files and extracts the latest patch version.
@@ -51,47 +60,48 @@ class FilterRetrievedDocuments:
       prev_query_lower = self.previous_query.lower() if self.previous_query else ""
       filter_dict = {}
 
-      # Load CSV data sets
+      # Shared entity matcher (built once per process, rebuilt when the mapper CSVs change)
       patch_pattern = re.compile(r"7\.\d+[a-z]?")
-      heroes_set = self.load_set_from_csv("./data/mappers/heroes_mapper.csv")
-      items_set = self.load_set_from_csv("./data/mappers/items_mapper.csv")
-      abilities_set = self.load_set_from_csv("./data/mappers/heroes_abilities_mapper.csv")
+      matcher = get_entity_registry().matcher
+      query_matches = matcher.find_all(query_lower)
+      prev_query_matches = matcher.find_all(prev_query_lower)
 
       # 1. Extract patch version or detect 'latest'
       if "latest" in query_lower:
-          latest_patch = self.get_latest_patch_version("./patchnotes_modified")
-          print(latest_patch)
+          latest_patch = self.get_latest_patch_version("./patchnotes")
+          sampled_log("Latest patch", latest_patch)
           if latest_patch:
               filter_dict["patch_version"] = latest_patch
-      else:
+      elif not self.patch_range(query_lower):
+          # A patch range ("since 7.30") spans several patches and is served by timeline_filter()
           patch_match = patch_pattern.findall(query_lower) or patch_pattern.findall(prev_query_lower)
           if patch_match:
               filter_dict["patch_version"] = patch_match[0]
 
       # 2. Determine category and relevant IDs
-      hero_id = next((hero for hero in heroes_set if hero in query_lower), None)
+      hero_id = matcher.first(query_matches, "heroes")
       if not hero_id:
-          hero_id = next((hero for hero in heroes_set if hero in prev_query_lower), None)
+          hero_id = matcher.first(prev_query_matches, "heroes")
+      item_id = matcher.first(query_matches, "items")
+      ability_id = matcher.first(query_matches, "abilities")
       if hero_id:
           filter_dict["hero_id"] = hero_id
 
           # Check for specific keywords to filter categories
           if "talent" in query_lower:
               filter_dict["category"] = ["heroes-talents"]
-          elif "skill" in query_lower or "ability" in query_lower:
+          elif "skill" in query_lower or "ability" in query_lower or ability_id:
               filter_dict["category"] = ["heroes-abilities"]
           elif "base" in query_lower:
               filter_dict["category"] = ["heroes-base"]
           else:
               filter_dict["category"] = ["heroes", "heroes-abilities", "heroes-base", "heroes-talents"]
 
-      elif any(item in query_lower for item in items_set):
-          item_id = next(item for item in items_set if item in query_lower)
+      elif item_id:
           filter_dict["item_id"] = item_id
           filter_dict["category"] = "items"
 
-      elif any(ability in query_lower for ability in abilities_set):
-          ability_id = next(ability for ability in abilities_set if ability in query_lower)
+      elif ability_id:
           filter_dict["ability_id"] = ability_id
           filter_dict["category"] = "heroes-abilities"
 
@@ -103,6 +113,110 @@ class FilterRetrievedDocuments:
 
       return filter_dict
 
+  @staticmethod
+  def patch_range(query_lower: str) -> dict:
+      """
+      Extracts a patch range: "between 7.33 and 7.35", "since 7.30", "until 7.36",
+      "in the last 3 patches".
+      Returns:
+          dict: Any of "since", "until" (versions, inclusive) and "last_n"; empty when there is no range.
+      """
+      patch_range = {}
+      between = BETWEEN_PATTERN.search(query_lower)
+      if between:
+          patch_range["since"], patch_range["until"] = between.group(1), between.group(2)
+      else:
+          since = SINCE_PATTERN.search(query_lower)
+          until = UNTIL_PATTERN.search(query_lower)
+          if since:
+              patch_range["since"] = since.group(1)
+          if until:
+              patch_range["until"] = until.group(1)
+      last_n = LAST_N_PATTERN.search(query_lower)
+      if last_n:
+          count = last_n.group(1)
+          patch_range["last_n"] = int(count) if count.isdigit() else NUMBER_WORDS[count]
+      return patch_range
+
+  def timeline_filter(self):
+      """
+      Detects questions about how one hero, item or ability changed over a
+      range of patches, which are answered from the timeline index.
+      Returns:
+          dict | None: {"entity_kind", "entity"} plus the patch_range() keys, or None.
+      """
+      query_lower = self.query.lower()
+      patch_range = self.patch_range(query_lower)
+      if not patch_range:
+          return None
+      matcher = get_entity_registry().matcher
+      # Leftmost-longest mentions across kinds, so a shorter ability alias inside another entity's name never wins
+      query_matches = matcher.resolve(matcher.find_all(query_lower))
+      # The most specific entity wins: "Pudge's Meat Hook" is a timeline of the ability
+      for kind, matcher_kind in (("ability", "abilities"), ("item", "items"), ("hero", "heroes")):
+          entity = matcher.first(query_matches, matcher_kind)
+          if entity:
+              return {"entity_kind": kind, "entity": entity, **patch_range}
+      if self.previous_query:
+          hero = matcher.first(matcher.find_all(self.previous_query.lower()), "heroes")
+          if hero:
+              return {"entity_kind": "hero", "entity": hero, **patch_range}
+      return None
+
+  def aggregate_filter(self):
+      """
+      Detects aggregate questions over the numeric changes ("biggest nerfs in
+      7.38", "all cooldown reductions for items"), answered from the change table.
+      Returns:
+          dict | None: ChangeTable.select() arguments plus "order" and "limit", or None.
+      """
+      query_lower = self.query.lower()
+      match = AGGREGATE_PATTERN.search(query_lower)
+      if not match:
+          return None
+      aggregate = {"change": AGGREGATE_CHANGES[match.group("change")]}
+      # Ranked questions keep the largest changes; "all ..." lists them in patch order
+      scope = match.group("scope")
+      aggregate["order"] = "chronological" if scope.startswith(("all", "every", "list")) else "magnitude"
+      aggregate["limit"] = int(match.group("limit")) if match.group("limit") else (None if aggregate["order"] == "chronological" else 20)
+
+      attribute_words = []
+      for word in match.group("attribute").split():
+          if word in ENTITY_KIND_WORDS:
+              aggregate["entity_kind"] = ENTITY_KIND_WORDS[word]
+          else:
+              attribute_words.append(word)
+      for word, kind in ENTITY_KIND_WORDS.items():
+          if "entity_kind" not in aggregate and re.search(rf"\b(?:for|to|of|on)\s+(?:all\s+)?{word}\b", query_lower):
+              aggregate["entity_kind"] = kind
+
+      # A named entity narrows the table: a hero's rows include their abilities and talents
+      matcher = get_entity_registry().matcher
+      query_matches = matcher.find_all(query_lower)
+      ability, item, hero = (matcher.first(query_matches, kind) for kind in ("abilities", "items", "heroes"))
+      if ability:
+          aggregate["entity"] = ability
+      elif item:
+          aggregate["entity"] = item
+      elif hero:
+          aggregate["hero"] = hero
+      # Words of the entity's name are not part of the attribute ("pudge buffs")
+      entity_words = set(" ".join(filter(None, (ability, item, hero))).split())
+      attribute = " ".join(word for word in attribute_words if word not in entity_words)
+      if attribute:
+          aggregate["attribute"] = attribute
+
+      if "latest" in query_lower:
+          aggregate["patch_version"] = self.get_latest_patch_version("./patchnotes")
+      else:
+          patch_range = self.patch_range(query_lower)
+          versions = re.findall(PATCH_VERSION, query_lower)
+          if patch_range:
+              aggregate.update(patch_range)
+          elif versions:
+              aggregate["patch_version"] = versions[0]
+      return aggregate
+
   def get_filtered_docs(self, retrieved_docs: list):
       """
       Filters the retrieved documents based on the query.
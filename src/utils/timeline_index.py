@@ -0,0 +1,138 @@
+from bisect import bisect_left, bisect_right
+import numpy as np
+import os
+
+from src.utils.metadata_store import fingerprint
+from src.vectorstore.conversion import version_sort_key
+
+TIMELINE_FILE = "timeline.npz"
+# Entity kind -> metadata field written by ConvertPatchNotesToDocuments (abilities: every ability of the hero record)
+ENTITY_FIELDS = {"hero": "hero_id", "item": "item_id", "ability": "ability_ids"}
+
+class TimelineIndex:
+  """
+  Change timeline of every hero, item and ability, aligned with the FAISS row IDs.
+  The postings of key "kind:name" are rows[indptr[i]:indptr[i + 1]], sorted by
+  patch timestamp (timestamps holds the same slice), so a patch range is two
+  binary searches plus a slice. The indexed patches are kept in version order
+  to resolve "since 7.30" or "last 3 patches" to timestamps.
+  """
+
+  def __init__(self, keys, indptr, rows, timestamps, patch_versions, patch_timestamps, chunk_fingerprint=""):
+    self.keys = keys
+    self.key_ids = {key: i for i, key in enumerate(keys.tolist())}
+    self.indptr = indptr
+    self.rows = rows
+    self.timestamps = timestamps
+    self.patch_versions = patch_versions
+    self.patch_timestamps = patch_timestamps
+    self.version_keys = [version_sort_key(version) for version in patch_versions.tolist()]
+    self.chunk_fingerprint = chunk_fingerprint
+
+  @classmethod
+  def from_metadata_store(cls, store):
+    """
+    Compiles the timeline from the columnar metadata (category codes are
+    already lower-cased entity names).
+    """
+    keys, orders, counts = [], [], []
+    for kind, field in ENTITY_FIELDS.items():
+      if field in store.codes:
+        rows = np.flatnonzero(store.codes[field] >= 0)
+        codes = store.codes[field][rows]
+      elif field in store.list_codes:
+        # List-valued: one (row, entity) pair per value, so a chunk can sit in several postings
+        rows, codes = store.list_rows[field], store.list_codes[field]
+      else:
+        continue
+      # By entity, then patch timestamp, then ingest order
+      orders.append(rows[np.lexsort((rows, store.patch_timestamps[rows], codes))])
+      counts.append(np.bincount(codes, minlength=len(store.categories[field])))
+      keys.extend(f"{kind}:{name}" for name in store.categories[field].tolist())
+
+    indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.concatenate(counts)) if counts else []
+    rows = np.concatenate(orders).astype(np.int64) if orders else np.empty(0, dtype=np.int64)
+
+    # Release timestamp of each patch version (its earliest chunk)
+    version_codes = store.codes["patch_version"]
+    versions = store.categories["patch_version"]
+    present = np.flatnonzero(version_codes >= 0)
+    first_timestamps = np.full(len(versions), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first_timestamps, version_codes[present], store.patch_timestamps[present])
+    order = sorted(range(len(versions)), key=lambda code: version_sort_key(versions[code]))
+    return cls(
+      np.array(keys, dtype=str), indptr, rows, store.patch_timestamps[rows],
+      versions[order], first_timestamps[order], fingerprint(store.doc_ids.tolist())
+    )
+
+  def save(self, directory):
+    np.savez(
+      os.path.join(directory, TIMELINE_FILE),
+      keys=self.keys, indptr=self.indptr, rows=self.rows, timestamps=self.timestamps,
+      patch_versions=self.patch_versions, patch_timestamps=self.patch_timestamps,
+      chunk_fingerprint=np.array(self.chunk_fingerprint)
+    )
+
+  @classmethod
+  def load(cls, directory):
+    with np.load(os.path.join(directory, TIMELINE_FILE), allow_pickle=False) as data:
+      return cls(
+        data["keys"], data["indptr"], data["rows"], data["timestamps"],
+        data["patch_versions"], data["patch_timestamps"], str(data["chunk_fingerprint"])
+      )
+
+  @classmethod
+  def load_or_build(cls, metadata_store, directory):
+    """
+    Loads the timeline saved at ingest, recompiling it from the metadata store
+    when it is missing or was built for other rows.
+    """
+    if os.path.exists(os.path.join(directory, TIMELINE_FILE)):
+      index = cls.load(directory)
+      if index.chunk_fingerprint == fingerprint(metadata_store.doc_ids.tolist()):
+        return index
+    return cls.from_metadata_store(metadata_store)
+
+  def since_timestamp(self, since=None, last_n=None):
+    # Earliest timestamp in range: the first patch >= since and/or the N-th most recent patch
+    bounds = []
+    if since:
+      position = bisect_left(self.version_keys, version_sort_key(since))
+      bounds.append(self.patch_timestamps[position] if position < len(self.version_keys) else np.iinfo(np.int64).max)
+    if last_n:
+      bounds.append(self.patch_timestamps[max(len(self.version_keys) - last_n, 0)] if self.version_keys else 0)
+    return max(bounds) if bounds else None
+
+  def until_timestamp(self, until=None):
+    # Latest timestamp in range: the last patch of the until version, letter releases included (7.33 -> 7.33c)
+    if not until:
+      return None
+    position = bisect_right(self.version_keys, version_sort_key(until) + ((2, ""),))
+    return self.patch_timestamps[position - 1] if position > 0 else -1
+
+  def lookup(self, kind, name, since=None, until=None, last_n=None):
+    """
+    Rows of one entity's chunks in patch order, restricted to a patch range.
+    Args:
+        kind (str): "hero", "item" or "ability".
+        name (str): The entity name as matched in the query.
+        since (str, optional): First patch version, inclusive.
+        until (str, optional): Last patch version, inclusive.
+        last_n (int, optional): Only the N most recent patches.
+    Returns:
+        np.ndarray | None: The row IDs, or None when the entity is not indexed.
+    """
+    key_id = self.key_ids.get(f"{kind}:{str(name).lower()}")
+    if key_id is None:
+      return None
+    start, end = self.indptr[key_id], self.indptr[key_id + 1]
+    timestamps = self.timestamps[start:end]
+    low, high = 0, end - start
+    since_timestamp = self.since_timestamp(since, last_n)
+    if since_timestamp is not None:
+      low = np.searchsorted(timestamps, since_timestamp, side="left")
+    until_timestamp = self.until_timestamp(until)
+    if until_timestamp is not None:
+      high = np.searchsorted(timestamps, until_timestamp, side="right")
+    return self.rows[start + low:start + max(low, high)]
@@ -0,0 +1,171 @@
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar, copy_context
+from functools import lru_cache
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+
+from src.utils.config import TRACE_FILE, DEBUG_SAMPLE_RATE, DEBUG_MAX_CHARS
+
+# Stages of one RAG request, in pipeline order
+STAGES = (
+  "filter_extraction", "cache_lookup", "change_lookup", "timeline_lookup", "query_embedding", "straining", "faiss_search", "lexical_search",
+  "docstore_fetch", "context_assembly", "llm_ttft", "llm_total", "total"
+)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Trace of the request being served; asyncio.to_thread copies it into worker threads
+current_trace = ContextVar("current_trace", default=None)
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=None)
+def stage_histogram():
+  """
+  Prometheus histogram of stage durations (one per process), or None when
+  prometheus_client is not installed.
+  """
+  try:
+    from prometheus_client import Histogram
+  except ImportError:
+    return None
+  histogram = Histogram("rag_stage_duration_seconds", "Duration of each RAG request stage", ["stage"], buckets=LATENCY_BUCKETS)
+  # Export every stage from the start, including ones no request has reached yet
+  for stage in STAGES:
+    histogram.labels(stage=stage)
+  return histogram
+
+def start_metrics_server(port):
+  # Serves /metrics for Prometheus to scrape; a no-op without prometheus_client
+  try:
+    from prometheus_client import start_http_server
+  except ImportError:
+    logger.warning("prometheus_client is not installed, metrics are not exported")
+    return
+  start_http_server(port)
+
+def span(stage):
+  """
+  Times a block as a stage of the current request's trace; does nothing outside a traced request.
+  """
+  trace = current_trace.get()
+  return nullcontext() if trace is None else trace.span(stage)
+
+def in_context(fn):
+  # Wraps fn to run in a copy of the caller's context (thread pools don't propagate contextvars)
+  context = copy_context()
+  return lambda *args: context.run(fn, *args)
+
+def capped_str(value, max_chars):
+  # str(value) cut at max_chars; lists are formatted item by item so a large one is never rendered whole
+  if isinstance(value, (list, tuple)):
+    parts, size = [], 0
+    for item in value:
+      if size > max_chars:
+        break
+      parts.append(str(item))
+      size += len(parts[-1]) + 2
+    text = "[" + ", ".join(parts) + "]"
+    suffix = f" ({len(value)} items)"
+  else:
+    text, suffix = str(value), ""
+  if len(text) > max_chars:
+    return f"{text[:max_chars]}...{suffix or f' ({len(text) - max_chars} more chars)'}"
+  return text
+
+def sampled_log(label, value, max_chars=None):
+  """
+  Debug dump for the requests sampled when their trace started (Tracer.start),
+  so every dump of a sampled request is logged and none of the others. The
+  value is only formatted when the request is sampled; the line carries the trace ID.
+  """
+  trace = current_trace.get()
+  if trace is None or not trace.sampled:
+    return
+  max_chars = DEBUG_MAX_CHARS if max_chars is None else max_chars
+  logger.info("[%s] %s: %s", trace.trace_id, label, capped_str(value, max_chars))
+
+class Trace:
+  """
+  Spans of one request: (stage, start offset, duration) in seconds since the
+  request started. Spans may be recorded from worker threads. sampled marks
+  the requests whose debug dumps are logged (see sampled_log).
+  """
+
+  def __init__(self, tracer, attributes=None, sampled=False):
+    self.tracer = tracer
+    self.sampled = sampled
+    self.trace_id = uuid.uuid4().hex[:16]
+    self.started_at = time.time()
+    self.started = time.perf_counter()
+    self.attributes = dict(attributes or {})
+    self.spans = []
+    self.finished = False
+
+  @contextmanager
+  def span(self, stage):
+    started = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.record(stage, time.perf_counter() - started, started)
+
+  def record(self, stage, seconds, started=None):
+    offset = (started if started is not None else time.perf_counter() - seconds) - self.started
+    self.spans.append((stage, offset, seconds))
+
+  @contextmanager
+  def activate(self):
+    # Makes this the current trace for span() calls in the block (and the threads it starts)
+    token = current_trace.set(self)
+    try:
+      yield self
+    finally:
+      current_trace.reset(token)
+
+  def finish(self, **attributes):
+    if self.finished:
+      return
+    self.finished = True
+    self.attributes.update(attributes)
+    self.record("total", time.perf_counter() - self.started, self.started)
+    self.tracer.export(self)
+
+  def to_dict(self):
+    return {
+      "trace_id": self.trace_id,
+      "started_at": self.started_at,
+      **self.attributes,
+      "spans": [
+        {"stage": stage, "start_ms": round(offset * 1e3, 3), "duration_ms": round(seconds * 1e3, 3)}
+        for stage, offset, seconds in self.spans
+      ]
+    }
+
+class Tracer:
+  """
+  Exports finished request traces: every span goes to the Prometheus stage
+  histogram (when prometheus_client is installed) and, with a trace_file,
+  each trace is appended to it as one JSON line.
+  """
+
+  def __init__(self, trace_file=TRACE_FILE, sample_rate=DEBUG_SAMPLE_RATE):
+    self.histogram = stage_histogram()
+    self.trace_file = open(trace_file, "a", encoding="utf-8", buffering=1) if trace_file else None
+    self.sample_rate = sample_rate
+    self.lock = threading.Lock()
+
+  def start(self, **attributes):
+    # The debug sample is drawn once per request
+    return Trace(self, attributes, sampled=self.sample_rate > 0 and random.random() < self.sample_rate)
+
+  def export(self, trace):
+    if self.histogram is not None:
+      for stage, _, seconds in trace.spans:
+        self.histogram.labels(stage=stage).observe(seconds)
+    if self.trace_file is not None:
+      line = json.dumps(trace.to_dict(), default=str)
+      with self.lock:
+        self.trace_file.write(line + "\n")
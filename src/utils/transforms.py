@@ -0,0 +1,59 @@
+# In-memory normalization stages applied to each patch JSON right after it is parsed.
+# Each transform takes the patch dict and modifies it in place.
+
+def add_default_hero_values(data):
+    for hero in data.get("heroes", []):
+        # Add default talent_notes if not present
+        if "talent_notes" not in hero:
+            hero["talent_notes"] = ["Changes in talent: None"]
+        else:
+            for talent in hero["talent_notes"]:
+                if "note" in talent:
+                    talent["note"] = "The following are the changes in the hero's talent: " + talent["note"]
+
+        if "hero_notes" not in hero:
+            hero["hero_notes"] = ["Changes in base or general stats: None"]
+        else:
+            for hero_note in hero["hero_notes"]:
+                if "note" in hero_note:
+                    hero_note["note"] = "The following are the changes in the hero's base or general stats: " + hero_note["note"]
+
+        if "abilities" not in hero:
+            hero["abilities"] = []
+        else:
+            for ability in hero.get("abilities", []):
+                for ability_note in ability.get("ability_notes", []):
+                    if "note" in ability_note:
+                        ability_note["note"] = "The following are the changes in the hero's ability: " + ability_note["note"]
+
+
+
+        # Handle subsections for facets
+        if "subsections" in hero:
+            for subsection in hero["subsections"]:
+                facet_title = subsection.get("title", "")
+
+                # Handle abilities if present
+                for ability in subsection.get("abilities", []):
+                    hero["abilities"].append({
+                        "ability_id": ability.get("ability_id", float("nan")),
+                        "ability_notes": [
+                            {**note, "facet": facet_title} for note in ability.get("ability_notes", [])
+                        ]
+                    })
+
+                # Handle general_notes if present
+                for note in subsection.get("general_notes", []):
+                    hero["hero_notes"].append({**note, "facet": facet_title})
+
+            # Remove subsections after processing
+            del hero["subsections"]
+
+
+# Applied by ConvertPatchNotesToDocuments unless told otherwise
+DEFAULT_TRANSFORMS = (add_default_hero_values,)
+
+def apply_transforms(data, transforms=DEFAULT_TRANSFORMS):
+    for transform in transforms:
+        transform(data)
+    return data
@@ -1,79 +1,309 @@
-from src.utils.storer import ConvertPatchNotesToDocuments, SanitizeDocuments
+from src.utils.registry import get_entity_registry
+from src.utils.embedding_cache import CachedEmbeddings
+from src.utils.providers import get_embeddings, embedding_pipeline_options
+from src.utils.context_budget import count_tokens_batch
+from src.utils.metadata_store import MetadataStore
+from src.utils.lexical_index import LexicalIndex
+from src.utils.timeline_index import TimelineIndex
+from src.utils.change_table import ChangeTable
+from src.vectorstore.embedding_pipeline import EmbeddingPipeline
+from src.vectorstore.conversion import CONVERSION_VERSION, convert_patch_notes_with_changes, extract_changes, patch_sort_key
+from src.vectorstore.disk_store import (
+  SHARDS_DIR, save_vector_store, load_vector_store, load_serving_store, load_sharded_store, replace_directory,
+  has_catalog, load_catalog, write_catalog, link_directory
+)
+from src.vectorstore.index_factory import SHARD_BY_CHOICES, INDEX_TYPES, IndexConfig, new_vector_store, load_index_config, save_index_config, shard_name, supports_delete
 from langchain.schema import Document
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langgraph.graph.message import add_messages
-from uuid import uuid4
-from langchain_community.docstore.in_memory import InMemoryDocstore
-from langchain_community.vectorstores import FAISS
-import pandas as pd
-import faiss
+from collections import defaultdict
+import argparse
+import hashlib
+import json
+import shutil
 import os
 
-# Loadd the patch notes
-list_patch_notes = os.listdir("./patchnotes_modified")
-
-# Read the mappers
-df_heroes = pd.read_csv("./data/mappers/heroes_mapper.csv")
-dict_heroes_map = df_heroes.set_index(df_heroes['id'].astype(str))['name'].to_dict()
-df_heroes_abilities = pd.read_csv("./data/mappers/heroes_abilities_mapper.csv")
-dict_heroes_abilities_map = df_heroes_abilities.set_index(df_heroes_abilities['id'].astype(str))['name'].to_dict()
-df_items = pd.read_csv("./data/mappers/items_mapper.csv")
-dict_items_map = df_items.set_index(df_items['id'].astype(str))['name'].to_dict()
-
-# Convert the patch notes to langchain docs
-docs_all = []
-for patch_note in list_patch_notes:
-  try:
-    print(f"Converting Patch Note {patch_note} to LangChainDoc via JSONLoader")
-    converter_pns_to_docs = (
-        ConvertPatchNotesToDocuments(
-            patch_note=patch_note,
-            dict_heroes_abilities_mapper=dict_heroes_abilities_map, 
-            dict_heroes_mapper=dict_heroes_map, 
-            dict_items_mapper=dict_items_map
-        )
-    )
-    docs = converter_pns_to_docs.convert()
-    docs_all.append(docs)
-  except Exception as e:
-    print(f"Error processing patch note {patch_note}: {e}")
-    pass
-docs_all = [doc for doc_list in docs_all for doc in doc_list]
-sanitizer = SanitizeDocuments(docs_all)
-docs_all = sanitizer.sanitize()
-
-
-# Split Documents (Optional)
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-splits = text_splitter.split_documents(docs_all)
-# Add sequential ID to each document in splits # This is required for chroma
-for idx, doc in enumerate(splits):
-    # Create a new Document with id at the top level
-    splits[idx] = Document(
-        id=str(idx + 1),  # Add a unique ID
-        page_content=doc.page_content,
-        metadata=doc.metadata
+PATCH_NOTES_PATH = "./patchnotes"
+VECTORSTORE_PATH = "./vectorstore_faiss"
+MANIFEST_FILE = "manifest.json"
+# Numeric change records of every patch note, keyed by the file's sha256 in the manifest
+CHANGE_RECORDS_FILE = "change_records.json"
+# Manifests written before the embedding model was recorded were built with OpenAIEmbeddings()
+LEGACY_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+def file_sha256(path):
+  with open(path, "rb") as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+def load_manifest(vectorstore_path=VECTORSTORE_PATH):
+  """
+  Loads the ingest manifest: {patch_note: {"sha256": ..., "chunk_ids": [...]}}.
+  """
+  manifest_path = os.path.join(vectorstore_path, MANIFEST_FILE)
+  if not os.path.exists(manifest_path):
+    return {}
+  with open(manifest_path, "r", encoding="utf-8") as f:
+    return json.load(f)["files"]
+
+def load_change_records(vectorstore_path=VECTORSTORE_PATH):
+  """
+  Loads the change records saved at the last ingest: {sha256: [change, ...]}.
+  Vectorstores saved before they were kept have none.
+  """
+  records_path = os.path.join(vectorstore_path, CHANGE_RECORDS_FILE)
+  if not os.path.exists(records_path):
+    return {}
+  with open(records_path, "r", encoding="utf-8") as f:
+    return json.load(f)
+
+def load_conversion_version(vectorstore_path=VECTORSTORE_PATH):
+  """
+  CONVERSION_VERSION of the saved documents; manifests without it predate the field (version 1).
+  """
+  with open(os.path.join(vectorstore_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+    return json.load(f).get("conversion_version", 1)
+
+def load_embedding_model(vectorstore_path=VECTORSTORE_PATH):
+  """
+  Name of the embedding model the saved vectors come from, or None without a manifest.
+  """
+  manifest_path = os.path.join(vectorstore_path, MANIFEST_FILE)
+  if not os.path.exists(manifest_path):
+    return None
+  with open(manifest_path, "r", encoding="utf-8") as f:
+    return json.load(f).get("embedding_model", LEGACY_EMBEDDING_MODEL)
+
+def split_patch_note(patch_note, docs, text_splitter, sha256):
+  """
+  Splits one patch note's documents and assigns deterministic chunk IDs.
+  The IDs embed the file hash, so a changed file never reuses the IDs of its old chunks.
+  """
+  splits = text_splitter.split_documents(docs)
+  patch_name = os.path.splitext(patch_note)[0]
+  # Token counts are stored with each chunk so context packing never re-encodes them
+  token_counts = count_tokens_batch([doc.page_content for doc in splits])
+  return [
+    Document(
+      id=f"{patch_name}-{sha256[:12]}-{idx}",
+      page_content=doc.page_content,
+      metadata={**doc.metadata, "token_count": token_count}
     )
+    for idx, (doc, token_count) in enumerate(zip(splits, token_counts))
+  ]
 
-# Create VectorStore
-print("Creating vectorstore")
-embeddings = OpenAIEmbeddings()
-sample_doc = docs_all[823].page_content
-index = faiss.IndexFlatL2(len(embeddings.embed_query(sample_doc)))
-vector_store = FAISS(
-    embedding_function=embeddings,
-    index=index,
-    docstore=InMemoryDocstore(),
-    index_to_docstore_id={},
-)
+def shard_of(patch_note, index_config):
+  # Shard of a patch note file ("7.37b.json" -> "7.3x" with shard_by "family")
+  return shard_name(os.path.splitext(patch_note)[0], index_config.shard_by)
+
+def save_global_indexes(directory, embeddings, change_table=None):
+  """
+  Writes the metadata store, timeline and BM25 indexes over the global rows of
+  all shards (read back from the shards in directory) and the change table.
+  """
+  vector_store = load_sharded_store(directory, embeddings)
+  # Columnar metadata (category codes + bitmaps) for filter-only retrieval
+  metadata_store = MetadataStore.from_vector_store(vector_store)
+  metadata_store.save(directory)
+  # Per-entity postings by patch timestamp for range questions
+  TimelineIndex.from_metadata_store(metadata_store).save(directory)
+  # BM25 postings over the chunk texts for hybrid retrieval
+  LexicalIndex.from_vector_store(vector_store).save(directory)
+  # Numeric changes of every patch note for aggregate questions
+  if change_table is not None:
+    change_table.save(directory)
+
+def save_atomically(shard_stores, manifest, index_config, embeddings, vectorstore_path=VECTORSTORE_PATH, change_table=None,
+                    change_records=None):
+  """
+  Writes the vectorstore to a temporary directory and swaps it in, so a crash
+  mid-save never leaves a half-written vectorstore behind. Only the shards in
+  shard_stores (name -> vector store, None for an emptied shard) are written;
+  the other shards are hard-linked from the current vectorstore, not
+  rewritten. The shard catalog, global indexes and manifest cover all shards;
+  change_records ({sha256: records}) are kept for the next ingest.
+  """
+  tmp_path = f"{vectorstore_path}.tmp"
+  shutil.rmtree(tmp_path, ignore_errors=True)
+  os.makedirs(tmp_path)
+  previous = {shard["name"]: shard for shard in load_catalog(vectorstore_path)} if has_catalog(vectorstore_path) else {}
+  # Shards in patch order, each with the patch notes it holds
+  patch_notes_by_shard = defaultdict(list)
+  for patch_note in sorted(manifest, key=patch_sort_key):
+    patch_notes_by_shard[shard_of(patch_note, index_config)].append(patch_note)
+
+  catalog = []
+  for name, patch_notes in patch_notes_by_shard.items():
+    directory = f"{SHARDS_DIR}/{name}"
+    if name in shard_stores:
+      vector_store = shard_stores[name]
+      n_rows = vector_store.index.ntotal if vector_store is not None else 0
+      if n_rows:
+        # Index + columnar docstore (memory-mapped by the app, no pickle)
+        save_vector_store(vector_store, os.path.join(tmp_path, directory))
+        save_index_config(index_config, os.path.join(tmp_path, directory))
+    elif name in previous:
+      n_rows = previous[name]["n_rows"]
+      link_directory(os.path.join(vectorstore_path, previous[name]["directory"]), os.path.join(tmp_path, directory))
+    else:
+      n_rows = 0
+    if n_rows:
+      catalog.append({
+        "name": name, "directory": directory, "patch_notes": patch_notes,
+        "patch_versions": [os.path.splitext(patch_note)[0] for patch_note in patch_notes], "n_rows": n_rows
+      })
+  write_catalog(tmp_path, catalog)
+
+  save_global_indexes(tmp_path, embeddings, change_table)
+  save_index_config(index_config, tmp_path)
+  with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+    json.dump({"files": manifest, "embedding_model": embeddings.model_name, "conversion_version": CONVERSION_VERSION}, f)
+  if change_records is not None:
+    with open(os.path.join(tmp_path, CHANGE_RECORDS_FILE), "w", encoding="utf-8") as f:
+      json.dump(change_records, f)
+  replace_directory(tmp_path, vectorstore_path)
+
+def update_vectorstore(full_rebuild=False, patch_notes_path=PATCH_NOTES_PATH, vectorstore_path=VECTORSTORE_PATH, index_config=None):
+  """
+  Embeds only new or changed patch note files and deletes the vectors of
+  removed or changed ones. A full rebuild ignores the existing index.
+  The vectorstore is sharded by patch family (index_config.shard_by): only
+  the shards of new, changed or removed patch notes are loaded and
+  rewritten, so a new patch creates or appends to one shard.
+  The index type comes from index_config (default: the RAG_INDEX_* settings);
+  IVF/PQ indexes are trained on the vectors of the shard.
+  """
+  index_config = index_config or IndexConfig()
+  registry = get_entity_registry()
+  # Chunks embedded by earlier builds are served from the on-disk cache (one cache per model)
+  embeddings = CachedEmbeddings(get_embeddings())
+  text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+
+  # Compare the patch notes on disk against the manifest of the last build
+  current_hashes = {
+    patch_note: file_sha256(os.path.join(patch_notes_path, patch_note))
+    for patch_note in sorted(os.listdir(patch_notes_path), key=patch_sort_key) if patch_note.endswith(".json")
+  }
+  manifest = {}
+  catalog = []
+  change_records = {}
+  if not full_rebuild and os.path.exists(vectorstore_path):
+    manifest = load_manifest(vectorstore_path)
+    if manifest and not has_catalog(vectorstore_path):
+      print("Vectorstore is not sharded, rebuilding")
+      manifest = {}
+    if manifest and load_index_config(vectorstore_path) != index_config:
+      print(f"Index configuration changed to {index_config}, rebuilding")
+      manifest = {}
+    if manifest and load_conversion_version(vectorstore_path) != CONVERSION_VERSION:
+      print(f"Patch note conversion changed (version {CONVERSION_VERSION}), reconverting every file")
+      manifest = {}
+    if manifest and load_embedding_model(vectorstore_path) != embeddings.model_name:
+      print(f"Embedding model changed to {embeddings.model_name}, rebuilding")
+      manifest = {}
+    if manifest:
+      catalog = load_catalog(vectorstore_path)
+      change_records = load_change_records(vectorstore_path)
+
+  stale = [p for p in manifest if current_hashes.get(p) != manifest[p]["sha256"]]
+  pending = [p for p in current_hashes if p not in manifest or p in stale]
+  affected = {shard_of(p, index_config) for p in pending + stale}
+  print(f"{len(current_hashes)} patch notes: {len(pending)} to embed, {len(stale)} to replace or remove "
+        f"({len(affected)} shards to write, {len([shard for shard in catalog if shard['name'] not in affected])} unchanged)")
+
+  # Load the affected shards and drop the vectors of removed/changed files
+  shard_stores = {}
+  for shard in catalog:
+    if shard["name"] not in affected:
+      continue
+    vector_store = load_vector_store(os.path.join(vectorstore_path, shard["directory"]), embeddings)
+    shard_stale = [p for p in stale if shard_of(p, index_config) == shard["name"]]
+    if shard_stale and not supports_delete(vector_store):
+      # Vectors come back from the embedding cache, so rebuilding the shard costs no API calls
+      print(f"Shard {shard['name']}: {type(vector_store.index).__name__} cannot delete vectors in place, rebuilding it")
+      pending += [p for p in shard["patch_notes"] if p in current_hashes and p not in pending]
+      for patch_note in shard["patch_notes"]:
+        manifest.pop(patch_note, None)
+      shard_stores[shard["name"]] = None
+      continue
+    stale_ids = [chunk_id for p in shard_stale for chunk_id in manifest[p]["chunk_ids"]]
+    if stale_ids:
+      print(f"Shard {shard['name']}: deleting {len(stale_ids)} stale chunks")
+      vector_store.delete(ids=stale_ids)
+    shard_stores[shard["name"]] = vector_store
+  for patch_note in stale:
+    manifest.pop(patch_note, None)
+  pending.sort(key=patch_sort_key)
+
+  # Convert only the new/changed files (in parallel, merged in patch order); their numeric changes come from the same parse
+  print(f"Converting {len(pending)} patch notes")
+  converted = convert_patch_notes_with_changes(pending, registry, patch_notes_path=patch_notes_path)
+  pending_splits = {
+    patch_note: split_patch_note(patch_note, docs, text_splitter, current_hashes[patch_note])
+    for patch_note, (docs, _) in converted.items()
+  }
+  for patch_note, (_, changes) in converted.items():
+    change_records[current_hashes[patch_note]] = changes
+
+  # Embed them through the batched pipeline (resumes from its checkpoint if interrupted)
+  splits = [doc for docs in pending_splits.values() for doc in docs]
+  pipeline = EmbeddingPipeline(embeddings, checkpoint_dir=f"{vectorstore_path}.checkpoint", **embedding_pipeline_options())
+  if splits:
+    print(f"Embedding {len(splits)} chunks")
+    vectors = pipeline.run([doc.page_content for doc in splits])
+    print(f"Embedding pipeline: {pipeline.stats}")
+    # Each chunk goes to its patch's shard: a new family creates a shard, a new patch appends to one
+    shard_positions = defaultdict(list)
+    position = 0
+    for patch_note, docs in pending_splits.items():
+      shard_positions[shard_of(patch_note, index_config)].extend(range(position, position + len(docs)))
+      position += len(docs)
+    for name, positions in shard_positions.items():
+      if shard_stores.get(name) is None:
+        shard_stores[name] = new_vector_store(embeddings, [vectors[i] for i in positions], index_config)
+      shard_stores[name].add_embeddings(
+        text_embeddings=[(splits[i].page_content, vectors[i]) for i in positions],
+        metadatas=[splits[i].metadata for i in positions],
+        ids=[splits[i].id for i in positions]
+      )
+  for patch_note, docs in pending_splits.items():
+    manifest[patch_note] = {"sha256": current_hashes[patch_note], "chunk_ids": [doc.id for doc in docs]}
+
+  if not shard_stores and not catalog:
+    print("Nothing to index")
+    return None
+  if not pending and not stale:
+    print("Vectorstore already up to date")
+    return load_serving_store(vectorstore_path, embeddings)
+
+  # The change table is rebuilt from the stored records; unchanged files are not parsed again
+  missing = [p for p in current_hashes if current_hashes[p] not in change_records]
+  if missing:
+    print(f"Extracting the numeric changes of {len(missing)} patch notes without stored records")
+    for patch_note, changes in extract_changes(missing, registry, patch_notes_path=patch_notes_path).items():
+      change_records[current_hashes[patch_note]] = changes
+  change_records = {sha256: change_records[sha256] for sha256 in current_hashes.values() if sha256 in change_records}
+  change_table = ChangeTable.from_records([change for patch_changes in change_records.values() for change in patch_changes])
+  print(f"Change table: {change_table.n_rows} numeric changes")
+
+  # Save the vectorstore
+  print(f"Saving the vectorstore ({len(shard_stores)} shards written)")
+  save_atomically(shard_stores, manifest, index_config, embeddings, vectorstore_path, change_table, change_records)
+  pipeline.clear_checkpoint()
+  print(f"Embedding cache: {embeddings.stats()}")
+  return load_serving_store(vectorstore_path, embeddings)
 
-# Add docs to vectorstore
-print("Adding docs to vectorstore")
-uuids = [str(uuid4()) for _ in range(len(splits))]
-vector_store.add_documents(documents=splits, ids=uuids)
 
-# Save the vectorstore
-print("Saving the vectorstore")
-vector_store.save_local("./vectorstore_faiss")
\ No newline at end of file
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Add patch notes to the FAISS vectorstore.")
+  parser.add_argument("--full", action="store_true", help="Rebuild the whole index instead of updating it incrementally.")
+  parser.add_argument("--index-type", choices=INDEX_TYPES, help="Overrides RAG_INDEX_TYPE.")
+  parser.add_argument("--metric", choices=("l2", "ip"), help="Overrides RAG_INDEX_METRIC.")
+  parser.add_argument("--shard-by", choices=SHARD_BY_CHOICES, help="Overrides RAG_SHARD_BY.")
+  args = parser.parse_args()
+  index_config = IndexConfig()
+  if args.index_type:
+    index_config = index_config._replace(index_type=args.index_type)
+  if args.metric:
+    index_config = index_config._replace(metric=args.metric)
+  if args.shard_by:
+    index_config = index_config._replace(shard_by=args.shard_by)
+  update_vectorstore(full_rebuild=args.full, index_config=index_config)
@@ -0,0 +1,119 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import re
+
+from src.utils.registry import get_entity_registry
+from src.utils.storer import ConvertPatchNotesToDocuments, SanitizeDocuments, ExtractNumericChanges
+
+# Bumped when converted documents change (their metadata or text), so the next ingest reconverts every file
+# 2: ability_ids lists every ability of a hero record
+CONVERSION_VERSION = 2
+
+# Converter arguments (mapper dicts, patch folder) of the current worker process, set once by init_worker
+_worker_kwargs = {}
+
+def version_sort_key(version):
+  """
+  Orders patch versions: 7.9 < 7.20 < 7.20b < 7.21.
+  """
+  return tuple((0, int(part)) if part.isdigit() else (1, part) for part in re.split(r"(\d+)", version) if part)
+
+def patch_sort_key(patch_note):
+  """
+  Orders patch files by version (see version_sort_key).
+  """
+  return version_sort_key(os.path.splitext(patch_note)[0])
+
+def init_worker(dict_heroes_abilities_mapper, dict_heroes_mapper, dict_items_mapper, patch_notes_path):
+  # Runs once per worker: the mappers are shipped per process, not per task
+  _worker_kwargs["dict_heroes_abilities_mapper"] = dict_heroes_abilities_mapper
+  _worker_kwargs["dict_heroes_mapper"] = dict_heroes_mapper
+  _worker_kwargs["dict_items_mapper"] = dict_items_mapper
+  _worker_kwargs["patch_notes_path"] = patch_notes_path
+
+def convert_patch_note(patch_note):
+  """
+  Converts (parse + in-memory normalization) and sanitizes one raw patch note file.
+  """
+  try:
+    docs = ConvertPatchNotesToDocuments(patch_note=patch_note, **_worker_kwargs).convert()
+    return SanitizeDocuments(docs).sanitize()
+  except Exception as e:
+    print(f"Error processing patch note {patch_note}: {e}")
+    return None
+
+def worker_mappers():
+  return {key: value for key, value in _worker_kwargs.items() if key != "patch_notes_path"}
+
+def extract_patch_changes(patch_note):
+  """
+  Parses the numeric changes of one raw patch note file (see ExtractNumericChanges).
+  """
+  try:
+    patch_data = ConvertPatchNotesToDocuments(patch_note=patch_note, **_worker_kwargs).load_patch_data()
+    return ExtractNumericChanges(patch_data, **worker_mappers()).extract()
+  except Exception as e:
+    print(f"Error extracting changes from patch note {patch_note}: {e}")
+    return None
+
+def convert_patch_note_with_changes(patch_note):
+  """
+  Converts one raw patch note file and extracts its numeric changes from the same parse.
+  Returns:
+      tuple: (sanitized documents, change records), or None when the file fails.
+  """
+  try:
+    converter = ConvertPatchNotesToDocuments(patch_note=patch_note, **_worker_kwargs)
+    patch_data = converter.load_patch_data()
+    # Changes first: they only read the patch dict, the conversion may reshape it
+    changes = ExtractNumericChanges(patch_data, **worker_mappers()).extract()
+    return SanitizeDocuments(converter.convert(patch_data)).sanitize(), changes
+  except Exception as e:
+    print(f"Error processing patch note {patch_note}: {e}")
+    return None
+
+def run_in_pool(fn, list_patch_notes, registry=None, max_workers=None, patch_notes_path="./patchnotes"):
+  # Maps fn over the patch note files in a process pool; returns {patch_note: result} in patch order, failures left out
+  registry = registry or get_entity_registry()
+  init_args = (registry.dict_heroes_abilities_mapper, registry.dict_heroes_mapper, registry.dict_items_mapper, patch_notes_path)
+  patch_notes = sorted(list_patch_notes, key=patch_sort_key)
+  max_workers = min(max_workers or os.cpu_count() or 1, len(patch_notes) or 1)
+
+  if max_workers == 1:
+    init_worker(*init_args)
+    results = map(fn, patch_notes)
+    return {p: result for p, result in zip(patch_notes, results) if result is not None}
+
+  with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=init_args) as executor:
+    # map() yields in submission order, so the merge is deterministic
+    results = executor.map(fn, patch_notes)
+    return {p: result for p, result in zip(patch_notes, results) if result is not None}
+
+def convert_patch_notes(list_patch_notes, registry=None, max_workers=None, patch_notes_path="./patchnotes"):
+  """
+  Converts patch note files to sanitized documents across a process pool.
+  Args:
+      list_patch_notes (list): Patch note file names (e.g. "7.38.json").
+      registry (EntityRegistry, optional): Mapper source, defaults to the shared registry.
+      max_workers (int, optional): Pool size, defaults to the CPU count.
+      patch_notes_path (str, optional): Folder holding the raw patch note files.
+  Returns:
+      dict: {patch_note: documents} in patch order; files that failed to convert are left out.
+  """
+  return run_in_pool(convert_patch_note, list_patch_notes, registry, max_workers, patch_notes_path)
+
+def extract_changes(list_patch_notes, registry=None, max_workers=None, patch_notes_path="./patchnotes"):
+  """
+  Extracts the numeric changes of patch note files across a process pool.
+  Returns:
+      dict: {patch_note: change records} in patch order; files that failed are left out.
+  """
+  return run_in_pool(extract_patch_changes, list_patch_notes, registry, max_workers, patch_notes_path)
+
+def convert_patch_notes_with_changes(list_patch_notes, registry=None, max_workers=None, patch_notes_path="./patchnotes"):
+  """
+  convert_patch_notes() and extract_changes() in one pass: each file is parsed once.
+  Returns:
+      dict: {patch_note: (documents, change records)} in patch order; files that failed are left out.
+  """
+  return run_in_pool(convert_patch_note_with_changes, list_patch_notes, registry, max_workers, patch_notes_path)
@@ -0,0 +1,59 @@
+# Converts a pickled vectorstore (index.faiss + index.pkl from FAISS.save_local) to the columnar format
+# Usage: python -m src.vectorstore.convert_vectorstore [./vectorstore_faiss]
+# Reading index.pkl unpickles it: only convert directories built by this project.
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import FAISS
+import argparse
+import json
+import os
+import shutil
+import time
+
+from src.utils.metadata_store import MetadataStore
+from src.utils.lexical_index import LexicalIndex
+from src.utils.timeline_index import TimelineIndex
+from src.vectorstore.disk_store import has_docstore, save_vector_store, replace_directory, load_serving_store
+from src.vectorstore.index_factory import load_index_config, save_index_config
+
+VECTORSTORE_PATH = "./vectorstore_faiss"
+KEPT_FILES = ("manifest.json",)
+
+def convert_vectorstore(vectorstore_path=VECTORSTORE_PATH):
+  if has_docstore(vectorstore_path) and not os.path.exists(os.path.join(vectorstore_path, "index.pkl")):
+    print(f"{vectorstore_path} is already in the columnar format")
+    return
+
+  started = time.perf_counter()
+  # The embedding function is never called during conversion
+  legacy = FAISS.load_local(vectorstore_path, embeddings=DeterministicFakeEmbedding(size=1), allow_dangerous_deserialization=True)
+  print(f"Unpickled {legacy.index.ntotal} chunks in {time.perf_counter() - started:.2f} s")
+
+  tmp_path = f"{vectorstore_path}.tmp"
+  shutil.rmtree(tmp_path, ignore_errors=True)
+  save_vector_store(legacy, tmp_path)
+  metadata_store = MetadataStore.from_vector_store(legacy)
+  metadata_store.save(tmp_path)
+  TimelineIndex.from_metadata_store(metadata_store).save(tmp_path)
+  LexicalIndex.from_vector_store(legacy).save(tmp_path)
+  save_index_config(load_index_config(vectorstore_path), tmp_path)
+  for name in KEPT_FILES:
+    if os.path.exists(os.path.join(vectorstore_path, name)):
+      shutil.copy2(os.path.join(vectorstore_path, name), os.path.join(tmp_path, name))
+
+  # Check the conversion before swapping it in
+  converted = load_serving_store(tmp_path, legacy.embedding_function)
+  for row in range(legacy.index.ntotal):
+    before = legacy.docstore.search(legacy.index_to_docstore_id[row])
+    after = converted.docstore.search(row)
+    # Compared as JSON so NaN values count as equal
+    if (before.page_content, json.dumps(before.metadata, sort_keys=True)) != (after.page_content, json.dumps(after.metadata, sort_keys=True)):
+      raise ValueError(f"Row {row} differs after conversion, keeping {vectorstore_path} unchanged")
+  replace_directory(tmp_path, vectorstore_path)
+  print(f"Converted {vectorstore_path} ({legacy.index.ntotal} chunks)")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Convert a pickled FAISS vectorstore to the columnar format.")
+  parser.add_argument("vectorstore_path", nargs="?", default=VECTORSTORE_PATH)
+  args = parser.parse_args()
+  convert_vectorstore(args.vectorstore_path)
@@ -0,0 +1,429 @@
+# On-disk vectorstore layout (no pickle anywhere):
+#   index.faiss          the FAISS index (row i = document i)
+#   index_mmap.faiss     the same index in a layout faiss can memory-map (Flat only)
+#   index_config.json    index type and metric (index_factory)
+#   docstore/
+#     header.json        format name/version, row count and the metadata column schema
+#     text.bin           page contents as one UTF-8 blob + text_offsets.npy (int64, n_rows + 1)
+#     chunk_ids.bin      stable chunk IDs used by the ingest manifest + chunk_ids_offsets.npy
+#     meta_<i>.npy       one array per metadata key (category codes or typed values, with presence masks)
+# Documents are addressed by their integer FAISS row.
+# Sharded layout (add_to_vectorstore, RAG_SHARD_BY): one such directory per shard (patch family) under shards/<name>/,
+# listed in order by the catalog shards.json; global row = shard offset + row in the shard.
+from bisect import bisect_right
+from collections.abc import Mapping
+from functools import cached_property
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+import numpy as np
+import faiss
+import json
+import mmap
+import os
+import shutil
+import warnings
+
+from src.vectorstore.index_factory import ShardedIndex, load_index_config, vector_store_kwargs
+
+INDEX_FILE = "index.faiss"
+MMAP_INDEX_FILE = "index_mmap.faiss"
+DOCSTORE_DIR = "docstore"
+FORMAT_NAME = "rag-docstore"
+FORMAT_VERSION = 1
+SHARDS_DIR = "shards"
+CATALOG_FILE = "shards.json"
+CATALOG_FORMAT_NAME = "rag-shards"
+CATALOG_FORMAT_VERSION = 1
+
+class DocstoreFormatError(Exception):
+  pass
+
+class ReadOnlyDocstoreError(PermissionError):
+  pass
+
+# --- Writing ---
+
+def write_strings(directory, name, strings):
+  # UTF-8 blob plus int64 offsets: string i is blob[offsets[i]:offsets[i + 1]]
+  encoded = [string.encode("utf-8") for string in strings]
+  offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+  np.cumsum([len(data) for data in encoded], out=offsets[1:])
+  with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+    f.write(b"".join(encoded))
+  np.save(os.path.join(directory, f"{name}_offsets.npy"), offsets)
+
+def column_kind(values):
+  """
+  Storage kind of one metadata key: typed arrays when every present value
+  has the same scalar type, JSON text otherwise (mixed or nested values).
+  """
+  types = {type(value) for value in values if value is not None}
+  if types == {bool}:
+    return "bool"
+  if types == {int}:
+    return "int"
+  if types == {float}:
+    return "float"
+  if types == {str}:
+    return "category"
+  return "json"
+
+def write_metadata_columns(directory, metadatas):
+  keys = list(dict.fromkeys(key for metadata in metadatas for key in metadata))
+  schema = []
+  for i, key in enumerate(keys):
+    present = np.array([key in metadata for metadata in metadatas], dtype=bool)
+    values = [metadata.get(key) for metadata in metadatas]
+    kind = column_kind(values)
+    column = {"key": key, "kind": kind}
+    path = os.path.join(directory, f"meta_{i}")
+    if kind == "category":
+      categories = sorted({value for value in values if value is not None})
+      lookup = {value: code for code, value in enumerate(categories)}
+      # -1: key missing, -2: present with value None
+      codes = [lookup[value] if value is not None else (-2 if has else -1) for value, has in zip(values, present)]
+      np.save(f"{path}.npy", np.array(codes, dtype=np.int32))
+      column["categories"] = categories
+    elif kind == "json":
+      write_strings(directory, f"meta_{i}", [json.dumps(value) if has else "" for value, has in zip(values, present)])
+      np.save(f"{path}_mask.npy", present)
+    else:
+      dtype = {"bool": np.bool_, "int": np.int64, "float": np.float64}[kind]
+      np.save(f"{path}.npy", np.array([value if value is not None else 0 for value in values], dtype=dtype))
+      np.save(f"{path}_mask.npy", present & np.array([value is not None for value in values], dtype=bool))
+      column["nullable"] = any(has and value is None for value, has in zip(values, present))
+      if column["nullable"]:
+        np.save(f"{path}_null.npy", np.array([has and value is None for value, has in zip(values, present)], dtype=bool))
+    schema.append(column)
+  return schema
+
+def write_docstore(docs, directory):
+  """
+  Writes documents (in FAISS row order, doc.id = chunk ID) in the columnar format.
+  """
+  os.makedirs(directory, exist_ok=True)
+  write_strings(directory, "text", [doc.page_content for doc in docs])
+  write_strings(directory, "chunk_ids", [str(doc.id) for doc in docs])
+  schema = write_metadata_columns(directory, [doc.metadata for doc in docs])
+  with open(os.path.join(directory, "header.json"), "w", encoding="utf-8") as f:
+    json.dump({"format": FORMAT_NAME, "version": FORMAT_VERSION, "n_rows": len(docs), "columns": schema}, f)
+
+def to_mmap_index(index):
+  """
+  Returns the index in a layout faiss can memory-map (IO_FLAG_MMAP maps IVF
+  inverted lists only). A flat index becomes a one-list IVF-Flat, which scans
+  the same vectors with the same distances. None when the index already maps
+  (IVF) or can't (HNSW).
+  """
+  if not isinstance(index, faiss.IndexFlat):
+    return None
+  quantizer = faiss.IndexFlat(index.d, index.metric_type)
+  quantizer.add(np.zeros((1, index.d), dtype=np.float32))
+  ivf = faiss.IndexIVFFlat(quantizer, index.d, 1, index.metric_type)
+  if index.ntotal:
+    ivf.add(index.reconstruct_n(0, index.ntotal))
+  return ivf
+
+def save_vector_store(vector_store, directory):
+  """
+  Writes the index, its mmap-able copy and the columnar docstore.
+  """
+  os.makedirs(directory, exist_ok=True)
+  faiss.write_index(vector_store.index, os.path.join(directory, INDEX_FILE))
+  docs = []
+  for row in range(len(vector_store.index_to_docstore_id)):
+    doc_id = vector_store.index_to_docstore_id[row]
+    doc = vector_store.docstore.search(doc_id)
+    docs.append(Document(id=doc.id or doc_id, page_content=doc.page_content, metadata=doc.metadata))
+  write_docstore(docs, os.path.join(directory, DOCSTORE_DIR))
+  mmap_index = to_mmap_index(vector_store.index)
+  if mmap_index is not None:
+    faiss.write_index(mmap_index, os.path.join(directory, MMAP_INDEX_FILE))
+
+# --- Reading ---
+
+class StringColumn:
+  # Memory-mapped UTF-8 blob + offsets; decodes one string per access
+
+  def __init__(self, directory, name):
+    self.offsets = np.load(os.path.join(directory, f"{name}_offsets.npy"), mmap_mode="r", allow_pickle=False)
+    with open(os.path.join(directory, f"{name}.bin"), "rb") as f:
+      self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, row):
+    return self.data[int(self.offsets[row]):int(self.offsets[row + 1])].decode("utf-8")
+
+  def to_list(self):
+    data = bytes(self.data)
+    offsets = self.offsets.tolist()
+    return [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+
+class ReadOnlyDocstore(Docstore):
+  """
+  Base of the serving docstores: chunks are only added or deleted by
+  rebuilding the vectorstore with add_to_vectorstore.
+  """
+  read_only = True
+
+  def delete(self, ids):
+    raise ReadOnlyDocstoreError(f"{type(self).__name__} is read-only; rebuild with add_to_vectorstore")
+
+class ColumnarDocstore(ReadOnlyDocstore):
+  """
+  Read-only docstore over the columnar format. All arrays are memory-mapped
+  (np.load with mmap_mode, no pickle) and a Document is assembled only when
+  its row is looked up, so worker processes share pages through the OS cache.
+  """
+
+  def __init__(self, directory):
+    with open(os.path.join(directory, "header.json"), "r", encoding="utf-8") as f:
+      header = json.load(f)
+    if header.get("format") != FORMAT_NAME:
+      raise DocstoreFormatError(f"{directory} is not a {FORMAT_NAME} directory")
+    if header.get("version") != FORMAT_VERSION:
+      raise DocstoreFormatError(f"Unsupported {FORMAT_NAME} version {header.get('version')} (expected {FORMAT_VERSION})")
+    self.n_rows = header["n_rows"]
+    self.text = StringColumn(directory, "text")
+    self.chunk_id_column = StringColumn(directory, "chunk_ids")
+    self.columns = []
+    for i, column in enumerate(header["columns"]):
+      path = os.path.join(directory, f"meta_{i}")
+      load = lambda suffix: np.load(f"{path}{suffix}.npy", mmap_mode="r", allow_pickle=False)
+      if column["kind"] == "category":
+        self.columns.append((column["key"], "category", load(""), column["categories"], None))
+      elif column["kind"] == "json":
+        self.columns.append((column["key"], "json", StringColumn(directory, f"meta_{i}"), load("_mask"), None))
+      else:
+        nulls = load("_null") if column.get("nullable") else None
+        self.columns.append((column["key"], column["kind"], load(""), load("_mask"), nulls))
+
+  @cached_property
+  def chunk_ids(self):
+    return [self.chunk_id_column[row] for row in range(self.n_rows)]
+
+  def get_metadata(self, row):
+    metadata = {}
+    for key, kind, values, extra, nulls in self.columns:
+      if kind == "category":
+        code = int(values[row])
+        if code != -1:
+          metadata[key] = extra[code] if code >= 0 else None
+      elif kind == "json":
+        if extra[row]:
+          metadata[key] = json.loads(values[row])
+      elif extra[row]:
+        metadata[key] = values[row].item()
+      elif nulls is not None and nulls[row]:
+        metadata[key] = None
+    return metadata
+
+  def documents(self):
+    """
+    Decodes every row at once, one pass per column (used to load a writable copy at ingest).
+    """
+    metadatas = [{} for _ in range(self.n_rows)]
+    for key, kind, values, extra, nulls in self.columns:
+      if kind == "category":
+        for metadata, code in zip(metadatas, values.tolist()):
+          if code != -1:
+            metadata[key] = extra[code] if code >= 0 else None
+      elif kind == "json":
+        for metadata, value, present in zip(metadatas, values.to_list(), extra.tolist()):
+          if present:
+            metadata[key] = json.loads(value)
+      else:
+        null_flags = nulls.tolist() if nulls is not None else [False] * self.n_rows
+        for metadata, value, present, null in zip(metadatas, values.tolist(), extra.tolist(), null_flags):
+          if present:
+            metadata[key] = value
+          elif null:
+            metadata[key] = None
+    return [
+      Document(id=chunk_id, page_content=text, metadata=metadata)
+      for chunk_id, text, metadata in zip(self.chunk_id_column.to_list(), self.text.to_list(), metadatas)
+    ]
+
+  def get_row(self, row: int) -> Document:
+    return Document(id=self.chunk_id_column[row], page_content=self.text[row], metadata=self.get_metadata(row))
+
+  def search(self, search):
+    # Keys are the integer FAISS rows
+    if not isinstance(search, (int, np.integer)) or not 0 <= search < self.n_rows:
+      return f"ID {search} not found."
+    return self.get_row(int(search))
+
+class ShardedDocstore(ReadOnlyDocstore):
+  """
+  The shards' columnar docstores read as one, addressed by global row
+  (shard offset + row in the shard). Read-only, like ColumnarDocstore.
+  """
+
+  def __init__(self, docstores):
+    self.docstores = docstores
+    self.starts = [0]
+    for docstore in docstores:
+      self.starts.append(self.starts[-1] + docstore.n_rows)
+    self.n_rows = self.starts[-1]
+
+  @cached_property
+  def chunk_ids(self):
+    return [chunk_id for docstore in self.docstores for chunk_id in docstore.chunk_ids]
+
+  def locate(self, row):
+    # (shard docstore, row in the shard)
+    shard = bisect_right(self.starts, row) - 1
+    return self.docstores[shard], row - self.starts[shard]
+
+  def get_metadata(self, row):
+    docstore, shard_row = self.locate(row)
+    return docstore.get_metadata(shard_row)
+
+  def documents(self):
+    return [doc for docstore in self.docstores for doc in docstore.documents()]
+
+  def get_row(self, row: int) -> Document:
+    docstore, shard_row = self.locate(row)
+    return docstore.get_row(shard_row)
+
+  def search(self, search):
+    if not isinstance(search, (int, np.integer)) or not 0 <= search < self.n_rows:
+      return f"ID {search} not found."
+    return self.get_row(int(search))
+
+def has_catalog(directory):
+  return os.path.exists(os.path.join(directory, CATALOG_FILE))
+
+def load_catalog(directory):
+  """
+  Loads the shard catalog: [{"name", "directory", "patch_notes", "patch_versions", "n_rows"}] in global row order.
+  """
+  with open(os.path.join(directory, CATALOG_FILE), "r", encoding="utf-8") as f:
+    catalog = json.load(f)
+  if catalog.get("format") != CATALOG_FORMAT_NAME or catalog.get("version") != CATALOG_FORMAT_VERSION:
+    raise DocstoreFormatError(f"Unsupported shard catalog in {directory}")
+  return catalog["shards"]
+
+def write_catalog(directory, shards):
+  with open(os.path.join(directory, CATALOG_FILE), "w", encoding="utf-8") as f:
+    json.dump({"format": CATALOG_FORMAT_NAME, "version": CATALOG_FORMAT_VERSION, "shards": shards}, f, indent=1)
+
+def load_sharded_store(directory, embeddings):
+  """
+  Loads a sharded vectorstore for serving: every shard's index memory-mapped
+  and searched through a ShardedIndex, the docstores read as one.
+  """
+  catalog = load_catalog(directory)
+  indexes, docstores = [], []
+  for shard in catalog:
+    shard_path = os.path.join(directory, shard["directory"])
+    check_docstore(shard_path)
+    indexes.append(read_mmap_index(shard_path))
+    docstores.append(ColumnarDocstore(os.path.join(shard_path, DOCSTORE_DIR)))
+    if indexes[-1].ntotal != docstores[-1].n_rows or docstores[-1].n_rows != shard["n_rows"]:
+      raise DocstoreFormatError(f"Shard {shard['name']} of {directory} does not match the catalog")
+  if not indexes:
+    raise FileNotFoundError(f"No shards in {directory}")
+  docstore = ShardedDocstore(docstores)
+  index = ShardedIndex([shard["name"] for shard in catalog], indexes)
+  return make_vector_store(embeddings, index, docstore, RowIds(docstore.n_rows), directory)
+
+def link_directory(source, destination):
+  """
+  Copies a directory tree as hard links (no data is rewritten), falling back
+  to a copy where the filesystem has no hard links.
+  """
+  for root, _, files in os.walk(source):
+    target = os.path.join(destination, os.path.relpath(root, source))
+    os.makedirs(target, exist_ok=True)
+    for name in files:
+      try:
+        os.link(os.path.join(root, name), os.path.join(target, name))
+      except OSError:
+        shutil.copy2(os.path.join(root, name), os.path.join(target, name))
+
+def has_docstore(directory):
+  return os.path.exists(os.path.join(directory, DOCSTORE_DIR, "header.json"))
+
+def check_docstore(directory):
+  if not has_docstore(directory):
+    if os.path.exists(os.path.join(directory, "index.pkl")):
+      raise DocstoreFormatError(f"{directory} uses the pickled format; convert it with python -m src.vectorstore.convert_vectorstore {directory}")
+    raise FileNotFoundError(f"No vectorstore found in {directory}")
+
+def make_vector_store(embeddings, index, docstore, index_to_docstore_id, directory):
+  with warnings.catch_warnings():
+    warnings.filterwarnings("ignore", message="Normalizing L2 is not applicable")
+    return FAISS(
+      embedding_function=embeddings,
+      index=index,
+      docstore=docstore,
+      index_to_docstore_id=index_to_docstore_id,
+      **vector_store_kwargs(load_index_config(directory))
+    )
+
+def load_vector_store(directory, embeddings):
+  """
+  Loads a writable vectorstore (for ingest): the full index in memory and an
+  InMemoryDocstore keyed by chunk ID, so chunks can be added and deleted.
+  """
+  check_docstore(directory)
+  docs = ColumnarDocstore(os.path.join(directory, DOCSTORE_DIR)).documents()
+  index = faiss.read_index(os.path.join(directory, INDEX_FILE))
+  return make_vector_store(
+    embeddings,
+    index,
+    InMemoryDocstore({doc.id: doc for doc in docs}),
+    {row: doc.id for row, doc in enumerate(docs)},
+    directory
+  )
+
+def read_mmap_index(directory):
+  path = os.path.join(directory, MMAP_INDEX_FILE)
+  if not os.path.exists(path):
+    path = os.path.join(directory, INDEX_FILE)
+  return faiss.read_index(path, faiss.IO_FLAG_MMAP)
+
+def load_serving_store(directory, embeddings):
+  """
+  Loads the vectorstore for serving: memory-mapped index and columnar docstore
+  addressed by FAISS row. The result is read-only.
+  """
+  if has_catalog(directory):
+    return load_sharded_store(directory, embeddings)
+  check_docstore(directory)
+  docstore = ColumnarDocstore(os.path.join(directory, DOCSTORE_DIR))
+  return make_vector_store(embeddings, read_mmap_index(directory), docstore, RowIds(docstore.n_rows), directory)
+
+class RowIds(Mapping):
+  """
+  Read-only identity mapping FAISS row -> docstore key for the columnar
+  docstore (its keys are the rows themselves), without a per-row dict.
+  """
+
+  def __init__(self, n_rows):
+    self.n_rows = n_rows
+
+  def __getitem__(self, row):
+    if not isinstance(row, (int, np.integer)) or not 0 <= row < self.n_rows:
+      raise KeyError(row)
+    return int(row)
+
+  def __len__(self):
+    return self.n_rows
+
+  def __iter__(self):
+    return iter(range(self.n_rows))
+
+def replace_directory(tmp_path, directory):
+  # Swaps a freshly written directory in place of the old one
+  old_path = f"{directory}.old"
+  shutil.rmtree(old_path, ignore_errors=True)
+  if os.path.exists(directory):
+    os.replace(directory, old_path)
+  os.replace(tmp_path, directory)
+  shutil.rmtree(old_path, ignore_errors=True)
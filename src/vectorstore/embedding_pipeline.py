@@ -0,0 +1,206 @@
+import numpy as np
+import asyncio
+import hashlib
+import os
+import random
+import shutil
+import time
+
+class AdaptiveConcurrency:
+  """
+  AIMD limiter for in-flight embedding requests: grows by one slot after a run
+  of fast successes, halves on a rate limit (429) or a batch slower than the
+  latency target.
+  """
+
+  def __init__(self, initial=4, minimum=1, maximum=32, latency_target=10.0, increase_every=4):
+    self.limit = initial
+    self.minimum = minimum
+    self.maximum = maximum
+    self.latency_target = latency_target
+    self.increase_every = increase_every
+    self.in_flight = 0
+    self.successes = 0
+    self.condition = asyncio.Condition()
+
+  async def acquire(self):
+    async with self.condition:
+      await self.condition.wait_for(lambda: self.in_flight < self.limit)
+      self.in_flight += 1
+
+  async def release(self, rate_limited=False, latency=None):
+    async with self.condition:
+      self.in_flight -= 1
+      if rate_limited or (latency is not None and latency > self.latency_target):
+        self.limit = max(self.minimum, self.limit // 2)
+        self.successes = 0
+      elif latency is not None:
+        self.successes += 1
+        if self.successes >= self.increase_every:
+          self.limit = min(self.maximum, self.limit + 1)
+          self.successes = 0
+      self.condition.notify_all()
+
+def is_rate_limited(error):
+  status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+  return status_code == 429 or type(error).__name__ == "RateLimitError"
+
+def is_retryable(error):
+  status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+  if is_rate_limited(error) or (status_code is not None and status_code >= 500):
+    return True
+  return isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)) or type(error).__name__ in (
+    "APIConnectionError", "APITimeoutError", "InternalServerError"
+  )
+
+class EmbeddingPipeline:
+  """
+  Streams texts in size-bounded batches to a pool of async workers.
+  Concurrency adapts to 429s and latency, failed batches are retried with
+  jittered exponential backoff, and finished batches are checkpointed so an
+  interrupted build resumes where it stopped.
+  """
+
+  def __init__(self, embeddings, batch_size=256, max_batch_chars=200_000, max_concurrency=16,
+               initial_concurrency=4, latency_target=10.0, max_retries=6, base_backoff=1.0,
+               max_backoff=60.0, checkpoint_dir=None):
+    self.embeddings = embeddings
+    self.batch_size = batch_size
+    self.max_batch_chars = max_batch_chars
+    self.max_concurrency = max_concurrency
+    self.initial_concurrency = initial_concurrency
+    self.latency_target = latency_target
+    self.max_retries = max_retries
+    self.base_backoff = base_backoff
+    self.max_backoff = max_backoff
+    self.checkpoint_dir = checkpoint_dir
+    self.checkpoint_model = self.model_key(embeddings)
+    self.stats = {}
+
+  @staticmethod
+  def model_key(embeddings):
+    # Provider, model and (when set) dimension of the embedder, unwrapped from CachedEmbeddings
+    inner = getattr(embeddings, "embeddings", embeddings)
+    model = getattr(inner, "model", None) or getattr(inner, "model_name", None)
+    dim = getattr(inner, "dim", None) or getattr(inner, "dimensions", None)
+    return f"{type(inner).__name__}:{model}:{dim}"
+
+  def make_batches(self, texts):
+    """
+    Splits texts into batches bounded by item count and total characters.
+    """
+    batch, batch_chars = [], 0
+    for text in texts:
+      if batch and (len(batch) >= self.batch_size or batch_chars + len(text) > self.max_batch_chars):
+        yield batch
+        batch, batch_chars = [], 0
+      batch.append(text)
+      batch_chars += len(text)
+    if batch:
+      yield batch
+
+  # --- Checkpointing (one .npy per finished batch, keyed by the embedder and the batch content) ---
+
+  def checkpoint_path(self, batch):
+    # A rebuild with another provider or model never resumes from batches embedded by the old one
+    digest = hashlib.sha256("\x1f".join([self.checkpoint_model, *batch]).encode("utf-8")).hexdigest()
+    return os.path.join(self.checkpoint_dir, f"{digest}.npy")
+
+  def load_checkpoint(self, batch):
+    if self.checkpoint_dir is None:
+      return None
+    path = self.checkpoint_path(batch)
+    return np.load(path) if os.path.exists(path) else None
+
+  def save_checkpoint(self, batch, vectors):
+    if self.checkpoint_dir is None:
+      return
+    os.makedirs(self.checkpoint_dir, exist_ok=True)
+    path = self.checkpoint_path(batch)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+      np.save(f, np.asarray(vectors, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+  def clear_checkpoint(self):
+    if self.checkpoint_dir is not None:
+      shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+  # --- Workers ---
+
+  async def embed_batch(self, batch, limiter):
+    for attempt in range(self.max_retries + 1):
+      await limiter.acquire()
+      started = time.perf_counter()
+      try:
+        vectors = await self.embeddings.aembed_documents(batch)
+      except Exception as e:
+        rate_limited = is_rate_limited(e)
+        await limiter.release(rate_limited=rate_limited)
+        self.stats["rate_limited" if rate_limited else "errors"] += 1
+        if attempt == self.max_retries or not is_retryable(e):
+          raise
+        # Full jitter: sleep uniformly within the exponential backoff window
+        await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt)))
+        self.stats["retries"] += 1
+        continue
+      await limiter.release(latency=time.perf_counter() - started)
+      return vectors
+
+  async def worker(self, queue, results, limiter):
+    while True:
+      item = await queue.get()
+      if item is None:
+        queue.task_done()
+        return
+      batch_idx, batch = item
+      try:
+        vectors = await self.embed_batch(batch, limiter)
+        self.save_checkpoint(batch, vectors)
+        results[batch_idx] = vectors
+        self.stats["embedded_batches"] += 1
+      except Exception as e:
+        results[batch_idx] = e
+      finally:
+        queue.task_done()
+
+  async def arun(self, texts):
+    """
+    Embeds all texts and returns their vectors in input order.
+    """
+    self.stats = {"batches": 0, "resumed_batches": 0, "embedded_batches": 0, "retries": 0, "rate_limited": 0, "errors": 0}
+    started = time.perf_counter()
+    limiter = AdaptiveConcurrency(
+      initial=min(self.initial_concurrency, self.max_concurrency),
+      maximum=self.max_concurrency,
+      latency_target=self.latency_target
+    )
+    queue = asyncio.Queue(maxsize=self.max_concurrency * 2)
+    results = {}
+    workers = [asyncio.create_task(self.worker(queue, results, limiter)) for _ in range(self.max_concurrency)]
+
+    batches = []
+    for batch_idx, batch in enumerate(self.make_batches(texts)):
+      batches.append(batch)
+      checkpointed = self.load_checkpoint(batch)
+      if checkpointed is not None:
+        results[batch_idx] = checkpointed.tolist()
+        self.stats["resumed_batches"] += 1
+      else:
+        await queue.put((batch_idx, batch))
+    for _ in workers:
+      await queue.put(None)
+    await asyncio.gather(*workers)
+
+    self.stats["batches"] = len(batches)
+    self.stats["final_concurrency"] = limiter.limit
+    self.stats["seconds"] = time.perf_counter() - started
+    vectors = []
+    for batch_idx in range(len(batches)):
+      if isinstance(results[batch_idx], Exception):
+        raise results[batch_idx]
+      vectors.extend(results[batch_idx])
+    return vectors
+
+  def run(self, texts):
+    return asyncio.run(self.arun(texts))
@@ -0,0 +1,251 @@
+from concurrent.futures import ThreadPoolExecutor
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from typing import NamedTuple
+import numpy as np
+import faiss
+import json
+import math
+import os
+import re
+import warnings
+
+from src.utils.config import INDEX_TYPE, INDEX_METRIC, HNSW_M, HNSW_EF_SEARCH, IVF_NLIST, IVF_NPROBE, PQ_M, SHARD_BY, SHARD_SEARCH_THREADS
+
+INDEX_TYPES = ("flat", "hnsw", "ivf-flat", "ivf-pq")
+SHARD_BY_CHOICES = ("family", "patch", "none")
+INDEX_CONFIG_FILE = "index_config.json"
+
+class IndexConfig(NamedTuple):
+  """
+  Vector index settings. metric "ip" stores L2-normalized vectors and ranks by
+  inner product (cosine); nlist/pq_m of 0 are derived from the corpus size/dimension.
+  shard_by splits the vectorstore into one index per patch family, per patch or not at all.
+  """
+  index_type: str = INDEX_TYPE
+  metric: str = INDEX_METRIC
+  hnsw_m: int = HNSW_M
+  ef_search: int = HNSW_EF_SEARCH
+  nlist: int = IVF_NLIST
+  nprobe: int = IVF_NPROBE
+  pq_m: int = PQ_M
+  shard_by: str = SHARD_BY
+
+def faiss_metric(config):
+  return faiss.METRIC_INNER_PRODUCT if config.metric == "ip" else faiss.METRIC_L2
+
+def default_nlist(n_vectors):
+  # ~4 * sqrt(n) lists, keeping at least 39 training points per centroid (faiss' minimum)
+  return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+def default_pq_m(dim):
+  # Largest sub-quantizer count <= dim / 16 that divides dim (1536-d -> 96 bytes per vector)
+  return max(m for m in range(1, max(dim // 16, 1) + 1) if dim % m == 0)
+
+def make_index(config, dim, n_train):
+  """
+  Creates an empty (untrained) index for the configuration.
+  Falls back to a simpler type when there are too few training vectors.
+  """
+  if config.index_type not in INDEX_TYPES:
+    raise ValueError(f"Unknown index type {config.index_type!r}, expected one of {INDEX_TYPES}")
+  metric = faiss_metric(config)
+  index_type = config.index_type
+  if index_type == "ivf-pq" and n_train < 256:
+    print(f"IVF-PQ needs at least 256 training vectors (got {n_train}), using IVF-Flat")
+    index_type = "ivf-flat"
+  if index_type == "ivf-flat" and n_train < 39:
+    print(f"IVF needs at least 39 training vectors (got {n_train}), using Flat")
+    index_type = "flat"
+
+  if index_type == "flat":
+    return faiss.IndexFlat(dim, metric)
+  if index_type == "hnsw":
+    index = faiss.IndexHNSWFlat(dim, config.hnsw_m, metric)
+    index.hnsw.efSearch = config.ef_search
+    return index
+
+  nlist = min(config.nlist or default_nlist(n_train), n_train)
+  quantizer = faiss.IndexFlat(dim, metric)
+  if index_type == "ivf-flat":
+    index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+  else:
+    index = faiss.IndexIVFPQ(quantizer, dim, nlist, config.pq_m or default_pq_m(dim), 8, metric)
+  index.nprobe = min(config.nprobe, nlist)
+  return index
+
+def build_index(config, vectors):
+  """
+  Creates the index and trains it on the given vectors (training happens at
+  build time; the vectors themselves are added by the caller).
+  """
+  vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+  if config.metric == "ip":
+    vectors = vectors.copy()
+    faiss.normalize_L2(vectors)
+  index = make_index(config, vectors.shape[1], len(vectors))
+  if not index.is_trained:
+    index.train(vectors)
+  return index
+
+def shard_name(patch_version, shard_by=SHARD_BY):
+  """
+  Shard holding a patch: its family ("7.37b" -> "7.3x"), its numbered patch
+  with the letter patches ("7.37b" -> "7.37") or "all".
+  """
+  if shard_by not in SHARD_BY_CHOICES:
+    raise ValueError(f"Unknown shard_by {shard_by!r}, expected one of {SHARD_BY_CHOICES}")
+  match = re.match(r"(\d+)\.(\d+)", patch_version)
+  if shard_by == "none" or match is None:
+    return "all"
+  if shard_by == "patch":
+    return match.group(0)
+  return f"{match.group(1)}.{match.group(2)[0]}x"
+
+def search_params(index, selector, k):
+  # HNSW and IVF only accept their own parameter types; keep the index's configured effort
+  if isinstance(index, faiss.IndexHNSW):
+    return faiss.SearchParametersHNSW(sel=selector, efSearch=max(index.hnsw.efSearch, k))
+  if isinstance(index, faiss.IndexIVF):
+    return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+  return faiss.SearchParameters(sel=selector)
+
+def is_flat_like(index):
+  # Exhaustive indexes: IndexFlat, and the one-list IVF-Flat a Flat index is served as (disk_store.to_mmap_index)
+  return isinstance(index, faiss.IndexFlat) or (isinstance(index, faiss.IndexIVFFlat) and index.nlist == 1)
+
+def flat_rows(index, ids):
+  """
+  Vectors of the given rows of a flat-like index, read without touching the
+  other rows. The one-list IVF-Flat holds the raw vectors in row order (they
+  are added in order to an empty index), read as a view of the mapped list.
+  """
+  if isinstance(index, faiss.IndexFlat):
+    return index.reconstruct_batch(ids)
+  invlists = index.invlists
+  n_rows = invlists.list_size(0)
+  if n_rows != index.ntotal:
+    raise ValueError(f"Inverted list holds {n_rows} of {index.ntotal} rows")
+  codes = invlists.get_codes(0)
+  try:
+    vectors = faiss.rev_swig_ptr(codes, n_rows * invlists.code_size).view(np.float32).reshape(n_rows, index.d)
+    return vectors[ids]
+  finally:
+    invlists.release_codes(0, codes)
+
+def search_index(index, vectors, ids, k):
+  """
+  Top-k of one FAISS index over all rows (ids is None) or over the given row
+  IDs. Flat and memory-mapped Flat indexes are searched as a per-subset
+  sub-index so the cost follows the subset size; other index types use an
+  IDSelector over the full index.
+  Returns:
+      tuple: (distances, rows) as from index.search (-1 rows past the results).
+  """
+  if ids is None:
+    return index.search(vectors, min(k, index.ntotal))
+  k = min(k, len(ids))
+  if is_flat_like(index):
+    subset = flat_rows(index, ids)
+    distances, positions = faiss.knn(vectors, subset, k, metric=index.metric_type)
+    rows = np.where(positions >= 0, ids[np.clip(positions, 0, None)], -1)
+    return distances, rows
+  return index.search(vectors, k, params=search_params(index, faiss.IDSelectorBatch(ids), k))
+
+class ShardedIndex:
+  """
+  The shards of a sharded vectorstore searched as one index: global row =
+  shard offset + row in the shard. A search goes only to the shards holding
+  candidate rows (a patch filter's rows all sit in its family's shard), in
+  parallel on a thread pool (FAISS releases the GIL), and the per-shard top-k
+  lists are merged.
+  """
+
+  def __init__(self, names, indexes, threads=SHARD_SEARCH_THREADS):
+    self.names = names
+    self.shards = indexes
+    self.offsets = np.zeros(len(indexes) + 1, dtype=np.int64)
+    np.cumsum([index.ntotal for index in indexes], out=self.offsets[1:])
+    self.ntotal = int(self.offsets[-1])
+    self.d = indexes[0].d
+    self.metric_type = indexes[0].metric_type
+    self.executor = ThreadPoolExecutor(max_workers=max(1, min(len(indexes), threads or os.cpu_count() or 1)), thread_name_prefix="shard")
+
+  def route(self, ids):
+    """
+    The shards to search, with their candidate rows as rows of the shard (None: all of them).
+    Args:
+        ids (np.ndarray | None): Ascending global row IDs, as MetadataStore.select returns them.
+    Returns:
+        list: (shard position, shard row IDs or None) pairs.
+    """
+    if ids is None:
+      return [(shard, None) for shard, index in enumerate(self.shards) if index.ntotal]
+    bounds = np.searchsorted(ids, self.offsets)
+    return [
+      (shard, ids[bounds[shard]:bounds[shard + 1]] - self.offsets[shard])
+      for shard in range(len(self.shards)) if bounds[shard + 1] > bounds[shard]
+    ]
+
+  def search_rows(self, vectors, ids, k):
+    """
+    search_index() across the shards: top-k over all rows (ids is None) or the given global row IDs.
+    Returns:
+        tuple: (distances, global rows), closest first.
+    """
+    routed = self.route(ids)
+    if not routed:
+      return np.zeros((len(vectors), 0), dtype=np.float32), np.zeros((len(vectors), 0), dtype=np.int64)
+    if len(routed) == 1:
+      results = [search_index(self.shards[routed[0][0]], vectors, routed[0][1], k)]
+    else:
+      futures = [self.executor.submit(search_index, self.shards[shard], vectors, shard_ids, k) for shard, shard_ids in routed]
+      results = [future.result() for future in futures]
+    distances = np.concatenate([shard_distances for shard_distances, _ in results], axis=1)
+    rows = np.concatenate([
+      np.where(shard_rows >= 0, shard_rows + self.offsets[shard], -1) for (shard, _), (_, shard_rows) in zip(routed, results)
+    ], axis=1)
+    # Merge: closest first (largest inner product / smallest L2 distance), missing results last
+    keys = -distances if self.metric_type == faiss.METRIC_INNER_PRODUCT else distances.copy()
+    keys[rows < 0] = np.inf
+    order = np.argsort(keys, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+  def search(self, vectors, k):
+    return self.search_rows(vectors, None, k)
+
+def supports_delete(vector_store):
+  # Only flat indexes renumber rows on remove_ids, as the LangChain wrapper assumes; HNSW can't remove at all.
+  # The serving docstores (disk_store.ReadOnlyDocstore) refuse deletes too.
+  return isinstance(vector_store.index, faiss.IndexFlat) and not getattr(vector_store.docstore, "read_only", False)
+
+def vector_store_kwargs(config):
+  # LangChain warns about normalize_L2 with inner product, but normalizing is exactly what cosine ranking needs
+  if config.metric == "ip":
+    return {"normalize_L2": True, "distance_strategy": DistanceStrategy.MAX_INNER_PRODUCT}
+  return {"distance_strategy": DistanceStrategy.EUCLIDEAN_DISTANCE}
+
+def new_vector_store(embeddings, vectors, config=IndexConfig()):
+  index = build_index(config, vectors)
+  with warnings.catch_warnings():
+    warnings.filterwarnings("ignore", message="Normalizing L2 is not applicable")
+    return FAISS(
+      embedding_function=embeddings,
+      index=index,
+      docstore=InMemoryDocstore(),
+      index_to_docstore_id={},
+      **vector_store_kwargs(config)
+    )
+
+def save_index_config(config, vectorstore_path):
+  with open(os.path.join(vectorstore_path, INDEX_CONFIG_FILE), "w", encoding="utf-8") as f:
+    json.dump(config._asdict(), f)
+
+def load_index_config(vectorstore_path):
+  # Vectorstores saved before the index became configurable are Flat L2
+  path = os.path.join(vectorstore_path, INDEX_CONFIG_FILE)
+  if not os.path.exists(path):
+    return IndexConfig(index_type="flat", metric="l2")
+  with open(path, "r", encoding="utf-8") as f:
+    return IndexConfig(**json.load(f))
@@ -84,10 +84,6 @@ if ($latestPatch -in $currentPatches) {
     & $pythonCmd -m src.init_setup.fetch_mappers
     Write-Host "Mappers fetched!" -ForegroundColor Green
 
-    Write-Host "Modifying patch notes..." -ForegroundColor Yellow
-    & $pythonCmd -m src.init_setup.modify_patch_notes
-    Write-Host "Patch notes modified!" -ForegroundColor Green
-
     Write-Host "Updating vector store..." -ForegroundColor Yellow
     & $pythonCmd -m src.vectorstore.add_to_vectorstore
     Write-Host "Vector store updated!" -ForegroundColor Green